@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# Throughput of CloudStackClient against a local stub API server.
+# Usage: python benchmarks/cloudstack_client_bench.py [--calls 1000] [--workers 16]
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from managers.cloudstack_client import CloudStackClient
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    latency = 0.005
+
+    def do_GET(self):
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        command = params.get('command', '')
+        time.sleep(self.latency)
+        if command == 'listVirtualMachines':
+            body = {'count': 1, 'virtualmachine': [{'id': '1', 'name': 'vm-1', 'state': 'Running'}]}
+        elif command == 'deployVirtualMachine':
+            body = {'id': params.get('name'), 'jobid': f"job-{params.get('name')}"}
+        else:
+            body = {}
+        payload = json.dumps({f"{command.lower()}response": body}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_sequential(endpoint, calls):
+    # Baseline: one request at a time, new connection per call
+    client = CloudStackClient(endpoint, 'key', 'secret', max_workers=1)
+    client.session.close()
+    start = time.perf_counter()
+    for i in range(calls):
+        with requests.Session() as session:
+            client.session = session
+            if i % 2:
+                client.listVirtualMachines()
+            else:
+                client.deployVirtualMachine(name=f"vm-{i}", serviceofferingid='so', templateid='t', zoneid='z')
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed
+
+
+def run_pooled(endpoint, calls, workers):
+    client = CloudStackClient(endpoint, 'key', 'secret', max_workers=workers)
+    half = calls // 2
+    start = time.perf_counter()
+    client.map('listVirtualMachines', [{} for _ in range(calls - half)])
+    client.map('deployVirtualMachine', [
+        {'name': f"vm-{i}", 'serviceofferingid': 'so', 'templateid': 't', 'zoneid': 'z'} for i in range(half)
+    ])
+    elapsed = time.perf_counter() - start
+    client.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='CloudStack client throughput benchmark')
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.005, help='Stub server latency per call in seconds')
+    args = parser.parse_args()
+
+    StubHandler.latency = args.latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}/client/api"
+
+    sequential = run_sequential(endpoint, args.calls)
+    pooled = run_pooled(endpoint, args.calls, args.workers)
+    server.shutdown()
+
+    print(f"sequential: {args.calls} calls in {sequential:.2f}s ({args.calls / sequential:.0f} calls/s)")
+    print(f"pooled x{args.workers}: {args.calls} calls in {pooled:.2f}s ({args.calls / pooled:.0f} calls/s)")
+    print(f"speedup: {sequential / pooled:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# REST call count of StorageManager.list_host_lun_mappings against a mock FlashArray.
+# Usage: python benchmarks/purestorage_mappings_bench.py [--hosts 600] [--volumes-per-host 8]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from managers.purestorage_manager import StorageManager
+
+
+class MockFlashArray:
+    def __init__(self, hosts, volumes_per_host, latency):
+        self.calls = 0
+        self.latency = latency
+        self.connections = [
+            {"name": f"host-{h}", "vol": f"vol-{h}-{v}", "lun": v + 1, "hgroup": None}
+            for h in range(hosts)
+            for v in range(volumes_per_host)
+        ]
+        self.hosts = [{"name": f"host-{h}", "iqn": [], "wwn": []} for h in range(hosts)]
+
+    def request(self):
+        self.calls += 1
+        time.sleep(self.latency)
+
+    def list_hosts(self, connect=False):
+        self.request()
+        return list(self.connections) if connect else list(self.hosts)
+
+    def list_host_connections(self, host_name):
+        self.request()
+        return [c for c in self.connections if c["name"] == host_name]
+
+
+def per_host_mappings(array):
+    # Previous implementation: one listing plus one connections call per host
+    mappings = []
+    for host in array.list_hosts():
+        for volume in array.list_host_connections(host["name"]):
+            mappings.append({"Host": host["name"], "Volume": volume["vol"], "LUN": volume["lun"]})
+    return mappings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Host-LUN mapping call count benchmark')
+    parser.add_argument('--hosts', type=int, default=600)
+    parser.add_argument('--volumes-per-host', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.002, help='Simulated REST latency per call in seconds')
+    args = parser.parse_args()
+
+    array = MockFlashArray(args.hosts, args.volumes_per_host, args.latency)
+    start = time.perf_counter()
+    before = per_host_mappings(array)
+    per_host_time = time.perf_counter() - start
+    per_host_calls = array.calls
+
+    manager = StorageManager.__new__(StorageManager)
+    manager.arrays = {"mock": array}
+    array.calls = 0
+    start = time.perf_counter()
+    after = list(manager.iter_host_lun_mappings("mock"))
+    bulk_time = time.perf_counter() - start
+
+    assert sorted(map(str, before)) == sorted(map(str, after))
+    print(f"per-host: {per_host_calls} REST calls, {per_host_time:.2f}s")
+    print(f"bulk: {array.calls} REST calls, {bulk_time:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,29 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
 import ssl
 import socket
+import sys
 import datetime
 import urllib.parse
+import yaml
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import hashes
 
-def get_ssl_info(hostname, port=443):
+def create_context():
     context = ssl.create_default_context()
     context.check_hostname = False
     context.verify_mode = ssl.CERT_NONE
+    return context
 
-    with socket.create_connection((hostname, port)) as sock:
+def get_ssl_info(hostname, port=443, timeout=10):
+    context = create_context()
+
+    with socket.create_connection((hostname, port), timeout=timeout) as sock:
         with context.wrap_socket(sock, server_hostname=hostname) as secure_sock:
             der_cert = secure_sock.getpeercert(binary_form=True)
             cert = x509.load_der_x509_certificate(der_cert, default_backend())
@@ -26,14 +38,14 @@ def get_signature_algorithm_name(cert):
 def get_certificate_hash(cert):
     return cert.fingerprint(hashes.SHA256()).hex()
 
+def parse_endpoint(value):
+    if "://" not in value:
+        value = f"https://{value}"
+    parsed_url = urllib.parse.urlparse(value)
+    return parsed_url.hostname, parsed_url.port or 443
+
 def check_ssl_certificate(url):
-    parsed_url = urllib.parse.urlparse(url)
-    hostname = parsed_url.netloc
-    if ':' in hostname:
-        hostname, port = hostname.split(':')
-        port = int(port)
-    else:
-        port = 443
+    hostname, port = parse_endpoint(url)
 
     try:
         cert = get_ssl_info(hostname, port)
@@ -57,6 +69,220 @@ def check_ssl_certificate(url):
     except Exception as e:
         print(f"Error checking SSL certificate for {url}: {str(e)}")
 
+# Parsed certificate details keyed by SHA256 fingerprint; endpoints behind the same
+# certificate (load balancers, wildcard certs) are only parsed once
+certificate_cache = {}
+
+def describe_certificate(der_cert):
+    fingerprint = hashlib.sha256(der_cert).hexdigest()
+    info = certificate_cache.get(fingerprint)
+    if info is None:
+        cert = x509.load_der_x509_certificate(der_cert, default_backend())
+        info = {
+            "fingerprint": fingerprint,
+            "not_valid_after": cert.not_valid_after.isoformat(),
+            "issuer": cert.issuer.rfc4514_string(),
+            "subject": cert.subject.rfc4514_string(),
+            "self_signed": is_self_signed(cert),
+            "signature_algorithm": get_signature_algorithm_name(cert),
+            "serial_number": str(cert.serial_number)
+        }
+        certificate_cache[fingerprint] = info
+    return info
+
+def load_site_endpoints(config_path):
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f) or {}
+
+    endpoints = set()
+
+    def walk(node):
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key in ("host", "api_url", "base_url") and isinstance(value, str):
+                    endpoints.add(parse_endpoint(value))
+                else:
+                    walk(value)
+        elif isinstance(node, list):
+            for item in node:
+                walk(item)
+
+    walk(config.get('sites', {}))
+    return endpoints
+
+def load_host_list(path):
+    with open(path, 'r') as f:
+        return {parse_endpoint(line.strip()) for line in f if line.strip() and not line.startswith("#")}
+
+async def fetch_certificate(hostname, port, context, timeout):
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(hostname, port, ssl=context, server_hostname=hostname), timeout)
+    try:
+        return writer.get_extra_info("ssl_object").getpeercert(binary_form=True)
+    finally:
+        writer.close()
+
+async def scan_endpoint(hostname, port, context, semaphore, timeout, now):
+    result = {"host": hostname, "port": port}
+    async with semaphore:
+        try:
+            der_cert = await fetch_certificate(hostname, port, context, timeout)
+        except Exception as e:
+            result["error"] = str(e) or type(e).__name__
+            return result
+    result.update(describe_certificate(der_cert))
+    expiry_date = datetime.datetime.fromisoformat(result["not_valid_after"])
+    result["remaining_days"] = (expiry_date - now).days
+    return result
+
+async def scan_endpoints(endpoints, concurrency=200, timeout=5):
+    context = create_context()
+    semaphore = asyncio.Semaphore(concurrency)
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    tasks = [scan_endpoint(hostname, port, context, semaphore, timeout, now) for hostname, port in sorted(endpoints)]
+    return await asyncio.gather(*tasks)
+
+# Re-check scheduling: certificates close to expiry are likely to be rotated soon and are
+# checked every run; others wait a fraction of their remaining validity, capped by how
+# often the endpoint has been seen to rotate
+RECHECK_FRACTION = 0.25
+MIN_RECHECK_DAYS = 1
+MAX_RECHECK_DAYS = 30
+EXPIRY_WATCH_DAYS = 30
+# Lets a daily cron that starts a little earlier than yesterday still pick up endpoints due today
+SCHEDULE_SLACK = datetime.timedelta(hours=1)
+
+def endpoint_key(hostname, port):
+    return f"{hostname}:{port}"
+
+def load_state(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def recheck_days(entry, now):
+    # Failed scans keep the last known certificate for the report only and are retried soon
+    if "error" in entry or "fingerprint" not in entry:
+        return MIN_RECHECK_DAYS
+    remaining_days = (datetime.datetime.fromisoformat(entry["not_valid_after"]) - now).days
+    if remaining_days <= EXPIRY_WATCH_DAYS:
+        return MIN_RECHECK_DAYS
+    days = min(MAX_RECHECK_DAYS, remaining_days * RECHECK_FRACTION)
+    if entry.get("rotation_days"):
+        days = min(days, entry["rotation_days"] * RECHECK_FRACTION)
+    return max(MIN_RECHECK_DAYS, days)
+
+def due_endpoints(endpoints, state, now):
+    due = set()
+    for hostname, port in endpoints:
+        entry = state.get(endpoint_key(hostname, port))
+        if not entry or datetime.datetime.fromisoformat(entry["next_check"]) <= now + SCHEDULE_SLACK:
+            due.add((hostname, port))
+    return due
+
+def update_state(state, results, now):
+    rotated_fingerprints = set()
+    for result in results:
+        key = endpoint_key(result["host"], result["port"])
+        previous = state.get(key, {})
+        entry = dict(result, last_checked=now.isoformat())
+        entry["rotated"] = False
+        if "fingerprint" not in result:
+            # Keep the last known certificate so the report still shows it
+            for field in ("fingerprint", "not_valid_after", "subject", "issuer", "last_changed", "rotation_days"):
+                if field in previous:
+                    entry[field] = previous[field]
+        elif previous.get("fingerprint") != result["fingerprint"]:
+            entry["last_changed"] = now.isoformat()
+            if previous.get("fingerprint"):
+                entry["rotated"] = True
+                rotated_fingerprints.add(previous["fingerprint"])
+                if previous.get("last_changed"):
+                    elapsed = (now - datetime.datetime.fromisoformat(previous["last_changed"])).days
+                    entry["rotation_days"] = max(MIN_RECHECK_DAYS, elapsed)
+        else:
+            for field in ("last_changed", "rotation_days"):
+                if field in previous:
+                    entry[field] = previous[field]
+        entry["next_check"] = (now + datetime.timedelta(days=recheck_days(entry, now))).isoformat()
+        state[key] = entry
+
+    # A certificate rotated on one endpoint is probably being rolled out to the others sharing it
+    checked = {endpoint_key(r["host"], r["port"]) for r in results}
+    for key, entry in state.items():
+        if key not in checked and entry.get("fingerprint") in rotated_fingerprints:
+            entry["next_check"] = now.isoformat()
+    return state
+
+def state_results(endpoints, state, now):
+    results = []
+    for hostname, port in endpoints:
+        entry = dict(state[endpoint_key(hostname, port)])
+        if "not_valid_after" in entry:
+            entry["remaining_days"] = (datetime.datetime.fromisoformat(entry["not_valid_after"]) - now).days
+        results.append(entry)
+    return results
+
+REPORT_FIELDS = ["host", "port", "remaining_days", "not_valid_after", "self_signed", "subject", "issuer",
+                 "signature_algorithm", "serial_number", "fingerprint", "error", "rotated", "last_checked", "next_check"]
+
+def write_report(results, output_format, output):
+    results = sorted(results, key=lambda r: (r.get("remaining_days") is None, r.get("remaining_days")))
+    if output_format == "json":
+        json.dump(results, output, indent=2)
+        output.write("\n")
+    else:
+        writer = csv.DictWriter(output, fieldnames=REPORT_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+
+def main():
+    parser = argparse.ArgumentParser(description='SSL certificate expiry checker')
+    parser.add_argument('url', nargs='?', default="https://fatihsolen.com", help='URL to check in single mode')
+    parser.add_argument('--scan', action='store_true', help='Scan every endpoint in the site config plus any host lists')
+    parser.add_argument('--config', default="configs/sites.yaml", help='Site configuration file')
+    parser.add_argument('--hosts', nargs='+', default=[], help='Files with extra host[:port] or URL entries, one per line')
+    parser.add_argument('--timeout', type=float, default=5, help='Per-host connect and handshake timeout in seconds')
+    parser.add_argument('--concurrency', type=int, default=200, help='Maximum concurrent handshakes')
+    parser.add_argument('--format', choices=['json', 'csv'], default='json', help='Report format')
+    parser.add_argument('--output', help='Report file, defaults to stdout')
+    parser.add_argument('--state', help='Scan state file; only endpoints due for a re-check are contacted')
+    parser.add_argument('--full', action='store_true', help='Re-check every endpoint even if a state file is used')
+    args = parser.parse_args()
+
+    if not args.scan:
+        check_ssl_certificate(args.url)
+        return
+
+    endpoints = load_site_endpoints(args.config)
+    for path in args.hosts:
+        endpoints |= load_host_list(path)
+
+    if args.state:
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        state = load_state(args.state)
+        due = endpoints if args.full else due_endpoints(endpoints, state, now)
+        scanned = asyncio.run(scan_endpoints(due, args.concurrency, args.timeout))
+        save_state(args.state, update_state(state, scanned, now))
+        print(f"Checked {len(due)} of {len(endpoints)} endpoints", file=sys.stderr)
+        results = state_results(endpoints, state, now)
+    else:
+        results = asyncio.run(scan_endpoints(endpoints, args.concurrency, args.timeout))
+
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            write_report(results, args.format, f)
+    else:
+        write_report(results, args.format, sys.stdout)
+
 if __name__ == "__main__":
-    url_to_check = "https://fatihsolen.com"
-    check_ssl_certificate(url_to_check)
+    main()
@@ -1,4 +1,5 @@
 import argparse
+import itertools
 import os
 import yaml
 import logging
@@ -8,18 +9,22 @@ from managers.vmware_manager import VMManager
 from managers.purestorage_manager import StorageManager
 from managers.harvester_manager import HarvesterManager
 from managers.cloudstack_manager import CloudStackManager
+from managers.hypervisor import VMRecord
+from managers.inventory import DEFAULT_INVENTORY_DB, Inventory
+from managers.phpipam_manager import PhpIpamManager
+from managers.reconcile import ISSUES, reconcile
+from managers.vm_profile_manager import ProfileError, expand_profile, get_registry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def load_profile(profile_name):
-    profile_path = os.path.join("vm_profiles", f"{profile_name}.yaml")
-    if not os.path.exists(profile_path):
-        logger.error(f"Profile {profile_name} not found at {profile_path}")
+    try:
+        return get_registry("vm_profiles").load(profile_name)
+    except ProfileError as e:
+        logger.error(str(e))
         return None
-    with open(profile_path, 'r') as f:
-        return yaml.safe_load(f)
 
 def load_config():
     config_path = os.path.join("configs", "sites.yaml")
@@ -52,6 +57,27 @@ def get_manager(site, service_type, host_name):
         return DNSManager(site_config)
     return None
 
+def get_storage_manager(site):
+    config = load_config()
+    if not config:
+        return None
+    return StorageManager(config['sites'][site])
+
+def load_spec(spec_path):
+    if not os.path.exists(spec_path):
+        logger.error(f"Spec file not found at {spec_path}")
+        return None
+    with open(spec_path, 'r') as f:
+        return yaml.safe_load(f)
+
+def load_vm_names(names_path):
+    # One VM name per line; blank lines and # comments are ignored
+    if not os.path.exists(names_path):
+        logger.error(f"VM list file not found at {names_path}")
+        return None
+    with open(names_path, 'r') as f:
+        return [line.split('#', 1)[0].strip() for line in f if line.split('#', 1)[0].strip()]
+
 def list_sites():
     config = load_config()
     if not config:
@@ -70,8 +96,59 @@ def list_profiles():
     if not os.path.exists(profiles_path):
         logger.error(f"Profiles directory not found at {profiles_path}")
         return None
-    profiles = [f.replace('.yaml', '') for f in os.listdir(profiles_path) if f.endswith('.yaml')]
-    return profiles
+    return get_registry(profiles_path).names()
+
+def inventory_jobs(site, backends):
+    # One fetch per endpoint; each returns {table: rows} in the column order of managers.inventory.TABLES
+    config = load_config()
+    if not config:
+        return []
+    site_config = config['sites'][site]
+    jobs = []
+
+    def vms(host):
+        def fetch():
+            manager = get_manager(site, 'hypervisors', host)
+            if not manager:
+                raise ValueError(f"No hypervisor manager for {host}")
+            # VMware list_vms logs and yields nothing without a session
+            if manager.backend == 'vmware' and not manager.service_instance:
+                raise ConnectionError(f"Not connected to {host}")
+            return {'vms': ((vm.name, vm.backend, vm.uid, vm.vcpu, vm.memory_mb, vm.disk_gb, vm.state, vm.host, vm.ip_address) for vm in manager.list_vms())}
+        return fetch
+
+    def array(storage_manager, array_name):
+        def fetch():
+            return {
+                'volumes': ((v['Volume'], v['Serial'], v['Size']) for v in storage_manager.iter_volumes(array_name)),
+                'lun_mappings': ((m['Host'], m['Volume'], m['LUN']) for m in storage_manager.iter_host_lun_mappings(array_name))
+            }
+        return fetch
+
+    def zone(dns_manager, domain):
+        def fetch():
+            return {'dns_records': ((r['Name'], r['Type'], r['Value'], r['Ttl']) for r in dns_manager.iter_dns_records(domain))}
+        return fetch
+
+    def ipam():
+        return {'ip_addresses': ((a['ip'], a['subnet'], a['hostname'], a['description'], a['mac']) for a in PhpIpamManager(site_config).iter_addresses())}
+
+    if 'hypervisors' in backends:
+        for service in site_config.get('hypervisors', []):
+            jobs.append((service['type'], service['host'], vms(service['host'])))
+    if 'storage' in backends and site_config.get('storage'):
+        # Arrays and zones are only known once the manager has loaded them
+        storage_manager = StorageManager(site_config)
+        for array_name in storage_manager.arrays.keys():
+            jobs.append(('purefa', array_name, array(storage_manager, array_name)))
+    if 'dns' in backends and site_config.get('dns'):
+        dns_manager = DNSManager(site_config)
+        for domain in dns_manager.dns_servers:
+            jobs.append(('msdns', domain, zone(dns_manager, domain)))
+    if 'ipam' in backends:
+        for service in site_config.get('ipam', []):
+            jobs.append((service['type'], service['host'], ipam))
+    return jobs
 
 def main():
     parser = argparse.ArgumentParser(description='Unified DNS, VM, and Storage Management Tool')
@@ -132,6 +209,7 @@ def main():
     create_parser.add_argument('profile_name', help='Name of the profile to create VM')
     create_parser.add_argument('site', help='Name of the site')
     create_parser.add_argument('hypervisor_name', help='Name of the hypervisor')
+    create_parser.add_argument('--limit', type=int, help='Only create the first N VMs of a matrix/count profile')
 
     # VM Delete Command
     delete_parser = vm_subparsers.add_parser('delete', help='Delete VM')
@@ -150,6 +228,66 @@ def main():
     snapshot_parser.add_argument('site', help='Name of the site')
     snapshot_parser.add_argument('hypervisor_name', help='Name of the hypervisor')
 
+    # VM Snapshot Group Command
+    vm_snapshot_group_parser = vm_subparsers.add_parser('snapshot_group', help='Snapshot many VMs concurrently, prune old snapshots and consolidate disks (VMware)')
+    vm_snapshot_group_parser.add_argument('site', help='Name of the site')
+    vm_snapshot_group_parser.add_argument('hypervisor_name', help='Name of the hypervisor')
+    vm_snapshot_source = vm_snapshot_group_parser.add_mutually_exclusive_group(required=True)
+    vm_snapshot_source.add_argument('--vms', nargs='+', help='Names of the VMs to snapshot')
+    vm_snapshot_source.add_argument('--folder', help='Snapshot every VM in this folder')
+    vm_snapshot_source.add_argument('--pattern', help='Regular expression matched against VM names, e.g. "^db0[1-4]-"')
+    vm_snapshot_group_parser.add_argument('--prefix', default='fscli', help='Snapshot name prefix, also used to select snapshots for pruning')
+    vm_snapshot_group_parser.add_argument('--retention', help='Remove snapshots with this prefix older than e.g. 12h, 7d')
+    vm_snapshot_group_parser.add_argument('--consolidate', action='store_true', help='Consolidate disks on VMs that need it')
+    vm_snapshot_group_parser.add_argument('--memory', action='store_true', help='Include VM memory in the snapshot')
+    vm_snapshot_group_parser.add_argument('--quiesce', action='store_true', help='Quiesce the guest file system before snapshotting')
+    vm_snapshot_group_parser.add_argument('--prune-only', action='store_true', help='Only prune and consolidate, do not take new snapshots')
+
+    # VM Stats Command
+    vm_stats_parser = vm_subparsers.add_parser('stats', help='Show top VMs by CPU ready, ballooning, disk latency and other counters (VMware)')
+    vm_stats_parser.add_argument('site', help='Name of the site')
+    vm_stats_parser.add_argument('hypervisor_name', help='Name of the hypervisor')
+    vm_stats_source = vm_stats_parser.add_mutually_exclusive_group()
+    vm_stats_source.add_argument('--vms', nargs='+', help='Names of the VMs to report on')
+    vm_stats_source.add_argument('--folder', help='Report on every VM in this folder')
+    vm_stats_source.add_argument('--pattern', help='Regular expression matched against VM names')
+    vm_stats_parser.add_argument('--counters', nargs='+', help='Counters as group.name.rollup, default cpu.ready.summation cpu.usage.average mem.vmmemctl.average disk.maxTotalLatency.latest')
+    vm_stats_parser.add_argument('--interval', choices=['realtime', '5m', '30m', '2h', '1d'], default='realtime', help='Sampling interval to query')
+    vm_stats_parser.add_argument('--window', default='1h', help='How far back to query, e.g. 1h, 24h, 7d')
+    vm_stats_parser.add_argument('--top', type=int, default=20, help='Only show the top N VMs by the first counter')
+
+    # VM Datastores Command
+    datastores_parser = vm_subparsers.add_parser('datastores', help='Show the FlashArray volume behind each datastore with its array-side performance (VMware)')
+    datastores_parser.add_argument('site', help='Name of the site')
+    datastores_parser.add_argument('hypervisor_name', help='Name of the hypervisor')
+    datastores_parser.add_argument('--refresh', action='store_true', help='Rebuild the cached datastore to volume mapping')
+    datastores_parser.add_argument('--collect', action='store_true', help='Fetch fresh metrics from the backing arrays first')
+    datastores_parser.add_argument('--window', default='1h', help='Average array-side metrics over this window, e.g. 1h, 24h')
+
+    # VM Rebalance Command
+    rebalance_parser = vm_subparsers.add_parser('rebalance', help='Plan (and optionally run) vMotions that even out host load (VMware)')
+    rebalance_parser.add_argument('site', help='Name of the site')
+    rebalance_parser.add_argument('hypervisor_name', help='Name of the hypervisor')
+    rebalance_mode = rebalance_parser.add_mutually_exclusive_group()
+    rebalance_mode.add_argument('--plan', action='store_true', help='Only show the migration plan (default)')
+    rebalance_mode.add_argument('--execute', action='store_true', help='Run the planned migrations')
+    rebalance_parser.add_argument('--cluster', help='Only rebalance hosts in this cluster')
+    rebalance_parser.add_argument('--threshold', type=float, default=0.1, help='Stop once the spread between busiest and idlest host is below this (0-1)')
+    rebalance_parser.add_argument('--max-moves', type=int, default=10, help='Maximum number of migrations in the plan')
+    rebalance_parser.add_argument('--max-concurrent', type=int, default=2, help='Migrations running at the same time with --execute')
+
+    # VM Power Command
+    power_parser = vm_subparsers.add_parser('power', help='Power many VMs on, off or reboot them concurrently')
+    power_parser.add_argument('operation', choices=['on', 'off', 'reboot'], help='Power operation')
+    power_parser.add_argument('site', help='Name of the site')
+    power_parser.add_argument('hypervisor_name', help='Name of the hypervisor')
+    power_source = power_parser.add_mutually_exclusive_group(required=True)
+    power_source.add_argument('--vms', nargs='+', help='Names of the VMs')
+    power_source.add_argument('--pattern', help='Regular expression matched against VM names')
+    power_source.add_argument('--file', help='File with one VM name per line')
+    power_parser.add_argument('--hard', action='store_true', help='Power off/reset without asking the guest OS')
+    power_parser.add_argument('--timeout', type=int, default=600, help='Seconds to wait for all VMs to reach the new state')
+
     # VM Modify Command
     modify_parser = vm_subparsers.add_parser('modify', help='Modify existing VM')
     modify_parser.add_argument('vm_name', help='Name of the VM to modify')
@@ -160,6 +298,14 @@ def main():
     # VM List Profiles Command
     list_profiles_parser = vm_subparsers.add_parser('list_profiles', help='List all VM profiles')
 
+    # VM Plan Command
+    plan_parser = vm_subparsers.add_parser('plan', help='Show the VMs a profile expands to without creating them')
+    plan_parser.add_argument('profile_name', help='Name of the profile to expand')
+    plan_parser.add_argument('--limit', type=int, help='Only show the first N VMs')
+
+    # VM Validate Profiles Command
+    validate_profiles_parser = vm_subparsers.add_parser('validate_profiles', help='Validate all VM profiles against the profile schema')
+
     # Storage Management Parser
     storage_parser = subparsers.add_parser('storage', help='Storage management commands')
     storage_subparsers = storage_parser.add_subparsers(dest='command', required=True)
@@ -201,6 +347,33 @@ def main():
     snapshot_lun_parser.add_argument('volume_name', help='Name of the volume')
     snapshot_lun_parser.add_argument('snapshot_name', help='Name of the snapshot')
 
+    # Storage Snapshot Group Command
+    snapshot_group_parser = storage_subparsers.add_parser('snapshot_group', help='Take consistent snapshots of many volumes or a protection group')
+    snapshot_group_parser.add_argument('site', help='Name of the site')
+    snapshot_group_parser.add_argument('array_names', nargs='+', help='Names of the storage arrays')
+    snapshot_source = snapshot_group_parser.add_mutually_exclusive_group(required=True)
+    snapshot_source.add_argument('--volumes', nargs='+', help='Names of the volumes to snapshot')
+    snapshot_source.add_argument('--pattern', help='Glob pattern of the volumes to snapshot, e.g. "db01-*"')
+    snapshot_source.add_argument('--pgroup', help='Name of the protection group to snapshot')
+    snapshot_group_parser.add_argument('--prefix', default='fscli', help='Snapshot suffix prefix, also used to select snapshots for pruning')
+    snapshot_group_parser.add_argument('--retention', help='Prune snapshots with this prefix older than e.g. 12h, 7d')
+    snapshot_group_parser.add_argument('--eradicate', action='store_true', help='Eradicate pruned snapshots instead of leaving them in the destroyed bucket')
+
+    # Storage Provision Command
+    provision_parser = storage_subparsers.add_parser('provision', help='Create LUNs in bulk and connect them to a host group')
+    provision_parser.add_argument('site', help='Name of the site')
+    provision_parser.add_argument('spec_file', help='Path to the provisioning spec YAML file')
+
+    # Storage Metrics Command
+    metrics_parser = storage_subparsers.add_parser('metrics', help='Collect and summarize array and volume space/performance metrics')
+    metrics_parser.add_argument('site', help='Name of the site')
+    metrics_parser.add_argument('array_name', help='Name of the storage array')
+    metrics_parser.add_argument('--metrics', nargs='+', default=['reads_per_sec', 'writes_per_sec', 'usec_per_read_op', 'usec_per_write_op', 'total', 'data_reduction'], help='Metrics to summarize')
+    metrics_parser.add_argument('--historical', default='1h', help='History to fetch from the array (1h, 3h, 24h, 7d, 30d)')
+    metrics_parser.add_argument('--window', default='24h', help='Rollup window over stored samples, e.g. 30m, 24h, 7d')
+    metrics_parser.add_argument('--top', type=int, help='Only show the top N entities by the first metric')
+    metrics_parser.add_argument('--no-fetch', action='store_true', help='Summarize stored samples without querying the array')
+
     # Storage List Hosts Command
     list_hosts_parser = storage_subparsers.add_parser('list_hosts', help='List all hosts')
     list_hosts_parser.add_argument('site', help='Name of the site')
@@ -215,6 +388,40 @@ def main():
     list_host_lun_mappings_parser = storage_subparsers.add_parser('list_host_lun_mappings', help='List host-LUN mappings')
     list_host_lun_mappings_parser.add_argument('site', help='Name of the site')
     list_host_lun_mappings_parser.add_argument('array_name', help='Name of the storage array')
+    list_host_lun_mappings_parser.add_argument('--stream', action='store_true', help='Print mappings as they are read instead of as a table')
+
+    # Inventory Parser
+    inventory_parser = subparsers.add_parser('inventory', help='Local SQLite inventory of VMs, LUNs, DNS records and IP addresses')
+    inventory_parser.add_argument('--db', default=DEFAULT_INVENTORY_DB, help='Inventory database path')
+    inventory_subparsers = inventory_parser.add_subparsers(dest='command', required=True)
+
+    # Inventory Sync Command
+    inventory_sync_parser = inventory_subparsers.add_parser('sync', help='Fetch every backend of a site concurrently and update the inventory')
+    inventory_sync_parser.add_argument('site', help='Name of the site')
+    inventory_sync_parser.add_argument('--backends', nargs='+', choices=['hypervisors', 'storage', 'dns', 'ipam'], default=['hypervisors', 'storage', 'dns', 'ipam'], help='Backends to sync')
+    inventory_sync_parser.add_argument('--max-workers', type=int, default=8, help='Endpoints fetched in parallel')
+    inventory_sync_parser.add_argument('--allow-empty', action='store_true', help='Apply an empty result from an endpoint that has stored rows')
+
+    # Inventory Query Command
+    inventory_query_parser = inventory_subparsers.add_parser('query', help='Query the inventory without touching any backend')
+    inventory_query_group = inventory_query_parser.add_mutually_exclusive_group(required=True)
+    inventory_query_group.add_argument('--ip', help='VMs, phpIPAM entries and DNS records using an address')
+    inventory_query_group.add_argument('--vm', help='VMs by name (* wildcard) with their subnet and DNS names')
+    inventory_query_group.add_argument('--host', help='LUNs mapped to a storage host (* wildcard)')
+    inventory_query_group.add_argument('--volume', help='Hosts a volume is mapped to (* wildcard)')
+    inventory_query_group.add_argument('--dns', help='DNS records by name or value (* wildcard)')
+    inventory_query_group.add_argument('--sql', help='Read-only SQL against the inventory tables')
+
+    # Inventory Reconcile Command
+    inventory_reconcile_parser = inventory_subparsers.add_parser('reconcile', help='Report drift between phpIPAM, DNS A records and VM addresses')
+    inventory_reconcile_parser.add_argument('site', help='Name of the site')
+    inventory_reconcile_parser.add_argument('--no-sync', action='store_true', help='Reconcile the stored inventory without fetching the backends first')
+    inventory_reconcile_parser.add_argument('--issues', nargs='+', choices=list(ISSUES), help='Only report these issues')
+    inventory_reconcile_parser.add_argument('--max-workers', type=int, default=8, help='Endpoints fetched in parallel')
+
+    # Inventory Stats Command
+    inventory_stats_parser = inventory_subparsers.add_parser('stats', help='Show the last sync time and duration of every backend')
+    inventory_stats_parser.add_argument('--site', help='Only show this site')
 
     args = parser.parse_args()
 
@@ -268,19 +475,33 @@ def main():
                     logger.info(f"No DNS records found for {args.domain}")
 
         elif args.tool == 'vm':
-            vm_manager = get_manager(args.site, 'hypervisors', args.hypervisor_name) if args.command != 'list_profiles' else None
-            if args.command != 'list_profiles' and not vm_manager:
-                logger.error(f"VM manager not found for site {args.site} and hypervisor {args.hypervisor_name}")
-                return
-
-            if args.command == 'create':
+            # Profiles are validated before connecting, so a bad profile fails fast
+            profile = None
+            if args.command in ('create', 'modify', 'plan'):
                 profile = load_profile(args.profile_name)
                 if not profile:
                     logger.error(f"Profile {args.profile_name} could not be loaded")
                     return
-                logger.info(f"Creating VM from profile {args.profile_name}...")
-                vm_manager.create_vm(args.site, profile)
-                logger.info(f"VM {profile['hostname_pattern'].format(index=1)} created successfully")
+
+            offline = args.command in ('list_profiles', 'validate_profiles', 'plan')
+            vm_manager = get_manager(args.site, 'hypervisors', args.hypervisor_name) if not offline else None
+            if not offline and not vm_manager:
+                logger.error(f"VM manager not found for site {args.site} and hypervisor {args.hypervisor_name}")
+                return
+
+            if args.command == 'create':
+                logger.info(f"Creating VMs from profile {args.profile_name}...")
+                # Specs are generated one at a time, so large matrices are never held in memory
+                for spec in itertools.islice(expand_profile(profile), args.limit):
+                    vm_manager.create_vm(spec)
+                    logger.info(f"VM {spec['hostname']} created successfully")
+
+            elif args.command == 'plan':
+                planned = 0
+                for spec in itertools.islice(expand_profile(profile), args.limit):
+                    print(f"{spec['hostname']}\tcpu={spec['cpu']}\tmemory={spec['memory']}\tdisk_gb={sum(disk['size_gb'] for disk in spec['disks'])}")
+                    planned += 1
+                logger.info(f"{planned} VMs planned from profile {args.profile_name}")
 
             elif args.command == 'delete':
                 logger.info(f"Deleting VM {args.vm_name}...")
@@ -289,9 +510,9 @@ def main():
 
             elif args.command == 'list':
                 logger.info("Listing VMs...")
-                vms = vm_manager.list_vms()
+                vms = [vm.as_row() for vm in vm_manager.list_vms()]
                 if vms:
-                    table = tabulate(vms, headers=["VM Name", "vCPU", "Memory", "Total Disk Size", "Snapshot Count"], tablefmt="grid")
+                    table = tabulate(vms, headers=VMRecord.HEADERS, tablefmt="grid")
                     logger.info(f"VMs in {args.site} on {args.hypervisor_name}:\n{table}")
                 else:
                     logger.info(f"No VMs found in {args.site} on {args.hypervisor_name}")
@@ -301,11 +522,72 @@ def main():
                 vm_manager.create_snapshot(args.vm_name)
                 logger.info(f"Snapshot for VM {args.vm_name} created successfully")
 
-            elif args.command == 'modify':
-                profile = load_profile(args.profile_name)
-                if not profile:
-                    logger.error(f"Profile {args.profile_name} could not be loaded")
+            elif args.command == 'snapshot_group':
+                if not hasattr(vm_manager, 'snapshot_vms'):
+                    logger.error(f"Bulk snapshots are not supported on hypervisor {args.hypervisor_name}")
                     return
+                results = vm_manager.snapshot_vms(args.prefix, args.vms, args.folder, args.pattern, args.retention, args.consolidate, args.memory, args.quiesce, not args.prune_only)
+                if results:
+                    table = tabulate([[name, r["taken"], r["pruned"], r["consolidated"], "\n".join(r.get("errors", []))] for name, r in sorted(results.items())], headers=["VM Name", "Snapshot Taken", "Snapshots Pruned", "Consolidated", "Errors"], tablefmt="grid")
+                    logger.info(f"Snapshot results in {args.site} on {args.hypervisor_name}:\n{table}")
+                else:
+                    logger.info(f"No VMs snapshotted in {args.site} on {args.hypervisor_name}")
+
+            elif args.command == 'stats':
+                if not hasattr(vm_manager, 'vm_stats'):
+                    logger.error(f"VM stats are not supported on hypervisor {args.hypervisor_name}")
+                    return
+                logger.info("Querying VM performance counters...")
+                rows = vm_manager.vm_stats(args.counters, args.vms, args.folder, args.pattern, args.interval, args.window, args.top)
+                if rows:
+                    table = tabulate(rows, headers="keys", tablefmt="grid")
+                    logger.info(f"VM stats in {args.site} on {args.hypervisor_name}:\n{table}")
+                else:
+                    logger.info(f"No VM stats found in {args.site} on {args.hypervisor_name}")
+
+            elif args.command == 'datastores':
+                if not hasattr(vm_manager, 'datastore_report'):
+                    logger.error(f"Datastore correlation is not supported on hypervisor {args.hypervisor_name}")
+                    return
+                # The arrays are only contacted to (re)build the mapping or to collect metrics
+                storage_manager = None
+                if args.refresh or args.collect or vm_manager.datastore_volumes() is None:
+                    storage_manager = get_storage_manager(args.site)
+                if args.collect and storage_manager:
+                    for array_name in {extent['array'] for backing in (vm_manager.datastore_volumes(storage_manager, args.refresh) or {}).values() for extent in backing}:
+                        storage_manager.collect_metrics(array_name)
+                rows = vm_manager.datastore_report(storage_manager, args.refresh and not args.collect, args.window)
+                if rows:
+                    table = tabulate(rows, headers="keys", tablefmt="grid")
+                    logger.info(f"Datastores in {args.site} on {args.hypervisor_name}:\n{table}")
+                else:
+                    logger.info(f"No datastores found in {args.site} on {args.hypervisor_name}")
+
+            elif args.command == 'rebalance':
+                if not hasattr(vm_manager, 'rebalance'):
+                    logger.error(f"Rebalancing is not supported on hypervisor {args.hypervisor_name}")
+                    return
+                plan, before, after = vm_manager.rebalance(args.cluster, args.threshold, args.max_moves, args.execute, args.max_concurrent)
+                if plan:
+                    table = tabulate(plan, headers="keys", tablefmt="grid")
+                    logger.info(f"Rebalance plan in {args.site} on {args.hypervisor_name} (imbalance {before:.2f} -> {after:.2f}):\n{table}")
+                else:
+                    logger.info(f"No migrations needed in {args.site} on {args.hypervisor_name} (imbalance {before:.2f})")
+
+            elif args.command == 'power':
+                vm_names = load_vm_names(args.file) if args.file else args.vms
+                if args.file and not vm_names:
+                    logger.error(f"No VM names loaded from {args.file}")
+                    return
+                logger.info(f"Running power {args.operation}...")
+                results = vm_manager.power_vms(args.operation, vm_names, args.pattern, args.hard, args.timeout)
+                if results:
+                    table = tabulate(sorted(results.items()), headers=["VM Name", "Result"], tablefmt="grid")
+                    logger.info(f"Power {args.operation} results in {args.site} on {args.hypervisor_name}:\n{table}")
+                else:
+                    logger.info(f"No VMs matched in {args.site} on {args.hypervisor_name}")
+
+            elif args.command == 'modify':
                 logger.info(f"Modifying VM {args.vm_name} with profile {args.profile_name}...")
                 vm_manager.modify_vm(args.vm_name, profile)
                 logger.info(f"VM {args.vm_name} modified successfully")
@@ -317,10 +599,21 @@ def main():
                 else:
                     logger.info("No VM profiles found")
 
+            elif args.command == 'validate_profiles':
+                results = get_registry("vm_profiles").validate_all()
+                if results:
+                    table = tabulate([[name, "OK" if not errors else "\n".join(errors)] for name, errors in results.items()], headers=["Profile", "Result"], tablefmt="grid")
+                    logger.info(f"Profile validation:\n{table}")
+                else:
+                    logger.info("No VM profiles found")
+
         elif args.tool == 'storage':
-            storage_manager = get_manager(args.site, 'storage', args.array_name)
+            if args.command in ('provision', 'snapshot_group'):
+                storage_manager = get_storage_manager(args.site)
+            else:
+                storage_manager = get_manager(args.site, 'storage', args.array_name)
             if not storage_manager:
-                logger.error(f"Storage manager not found for site {args.site} and array {args.array_name}")
+                logger.error(f"Storage manager not found for site {args.site}")
                 return
 
             if args.command == 'create_lun':
@@ -343,6 +636,26 @@ def main():
                 storage_manager.take_snapshot(args.array_name, args.volume_name, args.snapshot_name)
                 logger.info(f"Snapshot {args.snapshot_name} for volume {args.volume_name} created successfully")
 
+            elif args.command == 'snapshot_group':
+                logger.info("Taking snapshots...")
+                results = storage_manager.snapshot_arrays(args.array_names, args.prefix, args.volumes, args.pattern, args.pgroup, args.retention, args.eradicate)
+                table = tabulate([[array_name, len(taken), len(pruned)] for array_name, (taken, pruned) in results.items()], headers=["Array Name", "Snapshots Taken", "Snapshots Pruned"], tablefmt="grid")
+                logger.info(f"Snapshot results in {args.site}:\n{table}")
+
+            elif args.command == 'provision':
+                spec = load_spec(args.spec_file)
+                if not spec:
+                    logger.error(f"Spec {args.spec_file} could not be loaded")
+                    return
+                logger.info("Provisioning LUNs...")
+                results = storage_manager.provision(spec['volumes'])
+                table = tabulate([[array_name, len(volumes)] for array_name, volumes in results.items()], headers=["Array Name", "LUNs Provisioned"], tablefmt="grid")
+                logger.info(f"Provisioning results in {args.site}:\n{table}")
+
+            elif args.command == 'metrics':
+                logger.info("Summarizing metrics...")
+                storage_manager.list_metrics(args.array_name, args.metrics, args.window, args.top, not args.no_fetch, args.historical)
+
             elif args.command == 'list_hosts':
                 logger.info("Listing hosts...")
                 hosts = storage_manager.list_hosts(args.array_name)
@@ -363,13 +676,72 @@ def main():
 
             elif args.command == 'list_host_lun_mappings':
                 logger.info("Listing host-LUN mappings...")
-                mappings = storage_manager.list_host_lun_mappings(args.array_name)
+                mappings = storage_manager.list_host_lun_mappings(args.array_name, args.stream)
                 if mappings:
                     table = tabulate(mappings, headers=["Host Name", "Mapped LUNs"], tablefmt="grid")
                     logger.info(f"Host-LUN mappings in {args.site} on {args.array_name}:\n{table}")
                 else:
                     logger.info(f"No host-LUN mappings found in {args.site} on {args.array_name}")
 
+        elif args.tool == 'inventory':
+            inventory = Inventory(args.db)
+
+            if args.command == 'sync':
+                jobs = inventory_jobs(args.site, args.backends)
+                if not jobs:
+                    logger.info(f"No endpoints to sync in site {args.site}")
+                    return
+                logger.info(f"Syncing {len(jobs)} endpoints in site {args.site}...")
+                stats = inventory.sync(args.site, jobs, args.max_workers, args.allow_empty)
+                table = tabulate([{k: v for k, v in stat.items() if k not in ('site', 'synced_at')} for stat in stats], headers="keys", tablefmt="grid")
+                logger.info(f"Inventory sync of {args.site}:\n{table}")
+
+            elif args.command == 'query':
+                if args.ip:
+                    rows = inventory.find_ip(args.ip)
+                elif args.vm:
+                    rows = inventory.find_vm(args.vm)
+                elif args.host:
+                    rows = inventory.host_luns(args.host)
+                elif args.volume:
+                    rows = inventory.volume_hosts(args.volume)
+                elif args.dns:
+                    rows = inventory.find_dns(args.dns)
+                else:
+                    rows = inventory.run_sql(args.sql)
+                if rows:
+                    logger.info(f"Inventory results:\n{tabulate(rows, headers='keys', tablefmt='grid')}")
+                else:
+                    logger.info("No matching inventory entries")
+
+            elif args.command == 'reconcile':
+                if not args.no_sync:
+                    logger.info(f"Syncing hypervisors, DNS and phpIPAM in site {args.site}...")
+                    for stat in inventory.sync(args.site, inventory_jobs(args.site, ['hypervisors', 'dns', 'ipam']), args.max_workers):
+                        if stat['error']:
+                            logger.warning(f"{stat['backend']} {stat['source']} failed, using stored rows: {stat['error']}")
+                findings = reconcile(inventory.rows('vms', args.site), inventory.rows('dns_records', args.site), inventory.rows('ip_addresses', args.site))
+                if args.issues:
+                    findings = [f for f in findings if f['issue'] in args.issues]
+                if findings:
+                    counts = {}
+                    for finding in findings:
+                        counts[finding['issue']] = counts.get(finding['issue'], 0) + 1
+                    table = tabulate(findings, headers="keys", tablefmt="grid")
+                    summary = tabulate([[issue, count, ISSUES[issue]] for issue, count in counts.items()], headers=["Issue", "Count", "Meaning"], tablefmt="grid")
+                    logger.info(f"Drift in {args.site}:\n{table}\n{summary}")
+                else:
+                    logger.info(f"No drift found in {args.site}")
+
+            elif args.command == 'stats':
+                stats = inventory.sync_stats(args.site)
+                if stats:
+                    logger.info(f"Inventory syncs:\n{tabulate(stats, headers='keys', tablefmt='grid')}")
+                else:
+                    logger.info("The inventory has not been synced yet")
+
+            inventory.close()
+
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}")
 
@@ -0,0 +1,194 @@
+import base64
+import hashlib
+import hmac
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class CloudStackError(Exception):
+    def __init__(self, command, status_code, message):
+        super().__init__(f"{command} failed ({status_code}): {message}")
+        self.command = command
+        self.status_code = status_code
+        self.message = message
+
+
+class RateLimiter:
+    # Token bucket shared by every client talking to the same endpoint
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(endpoint, rate, burst=None):
+    # Clients with the same endpoint and limits share a bucket; different limits get their own
+    key = (endpoint, float(rate), float(burst or rate))
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(rate, burst)
+            _rate_limiters[key] = limiter
+        return limiter
+
+
+class CloudStackClient:
+    def __init__(self, endpoint, key, secret, max_workers=16, rate_limit=None, burst=None, timeout=30, page_size=500):
+        self.endpoint = endpoint
+        self.key = key
+        self.timeout = timeout
+        self.page_size = page_size
+        self.max_workers = max_workers
+        # HMAC key schedule is computed once and copied per request
+        self.signer = hmac.new(secret.encode('utf-8'), digestmod=hashlib.sha1)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.rate_limiter = get_rate_limiter(endpoint, rate_limit, burst) if rate_limit else None
+        self.executor = None
+        self.executor_lock = threading.Lock()
+
+    def __getattr__(self, command):
+        # Keeps the cs.CloudStack call style: client.listVirtualMachines(...)
+        if command.startswith('_'):
+            raise AttributeError(command)
+
+        def call(**params):
+            return self.request(command, **params)
+        return call
+
+    def sign(self, params):
+        query = "&".join(f"{k}={quote(str(v), safe='*')}" for k, v in sorted(params.items()))
+        mac = self.signer.copy()
+        mac.update(query.lower().encode('utf-8'))
+        return base64.b64encode(mac.digest()).decode('utf-8').strip()
+
+    def flatten(self, params):
+        # Nested dicts and lists of dicts use the CloudStack map syntax, e.g. details[0].cpuNumber
+        flat = {}
+        for key, value in params.items():
+            if value is None:
+                continue
+            if isinstance(value, dict):
+                for sub_key, sub_value in value.items():
+                    flat[f"{key}[0].{sub_key}"] = sub_value
+            elif isinstance(value, (list, tuple)) and value and isinstance(value[0], dict):
+                for i, item in enumerate(value):
+                    for sub_key, sub_value in item.items():
+                        flat[f"{key}[{i}].{sub_key}"] = sub_value
+            elif isinstance(value, (list, tuple)):
+                flat[key] = ",".join(str(v) for v in value)
+            elif isinstance(value, bool):
+                flat[key] = "true" if value else "false"
+            else:
+                flat[key] = value
+        return flat
+
+    def request(self, command, fetch_list=False, **params):
+        if fetch_list:
+            return self.fetch_list(command, **params)
+
+        params = self.flatten(params)
+        params.update({'command': command, 'apiKey': self.key, 'response': 'json'})
+        params['signature'] = self.sign(params)
+
+        if self.rate_limiter:
+            self.rate_limiter.acquire()
+
+        response = self.session.get(self.endpoint, params=params, timeout=self.timeout)
+        try:
+            data = response.json()
+        except ValueError:
+            raise CloudStackError(command, response.status_code, response.text)
+
+        key = f"{command.lower()}response"
+        body = data.get(key, data)
+        if response.status_code != 200 or 'errorcode' in body:
+            raise CloudStackError(command, body.get('errorcode', response.status_code), body.get('errortext', response.text))
+        return body
+
+    def fetch_list(self, command, **params):
+        items = []
+        page = 1
+        while True:
+            body = self.request(command, page=page, pagesize=self.page_size, **params)
+            values = [v for k, v in body.items() if k != 'count' and isinstance(v, list)]
+            batch = values[0] if values else []
+            items.extend(batch)
+            if len(batch) < self.page_size or len(items) >= body.get('count', 0):
+                return items
+            page += 1
+
+    def get_executor(self):
+        with self.executor_lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self.executor
+
+    def map(self, command, param_list, fetch_list=False):
+        # Returns results in input order; failed calls yield the exception instead of raising
+        executor = self.get_executor()
+        futures = [executor.submit(self.request, command, fetch_list=fetch_list, **params) for params in param_list]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def wait_for_jobs(self, job_ids, timeout=600, interval=2):
+        pending = set(job_ids)
+        results = {}
+        start_time = time.time()
+        while pending:
+            if time.time() - start_time > timeout:
+                for job_id in pending:
+                    results[job_id] = TimeoutError(f"Async job {job_id} timed out")
+                break
+            job_list = list(pending)
+            for job_id, job in zip(job_list, self.map('queryAsyncJobResult', [{'jobid': j} for j in job_list])):
+                if isinstance(job, Exception):
+                    results[job_id] = job
+                    pending.discard(job_id)
+                elif job.get('jobstatus') == 1:
+                    results[job_id] = job.get('jobresult', {})
+                    pending.discard(job_id)
+                elif job.get('jobstatus') == 2:
+                    error = job.get('jobresult', {})
+                    results[job_id] = CloudStackError('queryAsyncJobResult', error.get('errorcode'), error.get('errortext'))
+                    pending.discard(job_id)
+            if pending:
+                time.sleep(interval)
+        return results
+
+    def close(self):
+        with self.executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+                self.executor = None
+        self.session.close()
@@ -1,52 +1,33 @@
-import os
-import yaml
-from cs import CloudStack
-from tabulate import tabulate
+import re
+from .cloudstack_client import CloudStackClient
+from .hypervisor import Hypervisor, VMRecord
 from .phpipam_manager import PhpIpamManager
 from .vault_manager import VaultManager
 from .vm_profile_manager import load_profiles
 
-class CloudStackManager:
+class CloudStackManager(Hypervisor):
+    backend = 'cloudstack'
+
     def __init__(self, site_config, profiles_path):
         self.site_config = site_config
         self.vault_manager = VaultManager(site_config)
         self.credentials = self.vault_manager.read_secret(self.site_config['vault_path'])
-        self.clusters = self.load_clusters()
-        self.profiles_path = profiles_path  
+        self.profiles_path = profiles_path
         self.profiles = load_profiles(self.profiles_path)
-        self.vm_count = {}  # Dictionary to keep track of VM counts for each cluster
         self.phpipam_manager = PhpIpamManager(site_config)
         api_url = self.site_config['cloudstack']['api_url']
         api_key = self.site_config['cloudstack']['api_key']
         secret_key = self.site_config['cloudstack']['secret_key']
-        self.cloudstack = CloudStack(endpoint=api_url, key=api_key, secret=secret_key)
-
-    def load_clusters(self):
-        clusters = {}
-        for filename in os.listdir(self.config_path):
-            if filename.endswith(".yaml"):
-                try:
-                    with open(os.path.join(self.config_path, filename), 'r') as f:
-                        cluster = yaml.safe_load(f)
-                        cluster_name = os.path.splitext(filename)[0]
-                        clusters[cluster_name] = cluster
-                except Exception as e:
-                    print(f"Error loading cluster {filename}: {str(e)}")
-        return clusters
-
-    def create_vm(self, cluster_name, profile_name):
-        cluster = self.clusters.get(cluster_name)
-        if not cluster:
-            print(f"Cluster configuration for {cluster_name} not found.")
-            return
-
-        profile = self.profiles.get(profile_name)
-        if not profile:
-            print(f"Profile {profile_name} not found.")
-            return
-
+        self.cloudstack = CloudStackClient(
+            api_url, api_key, secret_key,
+            max_workers=self.site_config['cloudstack'].get('max_workers', 16),
+            rate_limit=self.site_config['cloudstack'].get('rate_limit'),
+            burst=self.site_config['cloudstack'].get('rate_burst')
+        )
+
+    def create_vm(self, profile):
         try:
-            network_info = self.phpipam_manager.allocate_ip(profile)
+            network_info = self.phpipam_manager.get_network_info(profile['networks'][0]['vlan'], profile['hostname_pattern'].format(index=1))
         except Exception as e:
             print(f"Error allocating IP: {str(e)}")
             return
@@ -82,21 +63,23 @@ class CloudStackManager:
 
         try:
             response = self.cloudstack.deployVirtualMachine(**payload)
-            print(f"VM {response['name']} created successfully")
+            job = self.cloudstack.wait_for_jobs([response['jobid']])[response['jobid']]
+            if isinstance(job, Exception):
+                raise job
+            print(f"VM {payload['name']} created successfully")
         except Exception as e:
             print(f"Error creating VM: {str(e)}")
+            self.release_network_info(network_info)
 
-    def modify_vm(self, cluster_name, vm_name, profile_name):
-        cluster = self.clusters.get(cluster_name)
-        if not cluster:
-            print(f"Cluster configuration for {cluster_name} not found.")
-            return
-
-        profile = self.profiles.get(profile_name)
-        if not profile:
-            print(f"Profile {profile_name} not found.")
-            return
+    def release_network_info(self, network_info):
+        # Gives back the address reserved for a VM that was never created
+        try:
+            self.phpipam_manager.release_ip(network_info['ip_address'], network_info['subnet_id'])
+            print(f"Released IP {network_info['ip_address']}")
+        except Exception as e:
+            print(f"Error releasing IP {network_info['ip_address']}: {str(e)}")
 
+    def modify_vm(self, vm_name, profile):
         try:
             vm = self.get_vm_by_name(vm_name)
             if not vm:
@@ -128,52 +111,103 @@ class CloudStackManager:
                     "name": network['name']
                 }
 
-            response = self.cloudstack.updateVirtualMachine(**payload)
-            print(f"VM {response['name']} modified successfully")
+            self.cloudstack.updateVirtualMachine(**payload)
+            print(f"VM {vm_name} modified successfully")
         except Exception as e:
             print(f"Error modifying VM: {str(e)}")
 
-    def delete_vm(self, cluster_name, vm_name):
-        cluster = self.clusters.get(cluster_name)
-        if not cluster:
-            print(f"Cluster configuration for {cluster_name} not found.")
-            return
-
+    def delete_vm(self, vm_name):
         try:
             vm = self.get_vm_by_name(vm_name)
             if not vm:
                 print(f"VM {vm_name} not found.")
                 return
 
-            response = self.cloudstack.destroyVirtualMachine(id=vm['id'])
+            self.cloudstack.destroyVirtualMachine(id=vm['id'])
             print(f"VM {vm_name} deleted successfully")
         except Exception as e:
             print(f"Error deleting VM: {str(e)}")
 
-    def list_vms(self, cluster_name):
-        cluster = self.clusters.get(cluster_name)
-        if not cluster:
-            print(f"Cluster configuration for {cluster_name} not found.")
+    def list_vms(self):
+        try:
+            vms = self.cloudstack.listVirtualMachines(fetch_list=True)
+        except Exception as e:
+            print(f"Error listing VMs: {str(e)}")
             return
+        for vm in vms:
+            nics = vm.get('nic') or []
+            yield VMRecord(
+                vm['name'], self.backend,
+                vcpu=vm.get('cpunumber'),
+                memory_mb=vm.get('memory'),
+                state=vm.get('state'),
+                host=vm.get('hostname'),
+                ip_address=nics[0].get('ipaddress') if nics else None,
+                uid=vm.get('id')
+            )
+
+    def create_snapshot(self, vm_name):
+        try:
+            vm = self.get_vm_by_name(vm_name)
+            if not vm:
+                print(f"VM {vm_name} not found.")
+                return
 
+            response = self.cloudstack.createVMSnapshot(virtualmachineid=vm['id'], name=f"{vm_name}-snapshot")
+            job = self.cloudstack.wait_for_jobs([response['jobid']])[response['jobid']]
+            if isinstance(job, Exception):
+                raise job
+            print(f"Snapshot for VM {vm_name} created successfully")
+        except Exception as e:
+            print(f"Error creating snapshot: {str(e)}")
+
+    def power_vms(self, operation, vm_names=None, pattern=None, hard=False, timeout=600):
         try:
-            vms = self.cloudstack.listVirtualMachines()
-            vm_list = []
-            for vm in vms:
-                vm_list.append([
-                    vm['name'],
-                    vm['cpunumber'],
-                    vm['memory'],
-                    len(vm['nic']),
-                    vm['state']
-                ])
-            print(tabulate(vm_list, headers=["VM Name", "vCPU", "Memory", "NIC Count", "State"], tablefmt="grid"))
+            vms = self.cloudstack.listVirtualMachines(fetch_list=True)
         except Exception as e:
             print(f"Error listing VMs: {str(e)}")
+            return {}
+
+        regex = re.compile(pattern) if pattern else None
+        selected = [vm for vm in vms if (not vm_names or vm['name'] in vm_names) and (not regex or regex.search(vm['name']))]
+        for name in set(vm_names or []) - {vm['name'] for vm in vms}:
+            print(f"VM {name} not found.")
+
+        results = {}
+        targets = []
+        for vm in selected:
+            if operation == 'on' and vm['state'] == 'Running':
+                results[vm['name']] = "already on"
+            elif operation in ('off', 'reboot') and vm['state'] == 'Stopped':
+                results[vm['name']] = "already off"
+            else:
+                targets.append(vm)
+        if not targets:
+            return results
+
+        # Every VM gets its async job in parallel, then all jobs are polled together
+        command = {'on': 'startVirtualMachine', 'off': 'stopVirtualMachine', 'reboot': 'rebootVirtualMachine'}[operation]
+        params = [dict(id=vm['id'], **({'forced': 'true'} if hard and operation == 'off' else {})) for vm in targets]
+        jobs = {}
+        for vm, response in zip(targets, self.cloudstack.map(command, params)):
+            if isinstance(response, Exception):
+                print(f"Error calling {command} for VM {vm['name']}: {str(response)}")
+                results[vm['name']] = "failed"
+            else:
+                jobs[response['jobid']] = vm['name']
+
+        done = {'on': 'on', 'off': 'off', 'reboot': 'rebooted'}[operation]
+        for job_id, job in self.cloudstack.wait_for_jobs(list(jobs), timeout=timeout).items():
+            if isinstance(job, Exception):
+                print(f"Error during {command} for VM {jobs[job_id]}: {str(job)}")
+                results[jobs[job_id]] = "failed"
+            else:
+                results[jobs[job_id]] = done
+        return results
 
     def get_vm_by_name(self, vm_name):
         try:
-            vms = self.cloudstack.listVirtualMachines()
+            vms = self.cloudstack.listVirtualMachines(name=vm_name, fetch_list=True)
             for vm in vms:
                 if vm['name'] == vm_name:
                     return vm
@@ -1,52 +1,34 @@
-import os
-import yaml
-from tabulate import tabulate
+import re
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
 from kubevirt import KubeVirtClient
+from .hypervisor import Hypervisor, VMRecord, parse_memory_mb
 from .phpipam_manager import PhpIpamManager
 from .vault_manager import VaultManager
 from .vm_profile_manager import load_profiles
 
 
-class HarvesterManager:
+class HarvesterManager(Hypervisor):
+    backend = 'harvester'
+
     def __init__(self, site_config, profiles_path):
         self.site_config = site_config
         self.vault_manager = VaultManager(site_config)
         self.credentials = self.vault_manager.read_secret(self.site_config['vault_path'])
-        self.clusters = self.load_clusters()
         self.profiles_path = profiles_path
         self.profiles = load_profiles(self.profiles_path)
         self.phpipam_manager = PhpIpamManager(site_config)
         self.kubevirt_client = KubeVirtClient(api_url=self.site_config['harvester']['api_url'], token=self.site_config['harvester']['api_token'])
+        self.api_url = self.site_config['harvester']['api_url'].rstrip('/')
+        self.namespace = self.site_config['harvester'].get('namespace', 'default')
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Bearer {self.site_config['harvester']['api_token']}"
 
-    def load_clusters(self):
-        clusters = {}
-        for filename in os.listdir(self.config_path):
-            if filename.endswith(".yaml"):
-                try:
-                    with open(os.path.join(self.config_path, filename), 'r') as f:
-                        cluster = yaml.safe_load(f)
-                        cluster_name = os.path.splitext(filename)[0]
-                        clusters[cluster_name] = cluster
-                except Exception as e:
-                    print(f"Error loading cluster {filename}: {str(e)}")
-        return clusters
-
-    def get_cluster_config(self, cluster_name):
-        return self.clusters.get(cluster_name)
-
-    def create_vm(self, cluster_name, profile_name):
-        config = self.get_cluster_config(cluster_name)
-        if not config:
-            print(f"Cluster configuration for {cluster_name} not found.")
-            return
-
-        profile = self.profiles.get(profile_name)
-        if not profile:
-            print(f"Profile {profile_name} not found.")
-            return
-
+    def create_vm(self, profile):
         try:
-            network_info = self.phpipam_manager.allocate_ip(profile)
+            network_info = self.phpipam_manager.get_network_info(profile['networks'][0]['vlan'], profile['hostname_pattern'].format(index=1))
+            print(f"Allocated IP {network_info['ip_address']} for NIC {profile['networks'][0]['name']}")
         except Exception as e:
             print(f"Error allocating IP: {str(e)}")
             return
@@ -115,18 +97,17 @@ class HarvesterManager:
             print(f"VM {payload['metadata']['name']} created successfully")
         except Exception as e:
             print(f"Error creating VM: {str(e)}")
+            self.release_network_info(network_info)
 
-    def modify_vm(self, cluster_name, vm_name, profile_name):
-        config = self.get_cluster_config(cluster_name)
-        if not config:
-            print(f"Cluster configuration for {cluster_name} not found.")
-            return
-
-        profile = self.profiles.get(profile_name)
-        if not profile:
-            print(f"Profile {profile_name} not found.")
-            return
+    def release_network_info(self, network_info):
+        # Gives back the address reserved for a VM that was never created
+        try:
+            self.phpipam_manager.release_ip(network_info['ip_address'], network_info['subnet_id'])
+            print(f"Released IP {network_info['ip_address']}")
+        except Exception as e:
+            print(f"Error releasing IP {network_info['ip_address']}: {str(e)}")
 
+    def modify_vm(self, vm_name, profile):
         try:
             # Retrieve the existing VM
             vm = self.kubevirt_client.get_virtual_machine(vm_name)
@@ -173,35 +154,114 @@ class HarvesterManager:
         except Exception as e:
             print(f"Error modifying VM: {str(e)}")
 
-    def delete_vm(self, cluster_name, vm_name):
-        config = self.get_cluster_config(cluster_name)
-        if not config:
-            print(f"Cluster configuration for {cluster_name} not found.")
-            return
-
+    def delete_vm(self, vm_name):
         try:
             self.kubevirt_client.delete_virtual_machine(vm_name)
             print(f"VM {vm_name} deleted successfully")
         except Exception as e:
             print(f"Error deleting VM: {str(e)}")
 
-    def list_vms(self, cluster_name):
-        config = self.get_cluster_config(cluster_name)
-        if not config:
-            print(f"Cluster configuration for {cluster_name} not found.")
+    def list_vms(self):
+        try:
+            vms = self.kubevirt_client.list_virtual_machines()
+        except Exception as e:
+            print(f"Error listing VMs: {str(e)}")
             return
+        for vm in vms:
+            domain = vm['spec']['template']['spec']['domain']
+            yield VMRecord(
+                vm['metadata']['name'], self.backend,
+                vcpu=domain['cpu']['cores'],
+                memory_mb=parse_memory_mb(domain['resources']['requests']['memory']),
+                state=vm.get('status', {}).get('printableStatus'),
+                uid=vm['metadata'].get('uid')
+            )
 
+    def create_snapshot(self, vm_name):
+        # VirtualMachineSnapshot custom resource, handled by the KubeVirt snapshot controller
+        url = f"{self.api_url}/apis/snapshot.kubevirt.io/v1alpha1/namespaces/{self.namespace}/virtualmachinesnapshots"
+        body = {
+            "apiVersion": "snapshot.kubevirt.io/v1alpha1",
+            "kind": "VirtualMachineSnapshot",
+            "metadata": {"name": f"{vm_name}-snapshot-{time.strftime('%Y%m%d%H%M%S')}", "namespace": self.namespace},
+            "spec": {"source": {"apiGroup": "kubevirt.io", "kind": "VirtualMachine", "name": vm_name}}
+        }
         try:
-            vms = self.kubevirt_client.list_virtual_machines()
-            vm_list = []
-            for vm in vms:
-                vm_list.append([
-                    vm['metadata']['name'],
-                    vm['spec']['template']['spec']['domain']['cpu']['cores'],
-                    vm['spec']['template']['spec']['domain']['resources']['requests']['memory'],
-                    len(vm['spec']['template']['spec']['domain']['devices']['disks']),
-                    vm['status']['phase']
-                ])
-            print(tabulate(vm_list, headers=["VM Name", "vCPU", "Memory", "Disk Count", "State"], tablefmt="grid"))
+            response = self.session.post(url, json=body, timeout=30)
+            response.raise_for_status()
+            print(f"Snapshot {body['metadata']['name']} requested for VM {vm_name}")
+        except Exception as e:
+            print(f"Error creating snapshot: {str(e)}")
+
+    def list_vm_status(self):
+        # One list call returns the printable status of every VM in the namespace
+        url = f"{self.api_url}/apis/kubevirt.io/v1/namespaces/{self.namespace}/virtualmachines"
+        response = self.session.get(url, timeout=30)
+        response.raise_for_status()
+        return {vm['metadata']['name']: vm.get('status', {}).get('printableStatus') for vm in response.json()['items']}
+
+    def power_vm(self, vm_name, action, hard=False):
+        url = f"{self.api_url}/apis/subresources.kubevirt.io/v1/namespaces/{self.namespace}/virtualmachines/{vm_name}/{action}"
+        body = {"gracePeriod": 0} if hard and action == 'stop' else {}
+        response = self.session.put(url, json=body, timeout=30)
+        response.raise_for_status()
+
+    def power_vms(self, operation, vm_names=None, pattern=None, hard=False, timeout=600):
+        try:
+            statuses = self.list_vm_status()
         except Exception as e:
             print(f"Error listing VMs: {str(e)}")
+            return {}
+
+        regex = re.compile(pattern) if pattern else None
+        selected = [name for name in statuses if (not vm_names or name in vm_names) and (not regex or regex.search(name))]
+        for name in set(vm_names or []) - set(statuses):
+            print(f"VM {name} not found.")
+
+        results = {}
+        targets = []
+        for name in selected:
+            if operation == 'on' and statuses[name] == 'Running':
+                results[name] = "already on"
+            elif operation in ('off', 'reboot') and statuses[name] == 'Stopped':
+                results[name] = "already off"
+            else:
+                targets.append(name)
+
+        # start/stop/restart subresource calls are issued concurrently
+        action = {'on': 'start', 'off': 'stop', 'reboot': 'restart'}[operation]
+        def request(name):
+            try:
+                self.power_vm(name, action, hard)
+                return True
+            except Exception as e:
+                print(f"Error requesting {action} for VM {name}: {str(e)}")
+                return False
+        with ThreadPoolExecutor(max_workers=max(1, min(16, len(targets)))) as executor:
+            accepted = [name for name, ok in zip(targets, executor.map(request, targets)) if ok]
+        results.update({name: "failed" for name in targets if name not in accepted})
+
+        if operation == 'reboot':
+            results.update({name: "reboot requested" for name in accepted})
+            return results
+
+        # Completion is read for all VMs from a single list call per round
+        wanted = 'Running' if operation == 'on' else 'Stopped'
+        pending = set(accepted)
+        start_time = time.time()
+        while pending:
+            try:
+                statuses = self.list_vm_status()
+            except Exception as e:
+                print(f"Error listing VMs: {str(e)}")
+                statuses = {}
+            for name in [n for n in pending if statuses.get(n) == wanted]:
+                results[name] = operation
+                pending.discard(name)
+            if pending and time.time() - start_time > timeout:
+                print(f"Timed out waiting for {', '.join(sorted(pending))} to reach {wanted}.")
+                results.update({name: "timed out" for name in pending})
+                break
+            if pending:
+                time.sleep(5)
+        return results
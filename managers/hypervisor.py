@@ -0,0 +1,67 @@
+from abc import ABC, abstractmethod
+
+
+class VMRecord:
+    # Backend-neutral VM row; __slots__ keeps 10k+ records small
+    __slots__ = ('name', 'backend', 'vcpu', 'memory_mb', 'disk_gb', 'state', 'snapshot_count', 'host', 'ip_address', 'uid')
+
+    HEADERS = ["VM Name", "vCPU", "Memory (MB)", "Disk (GB)", "State", "Snapshots", "Host", "IP Address"]
+
+    def __init__(self, name, backend, vcpu=None, memory_mb=None, disk_gb=None, state=None, snapshot_count=None, host=None, ip_address=None, uid=None):
+        self.name = name
+        self.backend = backend
+        self.vcpu = vcpu
+        self.memory_mb = memory_mb
+        self.disk_gb = disk_gb
+        self.state = state
+        self.snapshot_count = snapshot_count
+        self.host = host
+        self.ip_address = ip_address
+        self.uid = uid
+
+    def __repr__(self):
+        return f"VMRecord({self.backend}:{self.name})"
+
+    def as_row(self):
+        disk_gb = round(self.disk_gb, 1) if self.disk_gb is not None else None
+        return [self.name, self.vcpu, self.memory_mb, disk_gb, self.state, self.snapshot_count, self.host, self.ip_address]
+
+
+class Hypervisor(ABC):
+    # Interface shared by VMManager, HarvesterManager and CloudStackManager. Profiles are passed
+    # as loaded dicts (see vm_profile_manager), VM listings are iterators of VMRecord.
+    backend = None
+
+    @abstractmethod
+    def create_vm(self, profile):
+        pass
+
+    @abstractmethod
+    def modify_vm(self, vm_name, profile):
+        pass
+
+    @abstractmethod
+    def delete_vm(self, vm_name):
+        pass
+
+    @abstractmethod
+    def list_vms(self):
+        pass
+
+    @abstractmethod
+    def create_snapshot(self, vm_name):
+        pass
+
+    @abstractmethod
+    def power_vms(self, operation, vm_names=None, pattern=None, hard=False, timeout=600):
+        pass
+
+
+def parse_memory_mb(quantity):
+    # Kubernetes quantities such as "8192Mi" or "8Gi"
+    units = {"Ki": 1 / 1024, "Mi": 1, "Gi": 1024, "Ti": 1024 * 1024}
+    quantity = str(quantity)
+    for suffix, factor in units.items():
+        if quantity.endswith(suffix):
+            return int(float(quantity[:-len(suffix)]) * factor)
+    return int(int(quantity) / (1024 * 1024))
@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+DEFAULT_INVENTORY_DB = os.path.join(os.path.expanduser("~"), ".infracli", "inventory.sqlite3")
+
+# table: (key columns, value columns, indexed columns); every table is scoped by site and source
+TABLES = {
+    "vms": (["name"], ["backend", "uid", "vcpu", "memory_mb", "disk_gb", "state", "host", "ip_address"], ["name", "ip_address", "host"]),
+    "volumes": (["name"], ["serial", "size"], ["name", "serial"]),
+    "lun_mappings": (["host", "volume"], ["lun"], ["host", "volume"]),
+    "dns_records": (["name", "type", "value"], ["ttl"], ["name", "value"]),
+    "ip_addresses": (["ip"], ["subnet", "hostname", "description", "mac"], ["ip", "hostname"])
+}
+SYNC_COLUMNS = ["site", "backend", "source", "synced_at", "duration", "fetched", "inserted", "updated", "deleted", "error"]
+
+
+class Inventory:
+    def __init__(self, path=DEFAULT_INVENTORY_DB):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.create_schema()
+
+    def create_schema(self):
+        with self.db:
+            for table, (keys, values, indexes) in TABLES.items():
+                columns = ", ".join(["site", "source"] + keys + values)
+                primary_key = ", ".join(["site", "source"] + keys)
+                self.db.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns}, PRIMARY KEY ({primary_key}))")
+                for column in indexes:
+                    self.db.execute(f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({column})")
+            self.db.execute(f"CREATE TABLE IF NOT EXISTS sync_runs ({', '.join(SYNC_COLUMNS)})")
+
+    def replace(self, table, site, source, rows):
+        # Diffs the fetched rows against what is stored, so only new, changed and vanished rows are written
+        keys, values, _ = TABLES[table]
+        width = len(keys)
+        existing = {
+            tuple(row[:width]): tuple(row[width:])
+            for row in self.db.execute(f"SELECT {', '.join(keys + values)} FROM {table} WHERE site = ? AND source = ?", (site, source))
+        }
+        inserts, updates, seen = [], [], set()
+        for row in rows:
+            row = tuple(row)
+            key, value = row[:width], row[width:]
+            if key in seen:
+                continue
+            seen.add(key)
+            if key not in existing:
+                inserts.append((site, source) + row)
+            elif existing[key] != value:
+                updates.append(value + (site, source) + key)
+        deletes = [(site, source) + key for key in existing.keys() - seen]
+
+        key_filter = " AND ".join(f"{column} = ?" for column in ["site", "source"] + keys)
+        with self.db:
+            self.db.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * (width + len(values) + 2))})", inserts)
+            self.db.executemany(f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in values)} WHERE {key_filter}", updates)
+            self.db.executemany(f"DELETE FROM {table} WHERE {key_filter}", deletes)
+        return len(seen), len(inserts), len(updates), len(deletes)
+
+    def stored(self, table, site, source):
+        return self.db.execute(f"SELECT count(*) FROM {table} WHERE site = ? AND source = ?", (site, source)).fetchone()[0]
+
+    def sync(self, site, jobs, max_workers=8, allow_empty=False):
+        # jobs: (backend, source, fetch) where fetch() returns {table: rows}. Backends are
+        # fetched in parallel; SQLite writes stay on this thread as each fetch completes.
+        def run(fetch):
+            start = time.time()
+            try:
+                return {table: list(rows) for table, rows in fetch().items()}, None, time.time() - start
+            except Exception as e:
+                return {}, str(e), time.time() - start
+
+        stats = []
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+            futures = {executor.submit(run, fetch): (backend, source) for backend, source, fetch in jobs}
+            for future in as_completed(futures):
+                backend, source = futures[future]
+                tables, error, duration = future.result()
+                # Some backends log and yield nothing on errors, so an empty result over stored
+                # rows is treated as a failed fetch unless empty sources are explicitly allowed
+                if not error and not allow_empty:
+                    emptied = [table for table, rows in tables.items() if not rows and self.stored(table, site, source)]
+                    if emptied:
+                        error = f"no {', '.join(emptied)} returned, keeping the stored rows"
+                        tables = {}
+                # A failed fetch leaves the previous rows in place instead of wiping them
+                counts = [0, 0, 0, 0]
+                for table, rows in tables.items():
+                    counts = [total + count for total, count in zip(counts, self.replace(table, site, source, rows))]
+                stat = (site, backend, source, int(time.time()), round(duration, 2)) + tuple(counts) + (error,)
+                with self.db:
+                    self.db.execute("INSERT INTO sync_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", stat)
+                stats.append(dict(zip(SYNC_COLUMNS, stat)))
+        return stats
+
+    def query(self, sql, params=()):
+        return [dict(row) for row in self.db.execute(sql, params)]
+
+    def rows(self, table, site):
+        return self.query(f"SELECT * FROM {table} WHERE site = ?", (site,))
+
+    def run_sql(self, sql):
+        # Ad-hoc queries from the CLI must not be able to change the inventory
+        self.db.execute("PRAGMA query_only = ON")
+        try:
+            return self.query(sql)
+        finally:
+            self.db.execute("PRAGMA query_only = OFF")
+
+    def find_ip(self, ip):
+        # Everything that claims an address: VMs, phpIPAM entries and DNS records
+        return self.query(
+            "SELECT 'vm' AS kind, site, source, name, ip_address AS value FROM vms WHERE ip_address = :ip "
+            "UNION ALL SELECT 'ipam', site, source, hostname, ip FROM ip_addresses WHERE ip = :ip "
+            "UNION ALL SELECT 'dns', site, source, name, value FROM dns_records WHERE value = :ip",
+            {"ip": ip}
+        )
+
+    def find_vm(self, pattern):
+        return self.query(
+            "SELECT v.site, v.source, v.name, v.state, v.host, v.ip_address, i.subnet, "
+            "(SELECT group_concat(d.name || '.' || d.source) FROM dns_records d WHERE d.value = v.ip_address) AS dns "
+            "FROM vms v LEFT JOIN ip_addresses i ON i.ip = v.ip_address AND i.site = v.site "
+            "WHERE v.name LIKE ? ORDER BY v.name",
+            (pattern.replace("*", "%"),)
+        )
+
+    def host_luns(self, host):
+        return self.query(
+            "SELECT m.site, m.source AS array, m.host, m.volume, m.lun, v.serial, v.size "
+            "FROM lun_mappings m LEFT JOIN volumes v ON v.site = m.site AND v.source = m.source AND v.name = m.volume "
+            "WHERE m.host LIKE ? ORDER BY m.host, m.lun",
+            (host.replace("*", "%"),)
+        )
+
+    def volume_hosts(self, volume):
+        return self.query(
+            "SELECT m.site, m.source AS array, m.volume, m.host, m.lun FROM lun_mappings m "
+            "WHERE m.volume LIKE ? ORDER BY m.volume, m.host",
+            (volume.replace("*", "%"),)
+        )
+
+    def find_dns(self, name):
+        return self.query(
+            "SELECT site, source AS zone, name, type, value, ttl FROM dns_records WHERE name LIKE ? OR value LIKE ? ORDER BY name",
+            (name.replace("*", "%"), name.replace("*", "%"))
+        )
+
+    def sync_stats(self, site=None):
+        # Latest run per backend source
+        return self.query(
+            "SELECT site, backend, source, datetime(synced_at, 'unixepoch') AS synced_at, duration, fetched, inserted, updated, deleted, error "
+            "FROM sync_runs r WHERE rowid = (SELECT max(rowid) FROM sync_runs WHERE site = r.site AND source = r.source) "
+            + ("AND site = ? " if site else "") + "ORDER BY site, backend, source",
+            (site,) if site else ()
+        )
+
+    def close(self):
+        self.db.close()
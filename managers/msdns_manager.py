@@ -1,3 +1,4 @@
+import json
 import os
 import yaml
 import logging
@@ -117,3 +118,30 @@ class DNSManager:
             self.logger.info(f"DNS records for domain {domain}:\n{output}")
         else:
             self.logger.warning(f"No DNS records found for domain {domain}.")
+
+    def iter_dns_records(self, domain):
+        # Records as JSON with the type-specific RecordData flattened to a single value
+        dns_server = self.get_dns_server(domain)
+        if not dns_server:
+            self.logger.error(f"DNS server for domain {domain} not found.")
+            return
+
+        command = (
+            f"Get-DnsServerResourceRecord -ZoneName {dns_server} | ForEach-Object {{ "
+            "$d = $_.RecordData; "
+            "[pscustomobject]@{ Name = $_.HostName; Type = [string]$_.RecordType; Ttl = [int]$_.TimeToLive.TotalSeconds; "
+            "Value = switch ($_.RecordType) { "
+            "'A' { $d.IPv4Address.IPAddressToString } 'AAAA' { $d.IPv6Address.IPAddressToString } "
+            "'CNAME' { $d.HostNameAlias } 'PTR' { $d.PtrDomainName } 'MX' { $d.MailExchange } "
+            "'TXT' { $d.DescriptiveText } default { \"$d\" } } } } | ConvertTo-Json -Compress"
+        )
+        output = self.run_winrm_command(command, dns_server)
+        # None means the command failed; an empty zone returns empty output
+        if output is None:
+            raise RuntimeError(f"Listing DNS records of {domain} on {dns_server} failed")
+        if not output:
+            return
+        records = json.loads(output.decode() if isinstance(output, bytes) else output)
+        # ConvertTo-Json emits a bare object for a single record
+        for record in records if isinstance(records, list) else [records]:
+            yield record
@@ -45,14 +45,54 @@ class PhpIpamManager:
         response.raise_for_status()
         return response.json()['data']
 
-    def get_network_info(self, vlan_name):
+    def reserve_ip(self, subnet_id, hostname=None, description=None):
+        # first_free via POST creates the address record, so concurrent and fanned-out
+        # allocations never get the same IP (the GET variant only peeks)
+        url = f"{self.base_url}/api/{self.app_id}/addresses/first_free/{subnet_id}/"
+        headers = {'token': self.token}
+        data = {'hostname': hostname, 'description': description or 'Reserved by fscli'}
+        response = requests.post(url, headers=headers, data={k: v for k, v in data.items() if v})
+        response.raise_for_status()
+        return response.json()['data']
+
+    def release_ip(self, ip_address, subnet_id):
+        url = f"{self.base_url}/api/{self.app_id}/addresses/{ip_address}/{subnet_id}/"
+        headers = {'token': self.token}
+        response = requests.delete(url, headers=headers)
+        response.raise_for_status()
+
+    def get_network_info(self, vlan_name, hostname=None):
         subnet_id = self.get_subnet_id_by_vlan(vlan_name)
-        ip_address = self.get_next_available_ip(vlan_name)
+        ip_address = self.reserve_ip(subnet_id, hostname)
         subnet_info = self.get_subnet_info(subnet_id)
         network_info = {
             'ip_address': ip_address,
+            'subnet_id': subnet_id,
             'subnet_mask': subnet_info['mask'],
             'gateway': subnet_info['gateway'],
             'dns_servers': subnet_info['nameservers']
         }
         return network_info
+
+    def iter_addresses(self):
+        # phpIPAM has no "all addresses" call on older releases: walk sections -> subnets -> addresses
+        headers = {'token': self.token}
+        response = requests.get(f"{self.base_url}/api/{self.app_id}/sections/", headers=headers)
+        response.raise_for_status()
+        for section in response.json().get('data') or []:
+            response = requests.get(f"{self.base_url}/api/{self.app_id}/sections/{section['id']}/subnets/", headers=headers)
+            response.raise_for_status()
+            for subnet in response.json().get('data') or []:
+                response = requests.get(f"{self.base_url}/api/{self.app_id}/subnets/{subnet['id']}/addresses/", headers=headers)
+                # Empty subnets answer 404 "No addresses found"
+                if response.status_code == 404:
+                    continue
+                response.raise_for_status()
+                for address in response.json().get('data') or []:
+                    yield {
+                        'ip': address['ip'],
+                        'subnet': f"{subnet['subnet']}/{subnet['mask']}",
+                        'hostname': address.get('hostname'),
+                        'description': address.get('description'),
+                        'mac': address.get('mac')
+                    }
@@ -1,7 +1,12 @@
 import os
+import time
 import yaml
-from purestorage import FlashArray
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
 from tabulate import tabulate
+from .purestorage_metrics import DEFAULT_METRICS_DIR, MetricsCollector, parse_time
+from .purestorage_session import DEFAULT_SESSION_CACHE, FlashArrayPool, SessionCache
+from .timewindow import parse_window
 from .vault_manager import VaultManager
 
 class StorageManager:
@@ -12,10 +17,9 @@ class StorageManager:
         self.arrays = self.load_arrays()
 
     def load_arrays(self):
-        arrays = {}
-        for array_name, config in self.site_config['purestorage'].items():
-            arrays[array_name] = FlashArray(config['api_url'], api_token=self.credentials['api_token'])
-        return arrays
+        # Arrays are connected lazily on first use, reusing cached sessions where possible
+        session_cache = SessionCache(self.site_config.get('purestorage_session_cache', DEFAULT_SESSION_CACHE))
+        return FlashArrayPool(self.site_config['purestorage'], self.credentials['api_token'], session_cache)
 
     def create_lun(self, array_name, volume_name, size):
         array = self.arrays.get(array_name)
@@ -25,6 +29,55 @@ class StorageManager:
         else:
             print(f"Array {array_name} not found.")
 
+    def provision_luns(self, array_name, count, size, host_group, name_pattern, start_index=1):
+        array = self.arrays.get(array_name)
+        if not array:
+            print(f"Array {array_name} not found.")
+            return []
+
+        volume_names = [name_pattern.format(index=i) for i in range(start_index, start_index + count)]
+        # Each volume is connected right after it is created, so a failure leaves at most one
+        # unconnected volume and the return value lists exactly what was provisioned
+        connected = []
+        created = None
+        try:
+            for volume_name in volume_names:
+                created = None
+                array.create_volume(volume_name, size)
+                created = volume_name
+                array.connect_hgroup(host_group, volume_name)
+                connected.append(volume_name)
+            print(f"{len(connected)} LUNs created on {array_name} with size {size} and connected to host group {host_group}.")
+        except Exception as e:
+            print(f"Error provisioning LUNs on {array_name}: {str(e)}")
+            print(f"{len(connected)} of {len(volume_names)} LUNs created and connected to host group {host_group} on {array_name}: {', '.join(connected) or 'none'}")
+            if created:
+                print(f"LUN {created} was created on {array_name} but is not connected to {host_group}; connect or destroy it.")
+        return connected
+
+    def provision(self, spec):
+        # Arrays are provisioned in parallel; entries for the same array run in order on one worker
+        by_array = {}
+        for item in spec:
+            by_array.setdefault(item['array_name'], []).append(item)
+
+        def provision_array(items):
+            volume_names = []
+            for item in items:
+                volume_names.extend(self.provision_luns(
+                    item['array_name'],
+                    item['count'],
+                    item['size'],
+                    item['host_group'],
+                    item['name_pattern'],
+                    item.get('start_index', 1)
+                ))
+            return volume_names
+
+        with ThreadPoolExecutor(max_workers=max(1, len(by_array))) as executor:
+            futures = {array_name: executor.submit(provision_array, items) for array_name, items in by_array.items()}
+        return {array_name: future.result() for array_name, future in futures.items()}
+
     def create_host(self, array_name, host_name, iqn=None, wwns=None):
         array = self.arrays.get(array_name)
         if array:
@@ -66,6 +119,102 @@ class StorageManager:
         else:
             print(f"Array {array_name} not found.")
 
+    def snapshot_volumes(self, array_name, suffix, volumes=None, pattern=None, pgroup=None):
+        array = self.arrays.get(array_name)
+        if not array:
+            print(f"Array {array_name} not found.")
+            return []
+
+        try:
+            if pgroup:
+                snapshot = array.create_pgroup_snapshot(pgroup, suffix=suffix)
+                print(f"Snapshot {snapshot['name']} taken for protection group {pgroup} on {array_name}.")
+                return [snapshot['name']]
+
+            volume_names = list(volumes or [])
+            if pattern:
+                volume_names.extend(v['name'] for v in array.list_volumes() if fnmatch(v['name'], pattern) and v['name'] not in volume_names)
+            if not volume_names:
+                print(f"No volumes matched on {array_name}.")
+                return []
+            # A single request snapshots every volume at the same point in time
+            snapshots = array.create_snapshots(volume_names, suffix=suffix)
+            print(f"{len(snapshots)} volume snapshots with suffix {suffix} taken on {array_name}.")
+            return [s['name'] for s in snapshots]
+        except Exception as e:
+            print(f"Error taking snapshots on {array_name}: {str(e)}")
+            return []
+
+    def prune_snapshots(self, array_name, prefix, retention, volumes=None, pattern=None, pgroup=None, eradicate=False):
+        array = self.arrays.get(array_name)
+        if not array:
+            print(f"Array {array_name} not found.")
+            return []
+
+        def in_scope(source):
+            if pgroup:
+                return source == pgroup
+            if volumes or pattern:
+                return source in (volumes or []) or bool(pattern and fnmatch(source, pattern))
+            return True
+
+        # Only <source>.<prefix>-* snapshots are candidates. Manual snapshots are left alone, and so are
+        # protection group member snapshots (<pgroup>.<suffix>.<volume>) listed among volume snapshots.
+        def ours(snapshot):
+            source_prefix = f"{snapshot['source']}.{prefix}-"
+            return snapshot['name'].startswith(source_prefix) and '.' not in snapshot['name'][len(source_prefix):]
+
+        try:
+            cutoff = int(time.time()) - parse_window(retention)
+            snapshots = array.list_pgroups(snap=True) if pgroup else array.list_volumes(snap=True)
+            expired = [
+                s['name'] for s in snapshots
+                if ours(s)
+                and in_scope(s['source'])
+                and parse_time(s['created']) < cutoff
+            ]
+        except Exception as e:
+            print(f"Error listing snapshots on {array_name}: {str(e)}")
+            return []
+
+        pruned = []
+        for name in expired:
+            try:
+                if pgroup:
+                    array.destroy_pgroup(name)
+                    if eradicate:
+                        array.eradicate_pgroup(name)
+                else:
+                    array.destroy_volume(name)
+                    if eradicate:
+                        array.eradicate_volume(name)
+                pruned.append(name)
+            except Exception as e:
+                print(f"Error pruning snapshot {name} on {array_name}: {str(e)}")
+        print(f"{len(pruned)} snapshots older than {retention} pruned on {array_name}.")
+        return pruned
+
+    def snapshot_arrays(self, array_names, prefix, volumes=None, pattern=None, pgroup=None, retention=None, eradicate=False):
+        suffix = f"{prefix}-{time.strftime('%Y%m%d%H%M%S')}"
+
+        def snapshot_array(array_name):
+            taken = self.snapshot_volumes(array_name, suffix, volumes, pattern, pgroup)
+            pruned = self.prune_snapshots(array_name, prefix, retention, volumes, pattern, pgroup, eradicate) if retention else []
+            return taken, pruned
+
+        with ThreadPoolExecutor(max_workers=max(1, len(array_names))) as executor:
+            futures = {array_name: executor.submit(snapshot_array, array_name) for array_name in array_names}
+
+        # One failing array must not hide the results of the others
+        results = {}
+        for array_name, future in futures.items():
+            try:
+                results[array_name] = future.result()
+            except Exception as e:
+                print(f"Error snapshotting {array_name}: {str(e)}")
+                results[array_name] = ([], [])
+        return results
+
     def list_hosts(self, array_name):
         array = self.arrays.get(array_name)
         if array:
@@ -90,20 +239,70 @@ class StorageManager:
         else:
             print(f"Array {array_name} not found.")
 
-    def list_host_lun_mappings(self, array_name):
+    def get_metrics_collector(self, array_name):
         array = self.arrays.get(array_name)
-        if array:
-            mappings = []
-            hosts = array.list_hosts()
-            for host in hosts:
-                host_name = host["name"]
-                volumes = array.list_host_connections(host_name)
-                for volume in volumes:
-                    mappings.append({
-                        "Host": host_name,
-                        "Volume": volume["vol"],
-                        "LUN": volume["lun"]
-                    })
-            print(tabulate(mappings, headers="keys"))
+        if not array:
+            print(f"Array {array_name} not found.")
+            return None
+        return MetricsCollector(
+            array,
+            array_name,
+            self.site_config.get('metrics_dir', DEFAULT_METRICS_DIR),
+            self.site_config.get('metrics_retention', '30d')
+        )
+
+    def collect_metrics(self, array_name, historical='1h'):
+        collector = self.get_metrics_collector(array_name)
+        if collector:
+            added = collector.collect(historical)
+            print(f"{added} samples collected from {array_name}.")
+        return collector
+
+    def list_metrics(self, array_name, metrics, window='24h', top=None, fetch=True, historical='1h'):
+        if fetch:
+            collector = self.collect_metrics(array_name, historical)
         else:
+            collector = self.get_metrics_collector(array_name)
+        if not collector:
+            return
+        rows = collector.rollups(metrics, window)
+        if top:
+            # Rank entities by the average of the first metric requested
+            ranked = sorted((r for r in rows if r["metric"] == metrics[0]), key=lambda r: r["avg"], reverse=True)
+            keep = {r["entity"] for r in ranked[:top]}
+            rows = [r for r in rows if r["entity"] in keep]
+        print(tabulate(rows, headers="keys", floatfmt=".2f"))
+
+    def iter_host_lun_mappings(self, array_name):
+        array = self.arrays.get(array_name)
+        if not array:
+            return
+        # One array-wide listing returns every private and shared host connection
+        for connection in array.list_hosts(connect=True):
+            yield {
+                "Host": connection["name"],
+                "Volume": connection["vol"],
+                "LUN": connection["lun"]
+            }
+
+    def iter_volumes(self, array_name):
+        array = self.arrays.get(array_name)
+        if not array:
+            return
+        for volume in array.list_volumes():
+            yield {
+                "Volume": volume["name"],
+                "Serial": volume["serial"],
+                "Size": volume["size"]
+            }
+
+    def list_host_lun_mappings(self, array_name, stream=False):
+        if array_name not in self.arrays:
             print(f"Array {array_name} not found.")
+            return
+        mappings = self.iter_host_lun_mappings(array_name)
+        if stream:
+            for mapping in mappings:
+                print(f"{mapping['Host']}\t{mapping['Volume']}\t{mapping['LUN']}")
+        else:
+            print(tabulate(list(mappings), headers="keys"))
@@ -0,0 +1,139 @@
+import bisect
+import json
+import math
+import os
+import sys
+import time
+from array import array
+from datetime import datetime, timezone
+from .timewindow import parse_window
+
+DEFAULT_METRICS_DIR = os.path.join(os.path.expanduser("~"), ".infracli", "metrics")
+
+PERFORMANCE_FIELDS = [
+    "reads_per_sec", "writes_per_sec",
+    "usec_per_read_op", "usec_per_write_op",
+    "input_per_sec", "output_per_sec"
+]
+ARRAY_SPACE_FIELDS = ["capacity", "total", "volumes", "snapshots", "data_reduction", "thin_provisioning"]
+VOLUME_SPACE_FIELDS = ["size", "total", "volumes", "snapshots", "data_reduction", "thin_provisioning"]
+
+ARRAY_ENTITY = "array"
+
+def parse_time(value):
+    return int(datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp())
+
+
+class TelemetryStore:
+    # Column store: one array of int64 timestamps and one of float64 values per (entity, metric) series.
+    # File layout is a JSON header line listing the series and their lengths, followed by the raw columns.
+    def __init__(self, path):
+        self.path = path
+        self.series = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as f:
+            header = json.loads(f.readline())
+            for entity, metric, count in header["series"]:
+                times = array('q')
+                values = array('d')
+                times.fromfile(f, count)
+                values.fromfile(f, count)
+                if header.get("byteorder", sys.byteorder) != sys.byteorder:
+                    times.byteswap()
+                    values.byteswap()
+                self.series[(entity, metric)] = (times, values)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        keys = sorted(self.series)
+        header = {
+            "byteorder": sys.byteorder,
+            "series": [[entity, metric, len(self.series[(entity, metric)][0])] for entity, metric in keys]
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(json.dumps(header).encode('utf-8') + b"\n")
+            for key in keys:
+                times, values = self.series[key]
+                times.tofile(f)
+                values.tofile(f)
+        os.replace(tmp_path, self.path)
+
+    def append(self, entity, metric, timestamp, value):
+        if value is None:
+            return False
+        times, values = self.series.setdefault((entity, metric), (array('q'), array('d')))
+        # Historical queries overlap between runs; only samples newer than the last stored one are kept
+        if times and timestamp <= times[-1]:
+            return False
+        times.append(timestamp)
+        values.append(float(value))
+        return True
+
+    def prune(self, before):
+        for key, (times, values) in list(self.series.items()):
+            start = bisect.bisect_left(times, before)
+            if start:
+                self.series[key] = (times[start:], values[start:])
+
+    def entities(self):
+        return sorted({entity for entity, _ in self.series})
+
+    def rollup(self, entity, metric, since=None):
+        times, values = self.series.get((entity, metric), (array('q'), array('d')))
+        start = bisect.bisect_left(times, since) if since is not None else 0
+        selected = sorted(values[start:])
+        if not selected:
+            return None
+        p95 = selected[min(len(selected) - 1, math.ceil(len(selected) * 0.95) - 1)]
+        return {
+            "min": selected[0],
+            "avg": sum(selected) / len(selected),
+            "p95": p95,
+            "max": selected[-1],
+            "last": values[-1],
+            "samples": len(selected)
+        }
+
+
+class MetricsCollector:
+    def __init__(self, array, array_name, metrics_dir=DEFAULT_METRICS_DIR, retention="30d"):
+        self.array = array
+        self.array_name = array_name
+        self.retention = retention
+        self.store = TelemetryStore(os.path.join(metrics_dir, f"{array_name}.tsdb"))
+
+    def record(self, entity, sample, fields):
+        timestamp = parse_time(sample["time"])
+        return sum(self.store.append(entity, field, timestamp, sample.get(field)) for field in fields)
+
+    def collect(self, historical="1h"):
+        # Four bulk historical queries cover the array and every volume on it
+        queries = [
+            (self.array.get(action="monitor", historical=historical), PERFORMANCE_FIELDS, False),
+            (self.array.get(space=True, historical=historical), ARRAY_SPACE_FIELDS, False),
+            (self.array.list_volumes(action="monitor", historical=historical), PERFORMANCE_FIELDS, True),
+            (self.array.list_volumes(space=True, historical=historical), VOLUME_SPACE_FIELDS, True)
+        ]
+        added = 0
+        for samples, fields, per_volume in queries:
+            for sample in sorted(samples, key=lambda s: s["time"]):
+                added += self.record(sample["name"] if per_volume else ARRAY_ENTITY, sample, fields)
+
+        self.store.prune(int(time.time()) - parse_window(self.retention))
+        self.store.save()
+        return added
+
+    def rollups(self, metrics, window="24h", entities=None):
+        since = int(time.time()) - parse_window(window)
+        rows = []
+        for entity in entities or self.store.entities():
+            for metric in metrics:
+                rollup = self.store.rollup(entity, metric, since)
+                if rollup:
+                    rows.append(dict(entity=entity, metric=metric, **rollup))
+        return rows
@@ -0,0 +1,118 @@
+import json
+import os
+import threading
+from purestorage import FlashArray
+
+DEFAULT_SESSION_CACHE = os.path.join(os.path.expanduser("~"), ".infracli", "purestorage_sessions.json")
+# The session cache hooks into these FlashArray internals; an SDK without them gets a plain
+# FlashArray that logs in on every invocation instead of failing
+SESSION_HOOKS = ("_request", "_start_session", "_check_rest_version")
+SESSION_CACHE_SUPPORTED = all(callable(getattr(FlashArray, hook, None)) for hook in SESSION_HOOKS)
+
+
+class SessionCache:
+    # Session cookies and negotiated REST versions per array, shared between CLI invocations
+    def __init__(self, path=DEFAULT_SESSION_CACHE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        # Session cookies are credentials, keep the file private
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, target):
+        with self.lock:
+            return self.entries.get(target)
+
+    def store(self, target, rest_version, cookies):
+        with self.lock:
+            self.entries[target] = {"rest_version": str(rest_version), "cookies": dict(cookies)}
+            self.save()
+
+    def invalidate(self, target):
+        with self.lock:
+            if self.entries.pop(target, None) is not None:
+                self.save()
+
+
+class CachedFlashArray(FlashArray):
+    # Reuses a cached session cookie instead of logging in; a 401 drops the cache entry and logs in again
+    def __init__(self, target, api_token, session_cache, **kwargs):
+        self._session_cache = session_cache
+        self._cached_entry = session_cache.get(target)
+        self._stored_cookies = {}
+        rest_version = self._cached_entry["rest_version"] if self._cached_entry else None
+        super().__init__(target, api_token=api_token, rest_version=rest_version, **kwargs)
+        self._renegotiate_rest_version = True
+
+    def _check_rest_version(self, version):
+        # The cached version was negotiated with this array before, so the version listing is skipped.
+        # Versions are only formatted into URLs and compared for equality, a string is enough.
+        if self._cached_entry and str(version) == self._cached_entry["rest_version"]:
+            return str(version)
+        return super()._check_rest_version(version)
+
+    def _start_session(self):
+        if self._cached_entry:
+            self._cookies = dict(self._cached_entry["cookies"])
+            self._stored_cookies = dict(self._cookies)
+            self._cached_entry = None
+            return
+        # First login, or the cached cookie was answered with a 401: drop it and log in again
+        self._session_cache.invalidate(self._target)
+        super()._start_session()
+
+    def _request(self, method, path, data=None, reestablish_session=True):
+        response = super()._request(method, path, data, reestablish_session)
+        # The array may roll the session cookie on any response; the cache follows it
+        if self._cookies and self._rest_version and self._cookies != self._stored_cookies:
+            self._stored_cookies = dict(self._cookies)
+            self._session_cache.store(self._target, self._rest_version, self._cookies)
+        return response
+
+
+class FlashArrayPool:
+    # Connects to an array on first use so a command only pays login cost for the arrays it touches
+    def __init__(self, array_configs, api_token, session_cache=None):
+        self.array_configs = array_configs
+        self.api_token = api_token
+        self.session_cache = session_cache or SessionCache()
+        self.arrays = {}
+        self.locks = {array_name: threading.Lock() for array_name in array_configs}
+
+    def __contains__(self, array_name):
+        return array_name in self.array_configs
+
+    def keys(self):
+        return self.array_configs.keys()
+
+    def get(self, array_name):
+        config = self.array_configs.get(array_name)
+        if config is None:
+            return None
+        with self.locks[array_name]:
+            array = self.arrays.get(array_name)
+            if array is None:
+                try:
+                    if SESSION_CACHE_SUPPORTED:
+                        array = CachedFlashArray(config['api_url'], self.api_token, self.session_cache)
+                    else:
+                        array = FlashArray(config['api_url'], api_token=self.api_token)
+                except Exception as e:
+                    print(f"Error connecting to array {array_name}: {str(e)}")
+                    return None
+                self.arrays[array_name] = array
+            return array
@@ -0,0 +1,79 @@
+from collections import defaultdict
+
+# issue: what it means for an operator
+ISSUES = {
+    "duplicate_ip": "address is configured on more than one VM",
+    "ip_not_in_ipam": "VM address is not allocated in phpIPAM",
+    "ipam_hostname_mismatch": "phpIPAM hostname differs from the VM using the address",
+    "dns_missing": "VM has no A record",
+    "dns_mismatch": "A record for the VM points to another address",
+    "ipam_orphan": "phpIPAM allocation is used by no VM and names no known VM",
+    "dns_orphan": "A record points to an address used by no VM and not allocated in phpIPAM"
+}
+
+
+def short_name(name):
+    # VM names, phpIPAM hostnames and DNS host names are compared by lowercased first label
+    return (name or "").strip().rstrip(".").split(".")[0].lower()
+
+
+def index_by(rows, key):
+    index = defaultdict(list)
+    for row in rows:
+        value = key(row)
+        if value:
+            index[value].append(row)
+    return index
+
+
+def reconcile(vms, dns_records, ip_addresses):
+    # Each source is indexed once by IP and by hostname, so every check is a dict lookup
+    # and the whole run is linear in the number of rows.
+    a_records = [r for r in dns_records if r["type"] == "A"]
+    vms_by_ip = index_by(vms, lambda r: r["ip_address"])
+    vms_by_name = index_by(vms, lambda r: short_name(r["name"]))
+    dns_by_ip = index_by(a_records, lambda r: r["value"])
+    dns_by_name = index_by(a_records, lambda r: short_name(r["name"]))
+    ipam_by_ip = {r["ip"]: r for r in ip_addresses}
+
+    findings = []
+
+    def report(issue, ip=None, name=None, **detail):
+        findings.append(dict({"issue": issue, "ip": ip, "name": name}, **detail))
+
+    for ip, owners in vms_by_ip.items():
+        if len(owners) > 1:
+            report("duplicate_ip", ip, ", ".join(sorted(vm["name"] for vm in owners)))
+        allocation = ipam_by_ip.get(ip)
+        for vm in owners:
+            if allocation is None:
+                report("ip_not_in_ipam", ip, vm["name"], source=vm["source"])
+            elif allocation["hostname"] and short_name(allocation["hostname"]) != short_name(vm["name"]):
+                report("ipam_hostname_mismatch", ip, vm["name"], ipam_hostname=allocation["hostname"])
+
+    for name, owners in vms_by_name.items():
+        records = dns_by_name.get(name, [])
+        addresses = {vm["ip_address"] for vm in owners if vm["ip_address"]}
+        if not records:
+            for vm in owners:
+                if vm["ip_address"]:
+                    report("dns_missing", vm["ip_address"], vm["name"], source=vm["source"])
+            continue
+        for record in records:
+            # VMs without a reported address (powered off, no tools) cannot be compared
+            if addresses and record["value"] not in addresses:
+                report("dns_mismatch", record["value"], name, zone=record["source"], vm_ip=", ".join(sorted(addresses)))
+
+    for ip, allocation in ipam_by_ip.items():
+        # Allocations named after a VM that reports no address (powered off, no tools) are still in use
+        if ip not in vms_by_ip and short_name(allocation["hostname"]) not in vms_by_name:
+            report("ipam_orphan", ip, allocation["hostname"], subnet=allocation["subnet"])
+
+    for ip, records in dns_by_ip.items():
+        if ip not in vms_by_ip and ip not in ipam_by_ip:
+            for record in records:
+                # Records named after a VM were already reported as dns_mismatch
+                if short_name(record["name"]) not in vms_by_name:
+                    report("dns_orphan", ip, record["name"], zone=record["source"])
+
+    return findings
@@ -0,0 +1,6 @@
+# Durations written as <number><unit>, e.g. 30m, 24h, 7d; shared by the storage and VMware managers
+WINDOW_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+def parse_window(window):
+    return int(window[:-1]) * WINDOW_UNITS[window[-1]]
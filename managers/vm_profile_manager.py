@@ -1,15 +1,288 @@
+import copy
+import itertools
 import os
+import pickle
+import threading
 import yaml
 
-def load_profiles(profiles_path):
-    profiles = {}
-    for filename in os.listdir(profiles_path):
-        if filename.endswith(".yaml"):
+DEFAULT_PROFILE_CACHE = os.path.join(os.path.expanduser("~"), ".infracli", "profile_cache.pickle")
+
+# field: (type, required); list fields name the keys every item must carry,
+# a tuple of keys needs at least one of them (CloudStack networks may only have network_id)
+PROFILE_SCHEMA = {
+    "hostname_pattern": (str, True),
+    "cpu": (int, True),
+    "memory": (int, True),
+    "networks": (list, True),
+    "disks": (list, True),
+    "template_name": (str, False),
+    "template_id": (str, False),
+    "service_offering_id": (str, False),
+    "zone_id": (str, False),
+    "network_ids": (list, False),
+    "domain": (str, False),
+    "power_on": (bool, False),
+    "clone_mode": (str, False),
+    "base_snapshot": (str, False),
+    "instant_parent": (str, False),
+    "count": (int, False),
+    "start_index": (int, False),
+    "matrix": (dict, False)
+}
+LIST_ITEM_KEYS = {
+    "networks": {"name": str, ("vlan", "network_id"): str},
+    "disks": {"name": str, "size_gb": int}
+}
+CLONE_MODES = ("full", "linked", "instant")
+# Keys that control inheritance and fan-out; they never reach a concrete VM spec
+PROFILE_DIRECTIVES = ("extends", "matrix", "count", "start_index")
+
+
+class ProfileError(Exception):
+    pass
+
+
+def merge_profile(base, override):
+    # Mappings merge recursively, everything else (lists included) is replaced
+    merged = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_profile(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def matrix_axes(profile):
+    # Each axis is either a list of values, used as hostname placeholders,
+    # or a mapping of value -> profile overrides, e.g. size: {small: {cpu: 2}}
+    axes = []
+    for axis, values in (profile.get("matrix") or {}).items():
+        if isinstance(values, dict):
+            axes.append((axis, [(str(value), overrides or {}) for value, overrides in values.items()]))
+        else:
+            axes.append((axis, [(value, {}) for value in values]))
+    return axes
+
+
+def expand_profile(profile):
+    # Lazily yields one concrete VM spec per matrix combination and index
+    axes = matrix_axes(profile)
+    base = {key: value for key, value in profile.items() if key not in PROFILE_DIRECTIVES}
+    start = profile.get("start_index", 1)
+    count = profile.get("count", 1)
+    for combination in itertools.product(*(values for _, values in axes)):
+        variables = {axis: value for (axis, _), (value, _) in zip(axes, combination)}
+        spec = base
+        for _, overrides in combination:
+            spec = merge_profile(spec, overrides)
+        for index in range(start, start + count):
+            hostname = profile["hostname_pattern"].format(index=index, **variables)
+            # The concrete name replaces the pattern so the managers' format(index=...) is a no-op
+            yield dict(copy.deepcopy(spec), hostname_pattern=hostname, hostname=hostname, matrix=variables)
+
+
+def validate_profile(profile, base=False):
+    if not isinstance(profile, dict):
+        return ["profile must be a mapping"]
+    errors = []
+    for field, (field_type, required) in PROFILE_SCHEMA.items():
+        if field not in profile:
+            if required and not base:
+                errors.append(f"missing required field '{field}'")
+            continue
+        # bool is an int subclass, but 'cpu: yes' is never intended
+        if not isinstance(profile[field], field_type) or (field_type is int and isinstance(profile[field], bool)):
+            errors.append(f"'{field}' must be {field_type.__name__}")
+    for field, item_keys in LIST_ITEM_KEYS.items():
+        for i, item in enumerate(profile.get(field) or []):
+            if not isinstance(item, dict):
+                errors.append(f"{field}[{i}] must be a mapping")
+                continue
+            for keys, key_type in item_keys.items():
+                if isinstance(keys, tuple):
+                    present = [key for key in keys if key in item]
+                    if not present:
+                        errors.append(f"{field}[{i}] needs one of {', '.join(keys)}")
+                else:
+                    present = [keys]
+                for key in present:
+                    if not isinstance(item.get(key), key_type):
+                        errors.append(f"{field}[{i}].{key} must be {key_type.__name__}")
+    for axis, values in (profile.get("matrix") or {}).items():
+        if not isinstance(values, (list, dict)):
+            errors.append(f"matrix axis '{axis}' must be a list or a mapping of overrides")
+    clone_mode = profile.get("clone_mode", "full")
+    if clone_mode not in CLONE_MODES:
+        errors.append(f"'clone_mode' must be one of {', '.join(CLONE_MODES)}")
+    if clone_mode == "instant" and "instant_parent" not in profile and not base:
+        errors.append("'instant_parent' is required when clone_mode is instant")
+    if errors or base:
+        return errors
+
+    axes = matrix_axes(profile)
+    for axis, values in axes:
+        if not values:
+            errors.append(f"matrix axis '{axis}' has no values")
+        for value, overrides in values:
+            if not isinstance(overrides, dict):
+                errors.append(f"matrix.{axis}.{value} must be a mapping of overrides")
+                continue
+            # Overrides are checked one axis value at a time, without expanding the whole matrix
+            errors.extend(f"matrix.{axis}.{value}: {error}" for error in validate_profile(merge_profile(profile, overrides), True))
+    variables = {axis: values[0][0] for axis, values in axes if values}
+    try:
+        profile["hostname_pattern"].format(index=1, **variables)
+    except (KeyError, IndexError, ValueError) as e:
+        errors.append(f"'hostname_pattern' only supports {{index}} and matrix axis placeholders: {str(e)}")
+    # Without these placeholders every expanded VM would get the same name
+    if profile.get("count", 1) > 1 and "{index" not in profile["hostname_pattern"]:
+        errors.append("'hostname_pattern' needs {index} when count is greater than 1")
+    for axis, values in axes:
+        if len(values) > 1 and "{" + axis not in profile["hostname_pattern"]:
+            errors.append(f"'hostname_pattern' needs {{{axis}}} to tell matrix combinations apart")
+    return errors
+
+
+class ProfileRegistry:
+    # Parses and validates a profile the first time it is requested. Compiled profiles are kept
+    # in a pickle cache keyed by file mtime and size, so unchanged files are never re-parsed.
+    def __init__(self, profiles_path, cache_path=DEFAULT_PROFILE_CACHE):
+        self.profiles_path = profiles_path
+        self.cache_path = cache_path
+        self.lock = threading.Lock()
+        self.entries = None
+        self.dirty = False
+
+    def load_cache(self):
+        try:
+            with open(self.cache_path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, AttributeError):
+            return {}
+
+    def save_cache(self):
+        if not self.cache_path or not self.dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(self.entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.cache_path)
+            self.dirty = False
+        except OSError as e:
+            print(f"Error saving profile cache {self.cache_path}: {str(e)}")
+
+    def path(self, profile_name):
+        return os.path.abspath(os.path.join(self.profiles_path, f"{profile_name}.yaml"))
+
+    def names(self):
+        # Files starting with an underscore are base profiles, only usable through extends
+        if not os.path.isdir(self.profiles_path):
+            return []
+        return sorted(os.path.splitext(f)[0] for f in os.listdir(self.profiles_path) if f.endswith(".yaml") and not f.startswith("_"))
+
+    def signature(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def resolve(self, profile_name, deps, chain=()):
+        if profile_name in chain:
+            raise ProfileError(f"circular extends: {' -> '.join(chain + (profile_name,))}")
+        path = self.path(profile_name)
+        deps[path] = self.signature(path)
+        if deps[path] is None:
+            raise ProfileError(f"Profile {profile_name} not found at {path}")
+        try:
+            with open(path, 'r') as f:
+                profile = yaml.safe_load(f)
+        except yaml.YAMLError as e:
+            raise ProfileError(f"invalid YAML in {profile_name}: {str(e)}")
+        if not isinstance(profile, dict):
+            raise ProfileError(f"{profile_name} must be a mapping")
+
+        parents = profile.pop("extends", None) or []
+        if isinstance(parents, str):
+            parents = [parents]
+        merged = {}
+        # Later parents win over earlier ones, the profile itself wins over all of them
+        for parent in parents:
+            merged = merge_profile(merged, self.resolve(parent, deps, chain + (profile_name,)))
+        return merge_profile(merged, profile)
+
+    def compile(self, profile_name):
+        deps = {}
+        try:
+            profile = self.resolve(profile_name, deps)
+            errors = validate_profile(profile, profile_name.startswith("_"))
+        except ProfileError as e:
+            profile, errors = None, [str(e)]
+        return deps, profile, errors
+
+    def lookup(self, profile_name):
+        path = self.path(profile_name)
+        if self.signature(path) is None:
+            raise ProfileError(f"Profile {profile_name} not found at {path}")
+
+        with self.lock:
+            if self.entries is None:
+                self.entries = self.load_cache() if self.cache_path else {}
+            entry = self.entries.get(path)
+            # A compiled profile stays valid while neither it nor any profile it extends has changed
+            if entry is None or any(self.signature(dep) != signature for dep, signature in entry[0].items()):
+                entry = self.compile(profile_name)
+                self.entries[path] = entry
+                self.dirty = True
+                self.save_cache()
+        return entry[1], entry[2]
+
+    def load(self, profile_name):
+        profile, errors = self.lookup(profile_name)
+        if errors:
+            raise ProfileError(f"Profile {profile_name} is invalid: {'; '.join(errors)}")
+        if profile_name.startswith("_"):
+            raise ProfileError(f"Profile {profile_name} is a base profile and can only be extended")
+        # Callers get their own copy, so one that fills in NIC or IP details cannot change the cached profile
+        return copy.deepcopy(profile)
+
+    def expand(self, profile_name):
+        # Generator over the concrete VM specs of a profile; nothing is materialized up front
+        return expand_profile(self.load(profile_name))
+
+    def get(self, profile_name, default=None):
+        try:
+            return self.load(profile_name)
+        except ProfileError as e:
+            print(str(e))
+            return default
+
+    def validate_all(self):
+        results = {}
+        for profile_name in self.names():
             try:
-                with open(os.path.join(profiles_path, filename), 'r') as f:
-                    profile = yaml.safe_load(f)
-                    profile_name = os.path.splitext(filename)[0]
-                    profiles[profile_name] = profile
-            except Exception as e:
-                print(f"Error loading profile {filename}: {str(e)}")
-    return profiles
+                results[profile_name] = self.lookup(profile_name)[1]
+            except ProfileError as e:
+                results[profile_name] = [str(e)]
+        return results
+
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(profiles_path, cache_path=DEFAULT_PROFILE_CACHE):
+    # One registry per directory per process, shared by the CLI and every manager
+    key = (os.path.abspath(profiles_path), cache_path)
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = ProfileRegistry(profiles_path, cache_path)
+        return _registries[key]
+
+
+def load_profiles(profiles_path):
+    # Kept for the hypervisor managers: profiles are loaded on demand through .get(name)
+    return get_registry(profiles_path)
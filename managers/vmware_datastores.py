@@ -0,0 +1,114 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .purestorage_metrics import ARRAY_ENTITY, DEFAULT_METRICS_DIR, TelemetryStore
+from .timewindow import parse_window
+
+DEFAULT_DATASTORE_CACHE = os.path.join(os.path.expanduser("~"), ".infracli", "datastore_volumes.json")
+
+# ESXi names FlashArray LUNs naa.<Pure Storage OUI 624a9370><24 hex digit volume serial>
+PURE_NAA_PREFIX = "naa.624a9370"
+SERIAL_LENGTH = 24
+
+
+def naa_to_serial(naa):
+    naa = (naa or "").lower()
+    if naa.startswith(PURE_NAA_PREFIX) and len(naa) == len(PURE_NAA_PREFIX) + SERIAL_LENGTH:
+        return naa[len(PURE_NAA_PREFIX):].upper()
+    return None
+
+
+def volumes_by_serial(storage_manager, max_workers=8):
+    # serial -> (array, volume) for every array of the site, one volume listing per array
+    def fetch(array_name):
+        return [(volume["Serial"].upper(), (array_name, volume["Volume"])) for volume in storage_manager.iter_volumes(array_name)]
+
+    array_names = list(storage_manager.arrays.keys())
+    if not array_names:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(array_names)))) as executor:
+        return dict(pair for pairs in executor.map(fetch, array_names) for pair in pairs)
+
+
+def correlate(extents, volumes):
+    # extents: {datastore: [naa, ...]}; a VMFS datastore spanning several LUNs keeps one entry per extent
+    mapping = {}
+    for datastore, naas in extents.items():
+        backing = []
+        for naa in naas:
+            serial = naa_to_serial(naa)
+            if serial in volumes:
+                array_name, volume_name = volumes[serial]
+                backing.append({"naa": naa, "serial": serial, "array": array_name, "volume": volume_name})
+        if backing:
+            mapping[datastore] = backing
+    return mapping
+
+
+class DatastoreVolumeCache:
+    # Datastore -> FlashArray volume mappings per vCenter. Extents rarely change, so a mapping
+    # is reused until it is max_age old or refreshed explicitly.
+    def __init__(self, path=DEFAULT_DATASTORE_CACHE, max_age="7d"):
+        self.path = path
+        self.max_age = parse_window(max_age)
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, vcenter):
+        entry = self.load().get(vcenter)
+        if not entry or time.time() - entry["updated"] > self.max_age:
+            return None
+        return entry["datastores"]
+
+    def put(self, vcenter, mapping):
+        entries = self.load()
+        entries[vcenter] = {"updated": int(time.time()), "datastores": mapping}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+class ArrayLoad:
+    # Array-side load of datastore backing volumes, read from the samples stored by
+    # `storage metrics`; no array is contacted.
+    def __init__(self, metrics_dir=DEFAULT_METRICS_DIR, window="1h"):
+        self.metrics_dir = metrics_dir
+        self.since = int(time.time()) - parse_window(window)
+        self.stores = {}
+
+    def average(self, array_name, entity, metric):
+        if array_name not in self.stores:
+            self.stores[array_name] = TelemetryStore(os.path.join(self.metrics_dir, f"{array_name}.tsdb"))
+        rollup = self.stores[array_name].rollup(entity, metric, self.since)
+        return rollup["avg"] if rollup else None
+
+    def datastore_stats(self, backing):
+        # Latency of the slowest extent and the summed IOPS of all of them; None when nothing is stored
+        stats = {"read_ms": None, "write_ms": None, "iops": None, "array_write_ms": None}
+        for extent in backing:
+            for field, entity, metric in (
+                ("read_ms", extent["volume"], "usec_per_read_op"),
+                ("write_ms", extent["volume"], "usec_per_write_op"),
+                ("array_write_ms", ARRAY_ENTITY, "usec_per_write_op")
+            ):
+                value = self.average(extent["array"], entity, metric)
+                if value is not None:
+                    stats[field] = max(stats[field] or 0, round(value / 1000, 2))
+            for metric in ("reads_per_sec", "writes_per_sec"):
+                value = self.average(extent["array"], extent["volume"], metric)
+                if value is not None:
+                    stats["iops"] = round((stats["iops"] or 0) + value)
+        return stats
+
+    def latency_ms(self, backing):
+        stats = self.datastore_stats(backing)
+        latencies = [stats[field] for field in ("read_ms", "write_ms") if stats[field] is not None]
+        return max(latencies) if latencies else None
@@ -1,15 +1,48 @@
 import os
 import yaml
 import logging
+import ipaddress
+import re
 import time
 import ssl
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pyVim.connect import SmartConnect, Disconnect
-from pyVmomi import vim
+from pyVmomi import vim, vmodl
 from .phpipam_manager import PhpIpamManager
 from .vault_manager import VaultManager
 from .vm_profile_manager import load_profiles
+from .purestorage_metrics import DEFAULT_METRICS_DIR
+from .timewindow import parse_window
+from .vmware_rebalance import HostLoad, VMLoad, cluster_imbalance, plan_moves
+from .hypervisor import Hypervisor, VMRecord
+from .vmware_datastores import DEFAULT_DATASTORE_CACHE, ArrayLoad, DatastoreVolumeCache, correlate, volumes_by_serial
+
+def subnet_mask(mask):
+    # phpIPAM reports the prefix length ("24"), the guest needs a dotted mask
+    mask = str(mask)
+    return mask if '.' in mask else str(ipaddress.IPv4Network(f"0.0.0.0/{mask}").netmask)
+
+def gateway_address(gateway):
+    if isinstance(gateway, dict):
+        return gateway.get('ip_addr')
+    return gateway or None
+
+def dns_server_list(nameservers):
+    # phpIPAM nameserver sets look like {"namesrv1": "10.0.0.1;10.0.0.2", ...}
+    if isinstance(nameservers, dict):
+        nameservers = nameservers.get('namesrv1', '')
+    if isinstance(nameservers, str):
+        nameservers = nameservers.replace(',', ';').split(';')
+    return [server.strip() for server in nameservers or [] if server and server.strip()]
+
+# Sampling period in seconds per --interval; realtime stats are only kept for about an hour
+PERF_INTERVALS = {"realtime": 20, "5m": 300, "30m": 1800, "2h": 7200, "1d": 86400}
+DEFAULT_PERF_COUNTERS = ["cpu.ready.summation", "cpu.usage.average", "mem.vmmemctl.average", "disk.maxTotalLatency.latest"]
+
+class VMManager(Hypervisor):
+    backend = 'vmware'
 
-class VMManager:
     def __init__(self, site_config, profiles_path):
         self.site_config = site_config
         self.vault_manager = VaultManager(site_config)
@@ -78,7 +111,12 @@ class VMManager:
     def select_datastore(self, host, profile):
         try:
             datastore = None
-            max_remaining_capacity = 0
+            # Datastores on a FlashArray volume whose array-side latency is over the limit are
+            # only picked when nothing else fits; without cached mappings or metrics nothing changes
+            mapping = self.datastore_volumes() or {}
+            array_load = ArrayLoad(self.site_config.get('metrics_dir', DEFAULT_METRICS_DIR), self.site_config.get('datastore_latency_window', '1h'))
+            max_latency = self.site_config.get('datastore_max_latency_ms', 2.0)
+            candidates = []
 
             # Calculate total disk size from the profile
             total_disk_size = sum(disk['size_gb'] * 1024**3 for disk in profile['disks'])  # Convert GB to bytes
@@ -90,9 +128,15 @@ class VMManager:
                     usable_capacity = total_capacity * 0.8
                     remaining_capacity = usable_capacity - total_disk_size
 
-                    if remaining_capacity > max_remaining_capacity:
-                        max_remaining_capacity = remaining_capacity
-                        datastore = ds
+                    if remaining_capacity > 0:
+                        latency = array_load.latency_ms(mapping[summary.name]) if summary.name in mapping else None
+                        candidates.append((latency is not None and latency > max_latency, -remaining_capacity, ds, latency))
+
+            if candidates:
+                _, _, datastore, latency = min(candidates, key=lambda c: c[:2])
+                backing = ", ".join(f"{extent['array']}:{extent['volume']}" for extent in mapping.get(datastore.summary.name, []))
+                if backing:
+                    self.logger.info(f"Datastore {datastore.name} is on {backing}, array-side latency {latency if latency is not None else 'unknown'} ms")
 
             if datastore:
                 self.logger.info(f"Selected datastore: {datastore.name}")
@@ -110,6 +154,49 @@ class VMManager:
             self.logger.error(f"Failed to select datastore: {e}")
             return None
 
+    def datastore_extents(self, content):
+        extents = {}
+        for ds, props in self.retrieve_properties(content, vim.Datastore, ['name', 'info']):
+            info = props.get('info')
+            # Only VMFS datastores sit on LUNs; NFS and vVol datastores have no extents
+            if isinstance(info, vim.host.VmfsDatastoreInfo) and info.vmfs:
+                extents[props['name']] = [extent.diskName for extent in info.vmfs.extent]
+        return extents
+
+    def datastore_volumes(self, storage_manager=None, refresh=False):
+        # Cached datastore -> FlashArray volume mapping; rebuilt from NAA IDs and volume serials
+        # when a storage manager is given and the cache is missing, stale or refresh is set
+        cache = DatastoreVolumeCache(self.site_config.get('datastore_cache', DEFAULT_DATASTORE_CACHE))
+        vcenter = self.site_config['vcenter']['host']
+        mapping = None if refresh else cache.get(vcenter)
+        if mapping is None and storage_manager:
+            content = self.service_instance.RetrieveContent()
+            mapping = correlate(self.datastore_extents(content), volumes_by_serial(storage_manager))
+            cache.put(vcenter, mapping)
+        return mapping
+
+    def datastore_report(self, storage_manager=None, refresh=False, window='1h'):
+        mapping = self.datastore_volumes(storage_manager, refresh)
+        if mapping is None:
+            self.logger.error("No datastore to volume mapping cached; run with a storage manager to build it")
+            return []
+        content = self.service_instance.RetrieveContent()
+        array_load = ArrayLoad(self.site_config.get('metrics_dir', DEFAULT_METRICS_DIR), window)
+        rows = []
+        for ds, props in self.retrieve_properties(content, vim.Datastore, ['name', 'summary.type', 'summary.capacity', 'summary.freeSpace']):
+            backing = mapping.get(props['name'], [])
+            row = {
+                "Datastore": props['name'],
+                "Type": props.get('summary.type'),
+                "Capacity (GB)": round(props.get('summary.capacity', 0) / 1024**3),
+                "Free (GB)": round(props.get('summary.freeSpace', 0) / 1024**3),
+                "Array": ", ".join(sorted({extent['array'] for extent in backing})),
+                "Volume": ", ".join(extent['volume'] for extent in backing)
+            }
+            row.update(array_load.datastore_stats(backing))
+            rows.append(row)
+        return sorted(rows, key=lambda row: row["Datastore"])
+
     def get_all_snapshots_names(self, snapshots):
         snapshot_names = []
         for snapshot in snapshots:
@@ -118,7 +205,186 @@ class VMManager:
                 snapshot_names.extend(self.get_all_snapshots_names(snapshot.childSnapshotList))
         return snapshot_names
 
-    def create_vm(self, site, profile):
+    def allocate_network_info(self, profile, vm_name):
+        # One phpIPAM reservation per NIC under the VM name. A NIC that cannot get an address
+        # fails the whole clone; the addresses already reserved for it are released first.
+        network_infos = []
+        for network in profile['networks']:
+            try:
+                network_info = self.phpipam_manager.get_network_info(network['vlan'], vm_name)
+            except Exception as e:
+                self.release_network_info(network_infos)
+                raise RuntimeError(f"Error reserving IP for NIC {network['name']}: {str(e)}")
+            self.logger.info(f"Reserved IP {network_info['ip_address']} for NIC {network['name']}")
+            network_infos.append(network_info)
+        return network_infos
+
+    def release_network_info(self, network_infos):
+        for network_info in network_infos:
+            try:
+                self.phpipam_manager.release_ip(network_info['ip_address'], network_info['subnet_id'])
+                self.logger.info(f"Released IP {network_info['ip_address']}")
+            except Exception as e:
+                self.logger.error(f"Error releasing IP {network_info['ip_address']}: {str(e)}")
+
+    def find_snapshot(self, snapshots, name):
+        for snapshot in snapshots:
+            if snapshot.name == name:
+                return snapshot.snapshot
+            found = self.find_snapshot(snapshot.childSnapshotList, name)
+            if found:
+                return found
+        return None
+
+    def ensure_base_snapshot(self, template_vm, name, resource_pool, host):
+        # Linked clones share the disks of this snapshot; it is created once and reused
+        snapshot = self.find_snapshot(template_vm.snapshot.rootSnapshotList, name) if template_vm.snapshot else None
+        if snapshot:
+            return snapshot
+
+        # Templates cannot be snapshotted, so the template is briefly turned back into a VM
+        is_template = template_vm.config.template
+        if is_template:
+            template_vm.MarkAsVirtualMachine(pool=resource_pool, host=host)
+        try:
+            task = template_vm.CreateSnapshot_Task(name=name, description="Linked clone base created by fscli", memory=False, quiesce=False)
+            self.logger.info(f"Creating base snapshot {name} on {template_vm.name}...")
+            if not self.wait_for_task(task, "Base snapshot creation"):
+                return None
+            return task.info.result
+        finally:
+            if is_template:
+                template_vm.MarkAsTemplate()
+
+    def ensure_powered_on(self, vm):
+        if vm.runtime.powerState == vim.VirtualMachinePowerState.poweredOn:
+            return True
+        self.logger.info(f"Powering on instant clone parent {vm.name}...")
+        return self.wait_for_task(vm.PowerOnVM_Task(), "Parent power on")
+
+    def build_instant_clone_config(self, vm_name, network_infos):
+        # Instant clones take no CustomizationSpec; the parent's guest reads its new identity from guestinfo
+        options = {"guestinfo.hostname": vm_name}
+        for i, network_info in enumerate(network_infos):
+            if not network_info:
+                continue
+            options[f"guestinfo.ipaddress.{i}"] = network_info['ip_address']
+            options[f"guestinfo.netmask.{i}"] = subnet_mask(network_info['subnet_mask'])
+            gateway = gateway_address(network_info['gateway'])
+            if i == 0 and gateway:
+                options["guestinfo.gateway"] = gateway
+            options.setdefault("guestinfo.dns", ",".join(dns_server_list(network_info['dns_servers'])))
+        return [vim.option.OptionValue(key=key, value=value) for key, value in options.items()]
+
+    def build_config_spec(self, vm_name, profile, template_vm, datastore):
+        # Hardware changes applied by the clone itself: template disks/NICs are edited, extra ones added
+        config_spec = vim.vm.ConfigSpec(
+            memoryMB=profile['memory'],
+            numCPUs=profile['cpu'],
+            deviceChange=[]
+        )
+        devices = template_vm.config.hardware.device
+        template_disks = [d for d in devices if isinstance(d, vim.vm.device.VirtualDisk)]
+        template_nics = [d for d in devices if isinstance(d, vim.vm.device.VirtualEthernetCard)]
+        controller = next((d for d in devices if isinstance(d, vim.vm.device.VirtualSCSIController)), None)
+        used_units = {d.unitNumber for d in template_disks if controller and d.controllerKey == controller.key}
+
+        for i, disk in enumerate(profile['disks']):
+            capacity_kb = disk['size_gb'] * 1024 * 1024
+            if i < len(template_disks):
+                # Template disks can only grow, and not at all when they are shared by linked clones
+                if capacity_kb > template_disks[i].capacityInKB and profile.get('clone_mode', 'full') == 'full':
+                    template_disks[i].capacityInKB = capacity_kb
+                    config_spec.deviceChange.append(vim.vm.device.VirtualDeviceSpec(
+                        operation=vim.vm.device.VirtualDeviceSpec.Operation.edit,
+                        device=template_disks[i]
+                    ))
+                continue
+            if not controller:
+                self.logger.error(f"Template has no SCSI controller, cannot add disk {disk['name']}")
+                continue
+            # Unit 7 is reserved for the SCSI controller itself
+            unit_number = next(u for u in range(16) if u != 7 and u not in used_units)
+            used_units.add(unit_number)
+            config_spec.deviceChange.append(vim.vm.device.VirtualDeviceSpec(
+                operation=vim.vm.device.VirtualDeviceSpec.Operation.add,
+                fileOperation=vim.vm.device.VirtualDeviceSpec.FileOperation.create,
+                device=vim.vm.device.VirtualDisk(
+                    backing=vim.vm.device.VirtualDisk.FlatVer2BackingInfo(
+                        datastore=datastore,
+                        diskMode='persistent',
+                        thinProvisioned=disk.get('thin', True)
+                    ),
+                    capacityInKB=capacity_kb,
+                    key=-(i + 1),
+                    unitNumber=unit_number,
+                    controllerKey=controller.key
+                )
+            ))
+
+        for i, network in enumerate(profile['networks']):
+            backing = vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(deviceName=network['name'])
+            if i < len(template_nics):
+                template_nics[i].backing = backing
+                config_spec.deviceChange.append(vim.vm.device.VirtualDeviceSpec(
+                    operation=vim.vm.device.VirtualDeviceSpec.Operation.edit,
+                    device=template_nics[i]
+                ))
+            else:
+                config_spec.deviceChange.append(vim.vm.device.VirtualDeviceSpec(
+                    operation=vim.vm.device.VirtualDeviceSpec.Operation.add,
+                    device=vim.vm.device.VirtualVmxnet3(
+                        backing=backing,
+                        key=-(100 + i),
+                        connectable=vim.vm.device.VirtualDevice.ConnectInfo(startConnected=True, allowGuestControl=True)
+                    )
+                ))
+        return config_spec
+
+    def build_customization_spec(self, vm_name, profile, template_vm, network_infos):
+        # Guest identity and addressing, applied by VMware Tools on first boot
+        adapters = []
+        dns_servers = []
+        # Every NIC has a reserved address here; allocate_network_info fails the clone otherwise
+        for i, network_info in enumerate(network_infos):
+            ip_settings = vim.vm.customization.IPSettings()
+            ip_settings.ip = vim.vm.customization.FixedIp(ipAddress=network_info['ip_address'])
+            ip_settings.subnetMask = subnet_mask(network_info['subnet_mask'])
+            # Only the first NIC gets a default gateway
+            gateway = gateway_address(network_info['gateway'])
+            if i == 0 and gateway:
+                ip_settings.gateway = [gateway]
+            dns_servers = dns_servers or dns_server_list(network_info['dns_servers'])
+            adapters.append(vim.vm.customization.AdapterMapping(adapter=ip_settings))
+
+        host_name = vim.vm.customization.FixedName(name=vm_name)
+        if 'windows' in (template_vm.config.guestId or '').lower():
+            identity = vim.vm.customization.Sysprep(
+                guiUnattended=vim.vm.customization.GuiUnattended(autoLogon=False, autoLogonCount=0, timeZone=profile.get('timezone_id', 85)),
+                userData=vim.vm.customization.UserData(
+                    computerName=host_name,
+                    fullName=profile.get('owner', 'Administrator'),
+                    orgName=profile.get('organization', 'Administrator'),
+                    productId=profile.get('product_key', '')
+                ),
+                identification=vim.vm.customization.Identification(joinWorkgroup=profile.get('workgroup', 'WORKGROUP'))
+            )
+        else:
+            identity = vim.vm.customization.LinuxPrep(
+                hostName=host_name,
+                domain=profile.get('domain', ''),
+                timeZone=profile.get('timezone', 'UTC'),
+                hwClockUTC=True
+            )
+        return vim.vm.customization.Specification(
+            identity=identity,
+            globalIPSettings=vim.vm.customization.GlobalIPSettings(dnsServerList=dns_servers),
+            nicSettingMap=adapters
+        )
+
+    def create_vm(self, profile):
+        network_infos = []
+        task = None
         try:
             content = self.service_instance.RetrieveContent()
             datacenter = content.rootFolder.childEntity[0]
@@ -133,72 +399,60 @@ class VMManager:
                 self.logger.error("Failed to select host or datastore")
                 return
 
-            # Create VM configuration
             vm_name = profile['hostname_pattern'].format(index=1)
-            vm_config = vim.vm.ConfigSpec(
-                name=vm_name,
-                memoryMB=profile['memory'],
-                numCPUs=profile['cpu'],
-            )
+            clone_mode = profile.get('clone_mode', 'full')
 
-            # Add disks
-            for i, disk in enumerate(profile['disks']):
-                disk_spec = vim.vm.device.VirtualDeviceSpec(
-                    operation=vim.vm.device.VirtualDeviceSpec.Operation.add,
-                    device=vim.vm.device.VirtualDisk(
-                        backing=vim.vm.device.VirtualDisk.FlatVer2BackingInfo(
-                            fileName=f"[{datastore.name}] {vm_name}/{disk['name']}.vmdk",
-                            diskMode='persistent'
-                        ),
-                        capacityInKB=disk['size_gb'] * 1024 * 1024,
-                        key=-1,
-                        unitNumber=i,
-                        controllerKey=1000
-                    )
+            if clone_mode == 'instant':
+                parent_vm = self.get_vm_by_name(profile['instant_parent'], content)
+                if not parent_vm:
+                    self.logger.error(f"Instant clone parent {profile['instant_parent']} not found")
+                    return
+                if not self.ensure_powered_on(parent_vm):
+                    return
+                # Forks the running parent's memory and disks; hardware comes from the parent
+                network_infos = self.allocate_network_info(profile, vm_name)
+                instant_spec = vim.vm.InstantCloneSpec(
+                    name=vm_name,
+                    location=vim.vm.RelocateSpec(datastore=datastore, pool=resource_pool, folder=vm_folder),
+                    config=self.build_instant_clone_config(vm_name, network_infos)
                 )
-                vm_config.deviceChange.append(disk_spec)
-
-            # Add network interfaces
-            for i, network in enumerate(profile['networks']):
-                nic_spec = vim.vm.device.VirtualDeviceSpec(
-                    operation=vim.vm.device.VirtualDeviceSpec.Operation.add,
-                    device=vim.vm.device.VirtualVmxnet3(
-                        backing=vim.vm.device.VirtualEthernetCard.NetworkBackingInfo(
-                            deviceName=network['name']
-                        ),
-                        key=-1,
-                        unitNumber=i,
-                        controllerKey=100
-                    )
-                )
-                vm_config.deviceChange.append(nic_spec)
-
-                # Allocate IP for each NIC
-                try:
-                    network_info = self.phpipam_manager.get_network_info(network['vlan'])
-                    self.logger.info(f"Allocated IP {network_info['ip_address']} for NIC {network['name']}")
-                    nic_spec.device.backing.ipAddress = network_info['ip_address']
-                except Exception as e:
-                    self.logger.error(f"Error allocating IP for NIC {network['name']}: {str(e)}")
+                task = parent_vm.InstantClone_Task(spec=instant_spec)
+                self.logger.info(f"Instant cloning VM from {parent_vm.name}...")
+                self.wait_for_task(task, "VM creation")
+                return
 
-            # Clone the VM from the template
             template_vm = self.get_vm_by_name(profile['template_name'], content)
             if not template_vm:
                 self.logger.error(f"Template {profile['template_name']} not found")
                 return
 
+            relocate_spec = vim.vm.RelocateSpec(
+                datastore=datastore,
+                host=host,
+                pool=resource_pool
+            )
+            snapshot = None
+            if clone_mode == 'linked':
+                snapshot = self.ensure_base_snapshot(template_vm, profile.get('base_snapshot', 'fscli-base'), resource_pool, host)
+                if not snapshot:
+                    self.logger.error(f"No base snapshot available on {template_vm.name} for linked clone")
+                    return
+                # Only a delta disk is created; reads fall through to the base snapshot
+                relocate_spec.diskMoveType = 'createNewChildDiskBacking'
+
+            # Hardware, guest customization and power-on all travel with the one CloneVM_Task
+            network_infos = self.allocate_network_info(profile, vm_name)
             clone_spec = vim.vm.CloneSpec(
-                location=vim.vm.RelocateSpec(
-                    datastore=datastore,
-                    host=host,
-                    pool=resource_pool
-                ),
-                powerOn=False,
+                location=relocate_spec,
+                config=self.build_config_spec(vm_name, profile, template_vm, datastore),
+                customization=self.build_customization_spec(vm_name, profile, template_vm, network_infos),
+                snapshot=snapshot,
+                powerOn=profile.get('power_on', True),
                 template=False
             )
 
-            task = template_vm.Clone(folder=vm_folder, name=vm_name, spec=clone_spec)
-            self.logger.info("Cloning VM from template...")
+            task = template_vm.CloneVM_Task(folder=vm_folder, name=vm_name, spec=clone_spec)
+            self.logger.info(f"Cloning VM from template ({clone_mode} clone)...")
 
             self.wait_for_task(task, "VM creation")
 
@@ -208,6 +462,16 @@ class VMManager:
             self.logger.error(f"No permission to access vCenter: {e}")
         except Exception as e:
             self.logger.error(f"Failed to create VM: {e}")
+        finally:
+            # Addresses go back to phpIPAM unless the VM exists or may still appear (timed-out task)
+            if network_infos and (task is None or self.task_failed(task)):
+                self.release_network_info(network_infos)
+
+    def task_failed(self, task):
+        try:
+            return task.info.state == vim.TaskInfo.State.error
+        except Exception:
+            return False
 
     def delete_vm(self, vm_name):
         try:
@@ -230,30 +494,35 @@ class VMManager:
             self.logger.error(f"Failed to delete VM: {e}")
 
     def list_vms(self):
+        # Two PropertyCollector calls cover every VM and host, records are yielded one by one
         try:
             content = self.service_instance.RetrieveContent()
-            vm_list = content.viewManager.CreateContainerView(content.rootFolder, [vim.VirtualMachine], True).view
-            vms = []
-            for vm in vm_list:
-                summary = vm.summary
-                vms.append([
-                    summary.config.name,
-                    summary.config.numCpu,
-                    summary.config.memorySizeMB,
-                    summary.storage.committed / (1024**3),  # Convert bytes to GB
-                    len(self.get_all_snapshots_names(vm.snapshot.rootSnapshotList)) if vm.snapshot else 0
-                ])
-            return vms
+            host_names = {host: props['name'] for host, props in self.retrieve_properties(content, vim.HostSystem, ['name'])}
+            for vm, props in self.retrieve_properties(content, vim.VirtualMachine, [
+                'name', 'config.template', 'config.instanceUuid', 'config.hardware.numCPU', 'config.hardware.memoryMB',
+                'summary.storage.committed', 'runtime.powerState', 'runtime.host', 'snapshot', 'guest.ipAddress'
+            ]):
+                if props.get('config.template'):
+                    continue
+                snapshot = props.get('snapshot')
+                yield VMRecord(
+                    props['name'], self.backend,
+                    vcpu=props.get('config.hardware.numCPU'),
+                    memory_mb=props.get('config.hardware.memoryMB'),
+                    disk_gb=(props.get('summary.storage.committed') or 0) / (1024**3),  # Convert bytes to GB
+                    state=props.get('runtime.powerState'),
+                    snapshot_count=len(self.get_all_snapshots_names(snapshot.rootSnapshotList)) if snapshot else 0,
+                    host=host_names.get(props.get('runtime.host')),
+                    ip_address=props.get('guest.ipAddress'),
+                    uid=props.get('config.instanceUuid')
+                )
 
         except vim.fault.InvalidLogin as e:
             self.logger.error(f"Invalid login credentials: {e}")
-            return []
         except vim.fault.NoPermission as e:
             self.logger.error(f"No permission to access vCenter: {e}")
-            return []
         except Exception as e:
             self.logger.error(f"Failed to list VMs: {e}")
-            return []
 
     def create_snapshot(self, vm_name):
         try:
@@ -275,6 +544,469 @@ class VMManager:
         except Exception as e:
             self.logger.error(f"Failed to create snapshot: {e}")
 
+    def retrieve_properties(self, content, obj_type, path_set, root=None):
+        # One PropertyCollector round trip (plus paging) instead of one per object and property
+        view = content.viewManager.CreateContainerView(root or content.rootFolder, [obj_type], True)
+        try:
+            traversal = vmodl.query.PropertyCollector.TraversalSpec(name='traverseView', path='view', skip=False, type=vim.view.ContainerView)
+            filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+                objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])],
+                propSet=[vmodl.query.PropertyCollector.PropertySpec(type=obj_type, pathSet=path_set)]
+            )
+            collector = content.propertyCollector
+            result = collector.RetrievePropertiesEx([filter_spec], vmodl.query.PropertyCollector.RetrieveOptions())
+            objects = []
+            while result:
+                objects.extend((obj.obj, {prop.name: prop.val for prop in obj.propSet}) for obj in result.objects)
+                result = collector.ContinueRetrievePropertiesEx(result.token) if result.token else None
+            return objects
+        finally:
+            view.Destroy()
+
+    def select_vms(self, content, vm_names=None, folder=None, pattern=None, path_set=None):
+        root = None
+        if folder:
+            root = next((f for f, props in self.retrieve_properties(content, vim.Folder, ['name']) if props['name'] == folder), None)
+            if not root:
+                self.logger.error(f"Folder {folder} not found")
+                return []
+        regex = re.compile(pattern) if pattern else None
+        selected = []
+        for vm, props in self.retrieve_properties(content, vim.VirtualMachine, ['name', 'config.template'] + (path_set or []), root):
+            if props.get('config.template'):
+                continue
+            if vm_names and props['name'] not in vm_names:
+                continue
+            if regex and not regex.search(props['name']):
+                continue
+            selected.append((vm, props))
+        return selected
+
+    def collect_properties(self, content, objects, obj_type, path_set):
+        # Properties of a known set of objects in a single PropertyCollector call
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[vmodl.query.PropertyCollector.ObjectSpec(obj=obj) for obj in objects],
+            propSet=[vmodl.query.PropertyCollector.PropertySpec(type=obj_type, pathSet=path_set)]
+        )
+        return {obj.obj: {prop.name: prop.val for prop in obj.propSet} for obj in content.propertyCollector.RetrieveContents([filter_spec])}
+
+    def wait_for_tasks(self, content, tasks, action_name, timeout=600):
+        # Polls every outstanding task with a single PropertyCollector call per round
+        results = {}
+        pending = dict(tasks)
+        start_time = time.time()
+        interval = 0.5
+        while pending:
+            states = self.collect_properties(content, pending.values(), vim.Task, ['info.state', 'info.error'])
+            for name, task in list(pending.items()):
+                info = states.get(task, {})
+                if info.get('info.state') == vim.TaskInfo.State.success:
+                    results[name] = True
+                elif info.get('info.state') == vim.TaskInfo.State.error:
+                    self.logger.error(f"Error during {action_name} for {name}: {info.get('info.error')}")
+                    results[name] = False
+                else:
+                    continue
+                del pending[name]
+            if not pending:
+                break
+            if time.time() - start_time > timeout:
+                for name in pending:
+                    self.logger.error(f"Error: {action_name} task for {name} timed out")
+                    results[name] = False
+                break
+            time.sleep(interval)
+            interval = min(interval * 2, 5)
+        return results
+
+    def wait_for_power_state(self, content, vms, power_state, action_name, timeout=600):
+        # Guest shutdowns have no task, so completion is read from runtime.powerState for all VMs at once
+        results = {}
+        pending = dict(vms)
+        start_time = time.time()
+        interval = 1
+        while pending:
+            states = self.collect_properties(content, pending.values(), vim.VirtualMachine, ['runtime.powerState'])
+            for name, vm in list(pending.items()):
+                if states.get(vm, {}).get('runtime.powerState') == power_state:
+                    results[name] = True
+                    del pending[name]
+            if not pending:
+                break
+            if time.time() - start_time > timeout:
+                for name in pending:
+                    self.logger.error(f"Error: {action_name} for {name} timed out")
+                    results[name] = False
+                break
+            time.sleep(interval)
+            interval = min(interval * 2, 10)
+        return results
+
+    def wait_for_guest_reboot(self, content, vms, action_name, timeout=600):
+        # Guest reboots have no task and keep the VM powered on, so a reboot is complete once
+        # VMware Tools report the guest running again after having seen it go down
+        results = {}
+        pending = dict(vms)
+        went_down = set()
+        start_time = time.time()
+        while pending:
+            states = self.collect_properties(content, pending.values(), vim.VirtualMachine, ['guest.guestState'])
+            for name, vm in list(pending.items()):
+                if states.get(vm, {}).get('guest.guestState') != 'running':
+                    went_down.add(name)
+                elif name in went_down:
+                    results[name] = True
+                    del pending[name]
+            if not pending:
+                break
+            if time.time() - start_time > timeout:
+                for name in pending:
+                    self.logger.error(f"Error: {action_name} for {name} timed out")
+                    results[name] = False
+                break
+            # Short fixed interval, a quick reboot must not slip between two polls
+            time.sleep(1)
+        return results
+
+    def power_vms(self, operation, vm_names=None, pattern=None, hard=False, timeout=600):
+        try:
+            content = self.service_instance.RetrieveContent()
+            vms = self.select_vms(content, vm_names, None, pattern, ['runtime.powerState', 'guest.toolsRunningStatus'])
+            if vm_names:
+                for name in set(vm_names) - {props['name'] for _, props in vms}:
+                    self.logger.error(f"VM {name} not found")
+            results = {}
+            targets = {}
+            for vm, props in vms:
+                state = props.get('runtime.powerState')
+                if operation == 'on' and state == vim.VirtualMachinePowerState.poweredOn:
+                    results[props['name']] = "already on"
+                elif operation in ('off', 'reboot') and state == vim.VirtualMachinePowerState.poweredOff:
+                    results[props['name']] = "already off"
+                else:
+                    targets[props['name']] = (vm, props.get('guest.toolsRunningStatus') == 'guestToolsRunning')
+            if not targets:
+                return results
+
+            def record(outcomes, done):
+                for name, ok in outcomes.items():
+                    results[name] = done if ok else "failed"
+
+            def failed(name, message):
+                results[name] = "failed"
+
+            if operation == 'on':
+                # One PowerOnMultiVM_Task per datacenter; its result lists one child task per VM
+                names = {vm: name for name, (vm, _) in targets.items()}
+                members = {}
+                for datacenter, props in self.retrieve_properties(content, vim.Datacenter, ['name']):
+                    vms_in_datacenter = [vm for vm, _ in self.retrieve_properties(content, vim.VirtualMachine, ['name'], datacenter) if vm in names]
+                    if vms_in_datacenter:
+                        members[props['name']] = (datacenter, vms_in_datacenter)
+                for name in set(targets) - {names[vm] for _, vms_in_datacenter in members.values() for vm in vms_in_datacenter}:
+                    self.logger.error(f"Datacenter of VM {name} not found")
+                    results[name] = "failed"
+
+                def datacenter_failed(datacenter_name, message):
+                    results.update({names[vm]: "failed" for vm in members[datacenter_name][1]})
+
+                multi_tasks = self.start_tasks(
+                    members.items(), "Power on",
+                    lambda member: member[0].PowerOnMultiVM_Task(vm=member[1]),
+                    datacenter_failed
+                )
+                self.logger.info(f"Powering on {len(targets)} VMs in {len(members)} datacenters...")
+                tasks = {}
+                for datacenter_name, ok in self.wait_for_tasks(content, multi_tasks, "Power on", timeout).items():
+                    if not ok:
+                        datacenter_failed(datacenter_name, None)
+                        continue
+                    result = multi_tasks[datacenter_name].info.result
+                    # Entries for VMs we did not ask for (vm unset or unknown) are logged, not reported
+                    for not_attempted in result.notAttempted:
+                        name = names.get(not_attempted.vm)
+                        self.logger.error(f"Power on not attempted for {name or not_attempted.vm}: {not_attempted.fault.localizedMessage}")
+                        if name:
+                            results[name] = "failed"
+                    for attempted in result.attempted:
+                        name = names.get(attempted.vm)
+                        if not name:
+                            self.logger.warning(f"Power on attempted for unexpected VM {attempted.vm}")
+                        elif attempted.task:
+                            tasks[name] = attempted.task
+                        else:
+                            results[name] = "on"
+                record(self.wait_for_tasks(content, tasks, "Power on", timeout), "on")
+
+            elif operation == 'off':
+                # Guests with VMware Tools are shut down cleanly unless --hard; the rest are powered off
+                soft = [(name, vm) for name, (vm, tools) in targets.items() if tools and not hard]
+                forced = [(name, vm) for name, (vm, tools) in targets.items() if not tools or hard]
+                tasks = self.start_tasks(forced, "Power off", lambda vm: vm.PowerOffVM_Task(), failed)
+                shutdowns = self.start_tasks(soft, "Guest shutdown", lambda vm: vm.ShutdownGuest(), failed)
+                self.logger.info(f"Powering off {len(tasks) + len(shutdowns)} VMs ({len(shutdowns)} guest shutdowns)...")
+                record(self.wait_for_tasks(content, tasks, "Power off", timeout), "off")
+                record(self.wait_for_power_state(content, {name: targets[name][0] for name in shutdowns}, vim.VirtualMachinePowerState.poweredOff, "Guest shutdown", timeout), "off")
+
+            elif operation == 'reboot':
+                soft = [(name, vm) for name, (vm, tools) in targets.items() if tools and not hard]
+                forced = [(name, vm) for name, (vm, tools) in targets.items() if not tools or hard]
+                tasks = self.start_tasks(forced, "Reset", lambda vm: vm.ResetVM_Task(), failed)
+                reboots = self.start_tasks(soft, "Guest reboot", lambda vm: vm.RebootGuest(), failed)
+                self.logger.info(f"Rebooting {len(tasks) + len(reboots)} VMs ({len(reboots)} guest reboots)...")
+                record(self.wait_for_tasks(content, tasks, "Reset", timeout), "reset")
+                record(self.wait_for_guest_reboot(content, {name: targets[name][0] for name in reboots}, "Guest reboot", timeout), "rebooted")
+            return results
+
+        except vim.fault.InvalidLogin as e:
+            self.logger.error(f"Invalid login credentials: {e}")
+        except vim.fault.NoPermission as e:
+            self.logger.error(f"No permission to access vCenter: {e}")
+        except Exception as e:
+            self.logger.error(f"Failed to change VM power state: {e}")
+        return {}
+
+    def flatten_snapshots(self, snapshots):
+        for snapshot in snapshots:
+            yield snapshot
+            yield from self.flatten_snapshots(snapshot.childSnapshotList)
+
+    def start_tasks(self, targets, action_name, start, failed):
+        # Starts one task per (name, object); a VM that refuses (invalid state, busy, ...) is
+        # handed to failed(name, message) and the rest of the batch still runs
+        tasks = {}
+        for name, obj in targets:
+            try:
+                tasks[name] = start(obj)
+            except Exception as e:
+                # vSphere faults carry a short msg; their str() is the whole fault object
+                message = getattr(e, 'msg', None) or str(e)
+                self.logger.error(f"Error starting {action_name} for {name}: {message}")
+                failed(name, f"{action_name}: {message}")
+        return tasks
+
+    def snapshot_vms(self, prefix, vm_names=None, folder=None, pattern=None, retention=None, consolidate=False, memory=False, quiesce=False, take=True):
+        try:
+            content = self.service_instance.RetrieveContent()
+            vms = self.select_vms(content, vm_names, folder, pattern, ['snapshot'])
+            if not vms:
+                self.logger.warning("No VMs matched")
+                return {}
+            results = {props['name']: {"taken": False, "pruned": 0, "consolidated": False} for _, props in vms}
+
+            def failed(name, message):
+                results[name].setdefault("errors", []).append(message)
+
+            # All snapshot tasks are started first, then waited on together
+            if take:
+                snapshot_name = f"{prefix}-{time.strftime('%Y%m%d%H%M%S')}"
+                tasks = self.start_tasks(
+                    [(props['name'], vm) for vm, props in vms], "Snapshot creation",
+                    lambda vm: vm.CreateSnapshot_Task(name=snapshot_name, description="Snapshot created by fscli", memory=memory, quiesce=quiesce),
+                    failed
+                )
+                self.logger.info(f"Creating snapshot {snapshot_name} on {len(tasks)} VMs...")
+                for name, ok in self.wait_for_tasks(content, tasks, "Snapshot creation").items():
+                    results[name]["taken"] = ok
+
+            if retention:
+                # Only snapshots carrying our prefix are candidates, manual snapshots are left alone
+                cutoff = datetime.now(timezone.utc).timestamp() - parse_window(retention)
+                expired = {
+                    props['name']: [
+                        s.snapshot for s in self.flatten_snapshots(props['snapshot'].rootSnapshotList if props.get('snapshot') else [])
+                        if s.name.startswith(f"{prefix}-") and s.createTime.timestamp() < cutoff
+                    ]
+                    for _, props in vms
+                }
+                # A VM runs one snapshot removal at a time, so removals go in waves of one per VM
+                while any(expired.values()):
+                    tasks = self.start_tasks(
+                        [(name, queue.pop(0)) for name, queue in expired.items() if queue], "Snapshot removal",
+                        lambda snapshot: snapshot.RemoveSnapshot_Task(removeChildren=False, consolidate=True),
+                        failed
+                    )
+                    self.logger.info(f"Removing {len(tasks)} expired snapshots...")
+                    for name, ok in self.wait_for_tasks(content, tasks, "Snapshot removal").items():
+                        results[name]["pruned"] += ok
+
+            if consolidate:
+                selected = set(results)
+                needs_consolidation = [
+                    (vm, props['name']) for vm, props in self.select_vms(content, selected, folder, pattern, ['runtime.consolidationNeeded'])
+                    if props.get('runtime.consolidationNeeded')
+                ]
+                if needs_consolidation:
+                    tasks = self.start_tasks([(name, vm) for vm, name in needs_consolidation], "Disk consolidation", lambda vm: vm.ConsolidateVMDisks_Task(), failed)
+                    self.logger.info(f"Consolidating disks on {len(tasks)} VMs...")
+                    for name, ok in self.wait_for_tasks(content, tasks, "Disk consolidation").items():
+                        results[name]["consolidated"] = ok
+            return results
+
+        except vim.fault.InvalidLogin as e:
+            self.logger.error(f"Invalid login credentials: {e}")
+        except vim.fault.NoPermission as e:
+            self.logger.error(f"No permission to access vCenter: {e}")
+        except Exception as e:
+            self.logger.error(f"Failed to snapshot VMs: {e}")
+        return {}
+
+    def perf_counters(self, content):
+        # Counter IDs differ between vCenters; the full catalogue is read once per manager
+        if getattr(self, '_perf_counters', None) is None:
+            self._perf_counters = {
+                f"{c.groupInfo.key}.{c.nameInfo.key}.{c.rollupType}": c
+                for c in content.perfManager.perfCounter
+            }
+        return self._perf_counters
+
+    def query_perf_batch(self, content, entities, metric_ids, interval_id, start_time, end_time):
+        specs = [
+            vim.PerformanceManager.QuerySpec(
+                entity=entity, metricId=metric_ids, intervalId=interval_id,
+                startTime=start_time, endTime=end_time, format='normal'
+            )
+            for entity in entities
+        ]
+        return content.perfManager.QueryPerf(querySpec=specs)
+
+    def vm_stats(self, counters=None, vm_names=None, folder=None, pattern=None, interval="realtime", window="1h", top=None, batch_size=64):
+        try:
+            content = self.service_instance.RetrieveContent()
+            catalogue = self.perf_counters(content)
+            counters = counters or DEFAULT_PERF_COUNTERS
+            unknown = [name for name in counters if name not in catalogue]
+            if unknown:
+                self.logger.error(f"Unknown performance counters: {', '.join(unknown)}")
+                return []
+            metric_ids = [vim.PerformanceManager.MetricId(counterId=catalogue[name].key, instance="") for name in counters]
+            names_by_key = {catalogue[name].key: name for name in counters}
+
+            # Only powered-on VMs have samples to report
+            vms = [
+                (vm, props['name']) for vm, props in self.select_vms(content, vm_names, folder, pattern, ['runtime.powerState'])
+                if props.get('runtime.powerState') == vim.VirtualMachinePowerState.poweredOn
+            ]
+            if not vms:
+                self.logger.warning("No powered-on VMs matched")
+                return []
+
+            interval_id = PERF_INTERVALS[interval]
+            end_time = datetime.now(timezone.utc)
+            start_time = end_time - timedelta(seconds=parse_window(window))
+            entity_names = {vm: name for vm, name in vms}
+            batches = [[vm for vm, _ in vms[i:i + batch_size]] for i in range(0, len(vms), batch_size)]
+            # Many entities per QueryPerf call, a few calls in flight at once
+            with ThreadPoolExecutor(max_workers=min(4, len(batches))) as executor:
+                results = executor.map(lambda batch: self.query_perf_batch(content, batch, metric_ids, interval_id, start_time, end_time), batches)
+                entity_metrics = [metrics for batch in results for metrics in batch]
+
+            rows = []
+            for entity_metric in entity_metrics:
+                row = {"VM Name": entity_names.get(entity_metric.entity, str(entity_metric.entity))}
+                for series in entity_metric.value:
+                    name = names_by_key.get(series.id.counterId)
+                    values = [v for v in series.value if v >= 0]
+                    if not name or not values:
+                        continue
+                    row[name] = self.scale_perf_value(catalogue[name], sum(values) / len(values), interval_id)
+                    row[f"{name} (max)"] = self.scale_perf_value(catalogue[name], max(values), interval_id)
+                rows.append(row)
+
+            # Top-N is ranked by the average of the first counter
+            rows.sort(key=lambda row: row.get(counters[0], 0), reverse=True)
+            return rows[:top] if top else rows
+
+        except vim.fault.InvalidLogin as e:
+            self.logger.error(f"Invalid login credentials: {e}")
+        except vim.fault.NoPermission as e:
+            self.logger.error(f"No permission to access vCenter: {e}")
+        except Exception as e:
+            self.logger.error(f"Failed to query VM stats: {e}")
+        return []
+
+    def scale_perf_value(self, counter, value, interval_id):
+        # Percent counters are reported in hundredths; summation counters such as cpu.ready are
+        # milliseconds per sample, turned into a percentage of the sampling period
+        if counter.unitInfo.key == 'percent':
+            return round(value / 100, 2)
+        if counter.rollupType == 'summation' and counter.unitInfo.key == 'millisecond':
+            return round(value / (interval_id * 1000) * 100, 2)
+        return round(value, 2)
+
+    def load_snapshot(self, content, cluster=None):
+        # Host and VM utilisation in two PropertyCollector calls, taken at the same moment
+        hosts = {}
+        for host, props in self.retrieve_properties(content, vim.HostSystem, [
+            'name', 'parent', 'runtime.connectionState', 'runtime.inMaintenanceMode',
+            'summary.hardware.cpuMhz', 'summary.hardware.numCpuCores', 'summary.hardware.memorySize',
+            'summary.quickStats.overallCpuUsage', 'summary.quickStats.overallMemoryUsage'
+        ]):
+            if props['runtime.connectionState'] != 'connected' or props['runtime.inMaintenanceMode']:
+                continue
+            cluster_name = props['parent'].name
+            if cluster and cluster_name != cluster:
+                continue
+            hosts[host] = HostLoad(
+                props['name'], cluster_name,
+                props['summary.hardware.cpuMhz'] * props['summary.hardware.numCpuCores'],
+                props['summary.hardware.memorySize'] / (1024 * 1024),
+                props.get('summary.quickStats.overallCpuUsage') or 0,
+                props.get('summary.quickStats.overallMemoryUsage') or 0
+            )
+        vms = {}
+        for vm, props in self.retrieve_properties(content, vim.VirtualMachine, [
+            'name', 'runtime.host', 'runtime.powerState', 'config.template',
+            'summary.quickStats.overallCpuUsage', 'summary.quickStats.hostMemoryUsage'
+        ]):
+            if props.get('config.template') or props.get('runtime.powerState') != vim.VirtualMachinePowerState.poweredOn:
+                continue
+            host = hosts.get(props.get('runtime.host'))
+            if host:
+                vms[vm] = VMLoad(props['name'], host.name, props.get('summary.quickStats.overallCpuUsage') or 0, props.get('summary.quickStats.hostMemoryUsage') or 0)
+        return hosts, vms
+
+    def rebalance(self, cluster=None, threshold=0.1, max_moves=10, execute=False, max_concurrent=2):
+        try:
+            content = self.service_instance.RetrieveContent()
+            hosts, vms = self.load_snapshot(content, cluster)
+            if not hosts:
+                self.logger.warning("No connected hosts found")
+                return [], 0.0, 0.0
+
+            host_loads = list(hosts.values())
+            before = cluster_imbalance(host_loads)
+            moves = plan_moves(host_loads, list(vms.values()), threshold, max_moves)
+            after = cluster_imbalance(host_loads)
+            self.logger.info(f"Imbalance {before:.2f} -> {after:.2f} with {len(moves)} migrations")
+            plan = [{"VM Name": vm.name, "From": source, "To": target, "CPU MHz": vm.cpu, "Memory MB": vm.mem, "Result": "planned"} for vm, source, target in moves]
+
+            if execute and moves:
+                host_objects = {load.name: host for host, load in hosts.items()}
+                vm_objects = {load.name: vm for vm, load in vms.items()}
+                # Migrations run in waves of max_concurrent so the vMotion network is not flooded
+                for i in range(0, len(plan), max_concurrent):
+                    wave = plan[i:i + max_concurrent]
+                    tasks = {
+                        row["VM Name"]: vm_objects[row["VM Name"]].MigrateVM_Task(
+                            host=host_objects[row["To"]], priority=vim.VirtualMachine.MovePriority.defaultPriority
+                        )
+                        for row in wave
+                    }
+                    self.logger.info(f"Migrating {', '.join(tasks)}...")
+                    results = self.wait_for_tasks(content, tasks, "VM migration", timeout=3600)
+                    for row in wave:
+                        row["Result"] = "migrated" if results.get(row["VM Name"]) else "failed"
+            return plan, before, after
+
+        except vim.fault.InvalidLogin as e:
+            self.logger.error(f"Invalid login credentials: {e}")
+        except vim.fault.NoPermission as e:
+            self.logger.error(f"No permission to access vCenter: {e}")
+        except Exception as e:
+            self.logger.error(f"Failed to rebalance hosts: {e}")
+        return [], 0.0, 0.0
+
     def modify_vm(self, vm_name, profile):
         try:
             content = self.service_instance.RetrieveContent()
@@ -341,14 +1073,18 @@ class VMManager:
     def wait_for_task(self, task, action_name):
         timeout = 600  # Timeout in seconds
         start_time = time.time()
+        interval = 0.5
 
-        while task.info.state == vim.TaskInfo.State.running:
+        while task.info.state in (vim.TaskInfo.State.queued, vim.TaskInfo.State.running):
             if time.time() - start_time > timeout:
                 self.logger.error(f"Error: {action_name} task timed out")
-                return
-            time.sleep(5)  # Sleep for 5 seconds before checking again
+                return False
+            # Short tasks such as instant clones finish in seconds, so polling starts fast and backs off to 5s
+            time.sleep(interval)
+            interval = min(interval * 2, 5)
 
         if task.info.state == vim.TaskInfo.State.success:
             self.logger.info(f"{action_name} completed successfully")
-        else:
-            self.logger.error(f"Error during {action_name}: {task.info.error}")
+            return True
+        self.logger.error(f"Error during {action_name}: {task.info.error}")
+        return False
@@ -0,0 +1,89 @@
+class HostLoad:
+    def __init__(self, name, cluster, cpu_capacity, mem_capacity, cpu_used, mem_used):
+        self.name = name
+        self.cluster = cluster
+        self.cpu_capacity = cpu_capacity
+        self.mem_capacity = mem_capacity
+        self.cpu_used = cpu_used
+        self.mem_used = mem_used
+
+    def score(self, cpu_delta=0, mem_delta=0):
+        # A host is as loaded as its most contended resource
+        return max((self.cpu_used + cpu_delta) / self.cpu_capacity, (self.mem_used + mem_delta) / self.mem_capacity)
+
+
+class VMLoad:
+    def __init__(self, name, host, cpu, mem):
+        self.name = name
+        self.host = host
+        self.cpu = cpu
+        self.mem = mem
+
+
+def imbalance(hosts):
+    scores = [host.score() for host in hosts]
+    return max(scores) - min(scores) if scores else 0.0
+
+
+def by_cluster(hosts):
+    clusters = {}
+    for host in hosts:
+        clusters.setdefault(host.cluster, []).append(host)
+    return list(clusters.values())
+
+
+def cluster_imbalance(hosts):
+    # Worst spread of any cluster; the spread across clusters can never be closed by vMotion
+    return max((imbalance(cluster_hosts) for cluster_hosts in by_cluster(hosts)), default=0.0)
+
+
+def plan_moves(hosts, vms, threshold=0.1, max_moves=10, headroom=0.9):
+    # VMs only move inside their cluster, so each cluster is balanced on its own; the busiest
+    # cluster goes first and all of them share the max_moves budget
+    moves = []
+    for cluster_hosts in sorted(by_cluster(hosts), key=imbalance, reverse=True):
+        if len(moves) >= max_moves:
+            break
+        moves.extend(plan_cluster_moves(cluster_hosts, vms, threshold, max_moves - len(moves), headroom))
+    return moves
+
+
+def plan_cluster_moves(hosts, vms, threshold, max_moves, headroom):
+    # Greedy: repeatedly take the single move off the busiest host that lowers the busiest/target
+    # pair the most, until the spread is under the threshold or no move helps. Each VM moves once.
+    by_name = {host.name: host for host in hosts}
+    candidates = {}
+    for vm in vms:
+        if vm.host in by_name:
+            candidates.setdefault(vm.host, []).append(vm)
+    moved = set()
+    moves = []
+
+    while len(moves) < max_moves and imbalance(hosts) > threshold:
+        source = max(hosts, key=lambda h: h.score())
+        best = None
+        for vm in candidates.get(source.name, []):
+            if vm.name in moved:
+                continue
+            for target in hosts:
+                if target is source:
+                    continue
+                target_score = target.score(vm.cpu, vm.mem)
+                if target_score > headroom:
+                    continue
+                peak = max(source.score(-vm.cpu, -vm.mem), target_score)
+                if peak < source.score() and (best is None or peak < best[0]):
+                    best = (peak, vm, target)
+        if best is None:
+            break
+
+        _, vm, target = best
+        source.cpu_used -= vm.cpu
+        source.mem_used -= vm.mem
+        target.cpu_used += vm.cpu
+        target.mem_used += vm.mem
+        candidates[source.name].remove(vm)
+        candidates.setdefault(target.name, []).append(vm)
+        moved.add(vm.name)
+        moves.append((vm, source.name, target.name))
+    return moves
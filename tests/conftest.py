@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The managers are imported as the CLI does (from the repo root); the Zabbix scripts import
+# each other by module name from their own directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "zabbix"))
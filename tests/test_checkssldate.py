@@ -0,0 +1,34 @@
+import datetime
+
+from checkssldate import MAX_RECHECK_DAYS, MIN_RECHECK_DAYS, recheck_days, update_state
+
+NOW = datetime.datetime(2026, 10, 19)
+
+
+def cert(fingerprint, expires):
+    return {"host": "web", "port": 443, "fingerprint": fingerprint, "not_valid_after": expires.isoformat()}
+
+
+def test_recheck_days_follows_remaining_validity():
+    assert recheck_days(cert("a", NOW + datetime.timedelta(days=10)), NOW) == MIN_RECHECK_DAYS
+    assert recheck_days(cert("a", NOW + datetime.timedelta(days=60)), NOW) == 15
+    assert recheck_days(cert("a", NOW + datetime.timedelta(days=800)), NOW) == MAX_RECHECK_DAYS
+    assert recheck_days(dict(cert("a", NOW + datetime.timedelta(days=800)), rotation_days=40), NOW) == 10
+
+
+def test_failed_scan_is_retried_at_the_minimum_interval():
+    state = update_state({}, [cert("a", NOW + datetime.timedelta(days=800))], NOW)
+    state = update_state(state, [{"host": "web", "port": 443, "error": "timed out"}], NOW)
+    entry = state["web:443"]
+    # The last known certificate is kept for the report, but does not push the retry out
+    assert entry["fingerprint"] == "a"
+    assert entry["next_check"] == (NOW + datetime.timedelta(days=MIN_RECHECK_DAYS)).isoformat()
+
+
+def test_rotation_is_detected_and_shared_endpoints_are_rechecked():
+    expires = NOW + datetime.timedelta(days=800)
+    state = update_state({}, [cert("a", expires), dict(cert("a", expires), host="api")], NOW - datetime.timedelta(days=90))
+    state = update_state(state, [cert("b", expires)], NOW)
+    assert state["web:443"]["rotated"] is True
+    assert state["web:443"]["rotation_days"] == 90
+    assert state["api:443"]["next_check"] == NOW.isoformat()
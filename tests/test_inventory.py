@@ -0,0 +1,63 @@
+import pytest
+
+from managers.inventory import Inventory
+
+
+@pytest.fixture
+def inventory(tmp_path):
+    inventory = Inventory(str(tmp_path / "inventory.sqlite3"))
+    yield inventory
+    inventory.close()
+
+
+def vm_row(name, state="poweredOn", ip=None):
+    return (name, "vmware", f"uid-{name}", 2, 4096, 40.0, state, "esx01", ip)
+
+
+def test_replace_writes_only_the_difference(inventory):
+    assert inventory.replace("vms", "ist", "vc01", [vm_row("a"), vm_row("b")]) == (2, 2, 0, 0)
+    assert inventory.replace("vms", "ist", "vc01", [vm_row("a", "poweredOff"), vm_row("c")]) == (2, 1, 1, 1)
+    assert sorted((r["name"], r["state"]) for r in inventory.rows("vms", "ist")) == [("a", "poweredOff"), ("c", "poweredOn")]
+
+
+def test_replace_is_scoped_by_source(inventory):
+    inventory.replace("vms", "ist", "vc01", [vm_row("a")])
+    inventory.replace("vms", "ist", "vc02", [vm_row("b")])
+    assert sorted(r["name"] for r in inventory.rows("vms", "ist")) == ["a", "b"]
+
+
+def test_failed_fetch_keeps_stored_rows(inventory):
+    inventory.sync("ist", [("vmware", "vc01", lambda: {"vms": [vm_row("a")]})])
+
+    def fail():
+        raise ConnectionError("vc01 unreachable")
+
+    stats = inventory.sync("ist", [("vmware", "vc01", fail)])
+    assert stats[0]["error"] == "vc01 unreachable"
+    assert [r["name"] for r in inventory.rows("vms", "ist")] == ["a"]
+    assert inventory.sync_stats("ist")[0]["error"] == "vc01 unreachable"
+
+
+def test_empty_fetch_over_stored_rows_needs_allow_empty(inventory):
+    inventory.sync("ist", [("vmware", "vc01", lambda: {"vms": [vm_row("a")]})])
+
+    stats = inventory.sync("ist", [("vmware", "vc01", lambda: {"vms": []})])
+    assert stats[0]["error"] and stats[0]["deleted"] == 0
+    assert len(inventory.rows("vms", "ist")) == 1
+
+    stats = inventory.sync("ist", [("vmware", "vc01", lambda: {"vms": []})], allow_empty=True)
+    assert stats[0]["error"] is None and stats[0]["deleted"] == 1
+    assert inventory.rows("vms", "ist") == []
+
+
+def test_queries_join_the_sources(inventory):
+    inventory.replace("vms", "ist", "vc01", [vm_row("web1", ip="10.0.0.5")])
+    inventory.replace("ip_addresses", "ist", "ipam", [("10.0.0.5", "10.0.0.0/24", "web1", None, None)])
+    inventory.replace("dns_records", "ist", "example.com", [("web1", "A", "10.0.0.5", 3600)])
+    assert sorted(r["kind"] for r in inventory.find_ip("10.0.0.5")) == ["dns", "ipam", "vm"]
+
+
+def test_run_sql_is_read_only(inventory):
+    with pytest.raises(Exception):
+        inventory.run_sql("DELETE FROM vms")
+    assert inventory.run_sql("SELECT count(*) AS n FROM vms") == [{"n": 0}]
@@ -0,0 +1,48 @@
+from proxy_autotune import APPLY_DEFAULTS, CONTROLLER_DEFAULTS, propose_count, should_apply
+
+POLLER = {"config_key": "StartPollers", "step": 10, "min": 5, "max": 200}
+CONTROLLER = dict(CONTROLLER_DEFAULTS, decision_samples=3)
+
+
+def history(busy_values, count=10, start=0):
+    return [
+        {"time": start + i * 60, "busy": {"poller": busy}, "counts": {"StartPollers": count}, "changes": {}}
+        for i, busy in enumerate(busy_values)
+    ]
+
+
+def test_scales_up_when_busy():
+    samples = history([95, 95, 95])
+    proposed, reason = propose_count(samples, "poller", POLLER, 10, CONTROLLER, 85, samples[-1]["time"])
+    assert proposed == 20 and "> 85%" in reason
+
+
+def test_holds_between_thresholds_and_within_cooldown():
+    samples = history([50, 50, 50])
+    assert propose_count(samples, "poller", POLLER, 10, CONTROLLER, 85, samples[-1]["time"]) == (10, None)
+
+    samples = history([95, 95, 95])
+    samples[-1]["changes"] = {"StartPollers": 10}
+    assert propose_count(samples, "poller", POLLER, 10, CONTROLLER, 85, samples[-1]["time"]) == (10, None)
+
+
+def test_missing_readings_hold_the_count():
+    samples = history([95, None, 95])
+    assert propose_count(samples, "poller", POLLER, 10, CONTROLLER, 85, samples[-1]["time"]) == (10, None)
+
+
+def test_scales_down_after_the_longer_cooldown():
+    samples = history([10, 10, 10], count=40)
+    proposed, _ = propose_count(samples, "poller", POLLER, 40, CONTROLLER, 85, samples[-1]["time"])
+    assert proposed == 30
+
+
+def test_should_apply_waits_for_batch_window_and_restart_interval():
+    apply_cfg = dict(APPLY_DEFAULTS, runtime_parameters={"CacheSize": ["config_cache_reload"]})
+    now = 10000
+    assert not should_apply({"pending": {}}, apply_cfg, now)
+    assert not should_apply({"pending": {"StartPollers": 20}, "pending_since": now - 60}, apply_cfg, now)
+    assert should_apply({"pending": {"StartPollers": 20}, "pending_since": now - 3600}, apply_cfg, now)
+    assert not should_apply({"pending": {"StartPollers": 20}, "pending_since": now - 3600, "last_restart": now - 600}, apply_cfg, now)
+    # Runtime parameters need no restart, so the restart interval does not apply
+    assert should_apply({"pending": {"CacheSize": 64}, "pending_since": now - 3600, "last_restart": now - 600}, apply_cfg, now)
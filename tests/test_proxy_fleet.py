@@ -0,0 +1,40 @@
+import json
+
+import proxy_fleet
+
+CFG = {"threshold": 85, "parameters": {"poller": {"config_key": "StartPollers", "step": 10, "min": 5, "max": 200}}}
+
+
+def run(monkeypatch, tmp_path, busy, count, now):
+    sample = {"time": now, "busy": {"poller": busy}, "counts": {"StartPollers": count}, "cache_sizes": {},
+              "cache_pused": {}, "queue": 0, "changes": {}}
+    monkeypatch.setattr(proxy_fleet, "collect_proxy", lambda *args: dict(sample))
+    fleet = {"history_dir": str(tmp_path / "history"), "output_dir": str(tmp_path / "deltas"), "max_workers": 1}
+    return proxy_fleet.tune_proxy({"name": "proxy01", "host": "10.0.0.11"}, CFG, fleet)
+
+
+def test_delta_is_kept_until_the_proxy_applies_it(monkeypatch, tmp_path):
+    delta_path = tmp_path / "deltas" / "proxy01.json"
+    for i in range(3):
+        pending, applied = run(monkeypatch, tmp_path, 95, 10, 1000 + i * 60)
+    assert pending["StartPollers"]["to"] == 20 and applied == {}
+
+    # Load drops but the change was never applied: the delta must survive
+    pending, applied = run(monkeypatch, tmp_path, 60, 10, 1300)
+    assert json.loads(delta_path.read_text())["changes"]["StartPollers"]["to"] == 20
+
+    # The proxy now runs 20 pollers: the change is recorded as applied and the delta removed
+    pending, applied = run(monkeypatch, tmp_path, 60, 20, 1400)
+    assert (pending, applied) == ({}, {"StartPollers": 20})
+    assert not delta_path.exists()
+
+
+def test_cooldown_starts_when_the_change_is_applied(monkeypatch, tmp_path):
+    for i in range(3):
+        run(monkeypatch, tmp_path, 95, 10, 1000 + i * 60)
+    # Applied two hours after it was proposed; a busy proxy right after that must wait out the cooldown
+    run(monkeypatch, tmp_path, 95, 20, 8200)
+    pending, _ = run(monkeypatch, tmp_path, 95, 20, 8260)
+    assert pending == {}
+    pending, _ = run(monkeypatch, tmp_path, 95, 20, 8200 + 31 * 60)
+    assert pending["StartPollers"]["from"] == 20
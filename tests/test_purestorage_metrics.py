@@ -0,0 +1,36 @@
+from managers.purestorage_metrics import TelemetryStore
+
+
+def test_append_keeps_only_newer_samples(tmp_path):
+    store = TelemetryStore(str(tmp_path / "fa01.tsdb"))
+    assert store.append("vol1", "reads_per_sec", 100, 10)
+    assert not store.append("vol1", "reads_per_sec", 100, 20)
+    assert not store.append("vol1", "reads_per_sec", 50, 20)
+    assert not store.append("vol1", "reads_per_sec", 200, None)
+    assert store.rollup("vol1", "reads_per_sec")["samples"] == 1
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "fa01.tsdb")
+    store = TelemetryStore(path)
+    for i in range(5):
+        store.append("array", "usec_per_write_op", 100 + i, 1000 + i)
+        store.append("vol1", "reads_per_sec", 100 + i, i)
+    store.save()
+
+    loaded = TelemetryStore(path)
+    assert loaded.entities() == ["array", "vol1"]
+    assert loaded.rollup("array", "usec_per_write_op") == store.rollup("array", "usec_per_write_op")
+
+
+def test_rollup_and_prune(tmp_path):
+    store = TelemetryStore(str(tmp_path / "fa01.tsdb"))
+    for i in range(1, 101):
+        store.append("vol1", "usec_per_read_op", i, i)
+    rollup = store.rollup("vol1", "usec_per_read_op")
+    assert (rollup["min"], rollup["max"], rollup["p95"], rollup["avg"]) == (1, 100, 95, 50.5)
+    assert store.rollup("vol1", "usec_per_read_op", since=91)["samples"] == 10
+
+    store.prune(51)
+    assert store.rollup("vol1", "usec_per_read_op")["min"] == 51
+    assert store.rollup("vol1", "missing") is None
@@ -0,0 +1,42 @@
+from managers.reconcile import reconcile
+
+
+def vm(name, ip):
+    return {"name": name, "ip_address": ip, "source": "vc01"}
+
+
+def dns(name, value):
+    return {"name": name, "type": "A", "value": value, "source": "example.com"}
+
+
+def ipam(ip, hostname):
+    return {"ip": ip, "hostname": hostname, "subnet": "10.0.0.0/24"}
+
+
+def issues(findings):
+    return sorted((f["issue"], f["ip"], f["name"]) for f in findings)
+
+
+def test_consistent_sources_report_nothing():
+    assert reconcile([vm("web1", "10.0.0.1")], [dns("web1", "10.0.0.1")], [ipam("10.0.0.1", "web1.example.com")]) == []
+
+
+def test_drift_is_reported_per_issue():
+    findings = reconcile(
+        [vm("web1", "10.0.0.1"), vm("web2", "10.0.0.1"), vm("db1", "10.0.0.3")],
+        [dns("web1", "10.0.0.1"), dns("web2", "10.0.0.1"), dns("db1", "10.0.0.9"), dns("old", "10.0.0.8")],
+        [ipam("10.0.0.1", "web1"), ipam("10.0.0.7", "gone")]
+    )
+    assert issues(findings) == [
+        ("dns_mismatch", "10.0.0.9", "db1"),
+        ("dns_orphan", "10.0.0.8", "old"),
+        ("duplicate_ip", "10.0.0.1", "web1, web2"),
+        ("ip_not_in_ipam", "10.0.0.3", "db1"),
+        ("ipam_hostname_mismatch", "10.0.0.1", "web2"),
+        ("ipam_orphan", "10.0.0.7", "gone")
+    ]
+
+
+def test_allocation_of_vm_without_reported_address_is_not_orphaned():
+    findings = reconcile([vm("web1", None)], [dns("web1", "10.0.0.1")], [ipam("10.0.0.1", "WEB1.example.com")])
+    assert findings == []
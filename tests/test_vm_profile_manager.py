@@ -0,0 +1,47 @@
+import yaml
+
+from managers.vm_profile_manager import ProfileRegistry, expand_profile, merge_profile, validate_profile
+
+BASE = {
+    "hostname_pattern": "app-{index:02d}",
+    "cpu": 2,
+    "memory": 4096,
+    "networks": [{"name": "net1", "vlan": "vlan101"}],
+    "disks": [{"name": "disk1", "size_gb": 50}]
+}
+
+
+def test_merge_profile_merges_mappings_and_replaces_lists():
+    base = {"cpu": 2, "tags": {"env": "prod", "team": "ops"}, "disks": [{"name": "a"}]}
+    merged = merge_profile(base, {"tags": {"env": "test"}, "disks": [{"name": "b"}]})
+    assert merged == {"cpu": 2, "tags": {"env": "test", "team": "ops"}, "disks": [{"name": "b"}]}
+    assert base["tags"]["env"] == "prod"
+
+
+def test_expand_profile_fans_out_matrix_and_count():
+    profile = dict(BASE, hostname_pattern="app-{site}-{size}-{index}", count=2, matrix={
+        "site": ["ist", "ank"],
+        "size": {"small": {"cpu": 1}, "large": {"cpu": 8}}
+    })
+    specs = list(expand_profile(profile))
+    assert len(specs) == 8
+    assert specs[0]["hostname"] == "app-ist-small-1"
+    assert specs[-1]["hostname"] == "app-ank-large-2"
+    assert {spec["cpu"] for spec in specs if spec["matrix"]["size"] == "large"} == {8}
+    assert all("count" not in spec for spec in specs)
+
+
+def test_networks_need_vlan_or_network_id():
+    assert validate_profile(dict(BASE, networks=[{"name": "net1", "network_id": "abc"}])) == []
+    assert validate_profile(dict(BASE, networks=[{"name": "net1"}])) == ["networks[0] needs one of vlan, network_id"]
+    assert validate_profile(dict(BASE, networks=[{"name": "net1", "vlan": 101}])) == ["networks[0].vlan must be str"]
+
+
+def test_registry_returns_a_copy_of_the_cached_profile(tmp_path):
+    (tmp_path / "_base.yaml").write_text(yaml.safe_dump({k: v for k, v in BASE.items() if k != "hostname_pattern"}))
+    (tmp_path / "app.yaml").write_text(yaml.safe_dump({"extends": "_base", "hostname_pattern": "app-{index}"}))
+    registry = ProfileRegistry(str(tmp_path), None)
+
+    profile = registry.get("app")
+    profile["networks"][0]["ip_address"] = "10.0.0.5"
+    assert registry.get("app")["networks"][0] == {"name": "net1", "vlan": "vlan101"}
@@ -0,0 +1,24 @@
+from managers.vmware_datastores import correlate, naa_to_serial
+
+SERIAL = "ABCDEF0123456789ABCDEF01"
+
+
+def test_naa_to_serial():
+    assert naa_to_serial(f"naa.624a9370{SERIAL.lower()}") == SERIAL
+    assert naa_to_serial(f"NAA.624A9370{SERIAL}") == SERIAL
+    # Other vendors and truncated names are not FlashArray volumes
+    assert naa_to_serial(f"naa.600a0980{SERIAL.lower()}") is None
+    assert naa_to_serial("naa.624a9370abc") is None
+    assert naa_to_serial(None) is None
+
+
+def test_correlate_keeps_one_entry_per_extent():
+    other = "0123456789ABCDEF01234567"
+    extents = {
+        "ds01": [f"naa.624a9370{SERIAL.lower()}", f"naa.624a9370{other.lower()}"],
+        "ds02": ["naa.600a098000000000000000000000000000"]
+    }
+    volumes = {SERIAL: ("fa01", "vol1"), other: ("fa02", "vol2")}
+    mapping = correlate(extents, volumes)
+    assert list(mapping) == ["ds01"]
+    assert [(e["array"], e["volume"]) for e in mapping["ds01"]] == [("fa01", "vol1"), ("fa02", "vol2")]
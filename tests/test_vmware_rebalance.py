@@ -0,0 +1,38 @@
+from managers.vmware_rebalance import HostLoad, VMLoad, cluster_imbalance, plan_moves
+
+
+def test_plan_moves_balances_each_cluster_separately():
+    hosts = [
+        HostLoad("a1", "A", 100, 100, 80, 10),
+        HostLoad("a2", "A", 100, 100, 20, 10),
+        HostLoad("b1", "B", 100, 100, 70, 10),
+        HostLoad("b2", "B", 100, 100, 30, 10),
+        # Busiest host, but alone in its cluster: it must not stop the others from being balanced
+        HostLoad("s1", "S", 100, 100, 95, 10)
+    ]
+    vms = [
+        VMLoad("v1", "a1", 30, 1), VMLoad("v2", "a1", 50, 1),
+        VMLoad("v3", "b1", 20, 1), VMLoad("v4", "b1", 50, 1),
+        VMLoad("v5", "s1", 95, 1)
+    ]
+    moves = plan_moves(hosts, vms, threshold=0.1)
+
+    assert {(vm.name, source, target) for vm, source, target in moves} == {("v1", "a1", "a2"), ("v3", "b1", "b2")}
+    assert cluster_imbalance(hosts) <= 0.1
+
+
+def test_plan_moves_shares_max_moves_between_clusters():
+    hosts = [
+        HostLoad("a1", "A", 100, 100, 80, 10), HostLoad("a2", "A", 100, 100, 20, 10),
+        HostLoad("b1", "B", 100, 100, 70, 10), HostLoad("b2", "B", 100, 100, 30, 10)
+    ]
+    vms = [VMLoad("v1", "a1", 30, 1), VMLoad("v3", "b1", 20, 1)]
+    moves = plan_moves(hosts, vms, threshold=0.1, max_moves=1)
+    # The most imbalanced cluster goes first
+    assert [(vm.name, source) for vm, source, _ in moves] == [("v1", "a1")]
+
+
+def test_plan_moves_respects_headroom():
+    hosts = [HostLoad("a1", "A", 100, 100, 90, 10), HostLoad("a2", "A", 100, 100, 60, 10)]
+    vms = [VMLoad("v1", "a1", 40, 1)]
+    assert plan_moves(hosts, vms, threshold=0.1, headroom=0.9) == []
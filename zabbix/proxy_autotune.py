@@ -1,33 +1,144 @@
 #!/usr/bin/env python3
 
+import argparse
 import json
+import math
+import os
+import socket
+import statistics
+import struct
 import subprocess
 import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+ZABBIX_HEADER = b"ZBXD\x01"
+
+DEFAULT_CONFIG = "/etc/zabbix/proxy_autotune_config.json"
+
+CONTROLLER_DEFAULTS = {
+    "history_file": "/var/lib/zabbix/proxy_autotune_history.jsonl",
+    "history_max_samples": 10000,
+    "model_window": 24,
+    "decision_samples": 3,
+    "target_busy": 60,
+    "scale_down_threshold": 30,
+    "max_steps_per_change": 3,
+    "cooldown_up_minutes": 30,
+    "cooldown_down_minutes": 240
+}
+
+APPLY_DEFAULTS = {
+    "state_file": "/var/lib/zabbix/proxy_autotune_state.json",
+    "batch_window_minutes": 15,
+    "min_restart_interval_minutes": 60,
+    "restart_wait_seconds": 120,
+    "runtime_command": "zabbix_proxy -c {config_path} -R {option}",
+    "runtime_parameters": {}
+}
+
 def log(msg, log_file):
     with open(log_file, "a") as f:
         f.write(f"[{datetime.datetime.now()}] {msg}\n")
 
-def get_busy(proc, host):
+def zabbix_get(host, key, port=10050, timeout=3):
+    # Native Zabbix agent protocol: "ZBXD\x01" + 8-byte little-endian length + payload
+    payload = key.encode()
+    request = ZABBIX_HEADER + struct.pack("<Q", len(payload)) + payload
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(request)
+        chunks = []
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    response = b"".join(chunks)
+    if not response.startswith(ZABBIX_HEADER):
+        raise ValueError(f"Invalid response from {host}:{port} for {key}")
+    length = struct.unpack("<Q", response[5:13])[0]
+    value = response[13:13 + length].decode()
+    if value.startswith("ZBX_NOTSUPPORTED"):
+        raise ValueError(value.replace("\0", ": "))
+    return value
+
+def get_busy(proc, host, port=10050, timeout=3):
     try:
-        cmd = f"zabbix_get -s {host} -k 'zabbix[process,{proc},avg,busy]'"
-        return float(subprocess.check_output(cmd, shell=True).decode().strip())
+        return float(zabbix_get(host, f"zabbix[process,{proc},avg,busy]", port, timeout))
     except Exception as e:
-        return 0.0
+        return None
 
-def get_current_memory_mb():
+def collect_busy(process_types, host, port=10050, timeout=3, samples=1, interval=0):
+    # All process types are polled concurrently; the median of the samples smooths out spikes
+    readings = {proc: [] for proc in process_types}
+    with ThreadPoolExecutor(max_workers=max(1, len(process_types))) as executor:
+        for i in range(samples):
+            if i:
+                time.sleep(interval)
+            futures = {proc: executor.submit(get_busy, proc, host, port, timeout) for proc in process_types}
+            for proc, future in futures.items():
+                value = future.result()
+                if value is not None:
+                    readings[proc].append(value)
+    # A process type that never answered has no reading; 0.0 would look like an idle process
+    return {proc: statistics.median(values) if values else None for proc, values in readings.items()}
+
+def read_meminfo():
+    # Values in kB, keyed by the exact field name (so "Cached" never matches "SwapCached")
+    info = {}
     with open('/proc/meminfo') as f:
-        lines = f.readlines()
-    mem_free = sum(int(line.split()[1]) for line in lines if 'MemFree' in line or 'Buffers' in line or 'Cached' in line)
-    return mem_free // 1024
+        for line in f:
+            key, value = line.split(":", 1)
+            info[key] = int(value.split()[0])
+    return info
+
+def get_current_memory_mb():
+    return read_meminfo()["MemAvailable"] // 1024
 
 def get_used_memory_mb():
-    with open('/proc/meminfo') as f:
-        lines = f.readlines()
-    total = int(next(l for l in lines if l.startswith("MemTotal")).split()[1])
-    free = sum(int(line.split()[1]) for line in lines if 'MemFree' in line or 'Buffers' in line or 'Cached' in line)
-    return (total - free) // 1024
+    info = read_meminfo()
+    return (info["MemTotal"] - info["MemAvailable"]) // 1024
+
+def find_proxy_pids(process_name="zabbix_proxy"):
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/comm") as f:
+                if f.read().strip() == process_name:
+                    pids.append(int(entry))
+        except OSError:
+            continue
+    return pids
+
+def get_proxy_memory_mb(pids):
+    # Pss splits the shared cache segments between the processes mapping them, so the sum is the real footprint
+    pss = private = processes = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/smaps_rollup") as f:
+                fields = {}
+                for line in f:
+                    parts = line.split()
+                    if len(parts) >= 2 and parts[0].endswith(":"):
+                        fields[parts[0][:-1]] = int(parts[1])
+        except OSError:
+            continue
+        pss += fields.get("Pss", 0)
+        private += fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+        processes += 1
+    return {"pss_mb": pss // 1024, "private_mb": private // 1024, "processes": processes}
+
+def collect_items(keys, host, port=10050, timeout=3):
+    def fetch(key):
+        try:
+            return float(zabbix_get(host, key, port, timeout))
+        except Exception:
+            return None
+    with ThreadPoolExecutor(max_workers=max(1, len(keys))) as executor:
+        return dict(zip(keys, executor.map(fetch, keys)))
 
 def parse_config(path):
     data = {}
@@ -60,71 +171,345 @@ def update_config(config_file, param, new_value):
             f.writelines(lines)
     return updated
 
-def update_memory_parameters(config_path, memory_params, current_config, log_file, total_ram_mb):
-    updated = False
-    used = get_used_memory_mb()
-    used_percent = (used / total_ram_mb) * 100
+def get_queue(host, port=10050, timeout=3):
+    try:
+        return int(zabbix_get(host, "zabbix[queue]", port, timeout))
+    except Exception as e:
+        return None
 
-    if used_percent > 85:
-        log(f"Skipping memory param updates. Used RAM is {used_percent:.1f}% (>85%)", log_file)
-        return False
+def load_history(path):
+    try:
+        with open(path, "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
 
-    for key, val in memory_params.items():
-        current_val = current_config.get(key, 0)
-        new_val = current_val + val["step"]
-        if new_val <= val["max"]:
-            update_config(config_path, key, new_val)
-            log(f"{key} increased from {current_val}M to {new_val}M due to RAM availability ({100-used_percent:.1f}% free)", log_file)
-            updated = True
-        else:
-            log(f"{key} not updated: would exceed max of {val['max']}M", log_file)
+def save_history(path, history, max_samples):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        for sample in history[-max_samples:]:
+            f.write(json.dumps(sample) + "\n")
+    Path(tmp_path).replace(path)
+
+def fit_busy_model(history, process_type, config_key, window):
+    # busy% ~= a / processes + b: "a" is the work in process-percent, "b" a fixed overhead.
+    # With a single process count in the window the overhead can't be separated and b is 0.
+    points = [
+        (1.0 / s["counts"][config_key], s["busy"][process_type])
+        for s in history[-window:]
+        if s["counts"].get(config_key) and s["busy"].get(process_type) is not None
+    ]
+    if not points:
+        return None
+    xs = [x for x, _ in points]
+    ys = [y for _, y in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x > 0:
+        a = sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x
+        b = mean_y - a * mean_x
+        if a > 0 and b >= 0:
+            return a, b
+    return mean_y / mean_x, 0.0
 
+def model_target(model, target_busy, max_value):
+    a, b = model
+    if target_busy <= b:
+        return max_value
+    return max(1, math.ceil(a / (target_busy - b)))
+
+def last_change_time(history, config_key):
+    for sample in reversed(history):
+        if config_key in sample.get("changes", {}):
+            return sample["time"]
+    return None
+
+def propose_count(history, process_type, details, current, controller, threshold, now):
+    config_key = details["config_key"]
+    step = details["step"]
+    min_value = details.get("min", step)
+    max_value = details["max"]
+    recent = [s["busy"].get(process_type) for s in history[-controller["decision_samples"]:]]
+    model = fit_busy_model(history, process_type, config_key, controller["model_window"])
+    # Missed polls (proxy or agent unreachable, item unsupported) hold the count until readings are back
+    if not recent or None in recent or not model or not current:
+        return current, None
+
+    busy = statistics.median(recent)
+    target = model_target(model, controller["target_busy"], max_value)
+    changed_at = last_change_time(history, config_key)
+    since_change = (now - changed_at) / 60 if changed_at is not None else float("inf")
+
+    # Hysteresis: scale up above threshold, down only below scale_down_threshold,
+    # and both land near target_busy so one change does not trigger the opposite one
+    if busy > threshold and since_change >= controller["cooldown_up_minutes"]:
+        proposed = max(current + step, target)
+        proposed = min(proposed, current + step * controller["max_steps_per_change"], max_value)
+        if proposed > current:
+            return proposed, f"busy={busy:.1f}% > {threshold}%"
+    elif busy < controller["scale_down_threshold"] and since_change >= controller["cooldown_down_minutes"]:
+        proposed = max(target, current - step, min_value)
+        if proposed < current:
+            return proposed, f"busy={busy:.1f}% < {controller['scale_down_threshold']}%"
+    return current, None
+
+def backtest(cfg, history):
+    # Replays recorded samples, predicting busy% for the simulated process counts from the recorded load
+    controller = dict(CONTROLLER_DEFAULTS, **cfg.get("controller", {}))
+    threshold = cfg["threshold"]
+    parameters = cfg["parameters"]
+    if not history:
+        print("No history to backtest")
+        return
+
+    counts = dict(history[0]["counts"])
+    simulated = []
+    changes = {"up": 0, "down": 0}
+    recorded_hot = simulated_hot = 0
+    recorded_total = simulated_total = 0
+
+    for sample in history:
+        sim_sample = {"time": sample["time"], "busy": {}, "counts": dict(counts), "changes": {}}
+        for process_type, details in parameters.items():
+            config_key = details["config_key"]
+            recorded_busy = sample["busy"].get(process_type)
+            recorded_count = sample["counts"].get(config_key)
+            if recorded_busy is None or not recorded_count or not counts.get(config_key):
+                continue
+            sim_busy = min(100.0, recorded_busy * recorded_count / counts[config_key])
+            sim_sample["busy"][process_type] = sim_busy
+            recorded_hot += recorded_busy > threshold
+            simulated_hot += sim_busy > threshold
+            recorded_total += recorded_count
+            simulated_total += counts[config_key]
+        simulated.append(sim_sample)
+
+        for process_type, details in parameters.items():
+            config_key = details["config_key"]
+            current = counts.get(config_key, 0)
+            proposed, _ = propose_count(simulated, process_type, details, current, controller, threshold, sample["time"])
+            if proposed != current:
+                changes["up" if proposed > current else "down"] += 1
+                counts[config_key] = proposed
+                sim_sample["changes"][config_key] = proposed
+
+    print(f"Samples replayed: {len(history)}")
+    print(f"Changes proposed: {changes['up']} up, {changes['down']} down")
+    print(f"Samples above {threshold}% busy: recorded {recorded_hot}, simulated {simulated_hot}")
+    print(f"Total process-samples: recorded {recorded_total}, simulated {simulated_total}")
+    print(f"Final counts: {json.dumps(counts)}")
+
+def propose_cache_size(details, current, pused):
+    step = details["step"]
+    min_value = details.get("min", step)
+    target = details.get("target_pused", 70)
+    # Size so the observed usage would sit at target_pused, rounded up to whole steps
+    needed = math.ceil(current * pused / target / step) * step if current else step
+    if pused > details.get("high_pused", 80):
+        return min(max(needed, current + step), details["max"])
+    if pused < details.get("low_pused", 30):
+        return max(needed, current - step, min_value)
+    return current
+
+def update_memory_parameters(config_path, memory_params, current_config, log_file, utilisation, headroom_mb, dry_run=False):
+    updated = {}
+    for key, details in memory_params.items():
+        pused = utilisation.get(details["utilisation_key"])
+        if pused is None:
+            log(f"{key} not updated: {details['utilisation_key']} not available from the proxy", log_file)
+            continue
+        current_val = current_config.get(key, 0)
+        new_val = propose_cache_size(details, current_val, pused)
+        if new_val == current_val:
+            continue
+        delta = new_val - current_val
+        if delta > headroom_mb:
+            log(f"{key} not increased to {new_val}M: only {headroom_mb:.0f}M of memory headroom", log_file)
+            continue
+        if dry_run:
+            log(f"[dry-run] {key} would change from {current_val}M to {new_val}M ({pused:.1f}% used)", log_file)
+            continue
+        if update_config(config_path, key, new_val):
+            direction = "increased" if delta > 0 else "decreased"
+            log(f"{key} {direction} from {current_val}M to {new_val}M ({pused:.1f}% used)", log_file)
+            updated[key] = new_val
+            headroom_mb -= delta
     return updated
 
+def load_state(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(path, state):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=2)
+    Path(tmp_path).replace(path)
+
+def wait_for_proxy(host, port, timeout, wait_seconds):
+    # The proxy is back once it answers an internal item again
+    deadline = time.time() + wait_seconds
+    while time.time() < deadline:
+        try:
+            zabbix_get(host, "zabbix[uptime]", port, timeout)
+            return True
+        except Exception:
+            time.sleep(1)
+    return False
+
+def apply_pending(state, apply_cfg, config_path, restart_command, host, port, timeout, log_file, now):
+    pending = state.get("pending", {})
+    runtime_parameters = apply_cfg["runtime_parameters"]
+    restart_keys = [key for key in pending if key not in runtime_parameters]
+
+    for key in pending:
+        if key in runtime_parameters:
+            for option in runtime_parameters[key]:
+                command = apply_cfg["runtime_command"].format(config_path=config_path, option=option)
+                subprocess.run(command.split())
+            log(f"{key}={pending[key]} applied at runtime", log_file)
+
+    if restart_keys:
+        start = time.time()
+        subprocess.run(restart_command.split())
+        back = wait_for_proxy(host, port, timeout, apply_cfg["restart_wait_seconds"])
+        downtime = time.time() - start
+        state["restart_count"] = state.get("restart_count", 0) + 1
+        state["downtime_seconds_total"] = state.get("downtime_seconds_total", 0) + downtime
+        state["last_restart"] = now
+        status = f"{downtime:.1f}s downtime" if back else f"not answering after {downtime:.1f}s"
+        log(f"Zabbix Proxy restarted for {', '.join(restart_keys)} ({status}, restart #{state['restart_count']}, "
+            f"{state['downtime_seconds_total']:.1f}s total downtime)", log_file)
+
+    state["running_values"] = parse_config(config_path)
+    state["pending"] = {}
+    state.pop("pending_since", None)
+
+def should_apply(state, apply_cfg, now):
+    if not state.get("pending"):
+        return False
+    # Wait for the batch window so changes proposed close together share one restart
+    if now - state.get("pending_since", now) < apply_cfg["batch_window_minutes"] * 60:
+        return False
+    if any(key not in apply_cfg["runtime_parameters"] for key in state["pending"]):
+        return now - state.get("last_restart", 0) >= apply_cfg["min_restart_interval_minutes"] * 60
+    return True
+
 def main():
-    with open("/etc/zabbix/proxy_autotune_config.json") as f:
+    parser = argparse.ArgumentParser(description="Zabbix proxy process autotuner")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Autotuner configuration file")
+    parser.add_argument("--backtest", action="store_true", help="Replay recorded history through the controller instead of tuning")
+    parser.add_argument("--history", help="History file, overrides controller.history_file")
+    parser.add_argument("--dry-run", action="store_true", help="Record a sample and log proposals without changing the proxy config")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
         cfg = json.load(f)
 
+    controller = dict(CONTROLLER_DEFAULTS, **cfg.get("controller", {}))
+    history_file = args.history or controller["history_file"]
+    if args.backtest:
+        backtest(cfg, load_history(history_file))
+        return
+
     config_path = cfg["config_path"]
     threshold = cfg["threshold"]
     zabbix_host = cfg["zabbix_get_host"]
+    zabbix_port = cfg.get("zabbix_get_port", 10050)
+    poll_timeout = cfg.get("poll_timeout", 3)
+    samples = cfg.get("busy_samples", 3)
+    sample_interval = cfg.get("busy_sample_interval", 10)
     log_file = cfg["log_file"]
     restart_command = cfg["restart_command"]
     max_total_memory = cfg["max_total_memory_mb"]
+    memory_reserve = cfg.get("memory_reserve_mb", 1024)
     parameters = cfg["parameters"]
     memory_params = cfg.get("memory_parameters", {})
 
+    apply_cfg = dict(APPLY_DEFAULTS, **cfg.get("apply", {}))
+    state = load_state(apply_cfg["state_file"])
+
+    # Controller decisions use the values the running proxy was started with,
+    # while proposals build on the config file, which also holds pending changes
     current_values = parse_config(config_path)
-    mem_free = get_current_memory_mb()
-    total_allocated = sum(current_values.get(p["config_key"], 0) for p in parameters.values())
+    running_values = state.setdefault("running_values", current_values)
+    pending = state.setdefault("pending", {})
+    # New processes and larger caches must fit both in MemAvailable (minus a reserve)
+    # and in the max_total_memory_mb budget for the proxy itself
+    available = get_current_memory_mb()
+    proxy_memory = get_proxy_memory_mb(find_proxy_pids())
+    headroom = min(available - memory_reserve, max_total_memory - proxy_memory["pss_mb"])
+    process_memory = proxy_memory["private_mb"] / proxy_memory["processes"] if proxy_memory["processes"] else cfg.get("process_memory_mb", 8)
+    utilisation = collect_items([p["utilisation_key"] for p in memory_params.values()], zabbix_host, zabbix_port, poll_timeout)
 
-    changed = False
+    busy = collect_busy(list(parameters), zabbix_host, zabbix_port, poll_timeout, samples, sample_interval)
+    missing = [proc for proc, value in busy.items() if value is None]
+    if missing:
+        log(f"No busy readings for {', '.join(missing)} from {zabbix_host}:{zabbix_port}; their process counts are left unchanged.", log_file)
+    now = int(time.time())
+    sample = {
+        "time": now,
+        "busy": busy,
+        "counts": {p["config_key"]: running_values.get(p["config_key"], 0) for p in parameters.values()},
+        "queue": get_queue(zabbix_host, zabbix_port, poll_timeout),
+        "used_memory_mb": get_used_memory_mb(),
+        "available_memory_mb": available,
+        "proxy_memory_mb": proxy_memory["pss_mb"],
+        "cache_pused": utilisation,
+        "changes": {}
+    }
+    history = load_history(history_file)
+    history.append(sample)
 
+    changes = {}
     for process_type, details in parameters.items():
-        current_busy = get_busy(process_type, zabbix_host)
         config_key = details["config_key"]
-        step = details["step"]
-        max_value = details["max"]
-
-        if current_busy > threshold:
-            current = current_values.get(config_key, 0)
-            if current + step <= max_value:
-                if total_allocated + step <= max_total_memory:
-                    updated = update_config(config_path, config_key, current + step)
-                    if updated:
-                        log(f"{config_key} increased from {current} to {current + step} due to {process_type} busy={current_busy:.1f}%", log_file)
-                        changed = True
-                        total_allocated += step
-                else:
-                    log(f"Skipped tuning {config_key}: memory limit exceeded.", log_file)
-            else:
-                log(f"Skipped tuning {config_key}: max value reached.", log_file)
+        if config_key in pending:
+            continue
+        current = current_values.get(config_key, 0)
+        proposed, reason = propose_count(history, process_type, details, current, controller, threshold, now)
+        if proposed == current:
+            continue
 
-    changed |= update_memory_parameters(config_path, memory_params, current_values, log_file, max_total_memory)
+        delta = proposed - current
+        if delta > 0 and delta * process_memory > headroom:
+            log(f"Skipped tuning {config_key}: {delta} processes need ~{delta * process_memory:.0f}M, only {headroom:.0f}M of headroom.", log_file)
+            continue
+        if args.dry_run:
+            log(f"[dry-run] {config_key} would change from {current} to {proposed} due to {process_type} {reason}", log_file)
+            continue
+        if update_config(config_path, config_key, proposed):
+            direction = "increased" if delta > 0 else "decreased"
+            log(f"{config_key} {direction} from {current} to {proposed} due to {process_type} {reason}", log_file)
+            changes[config_key] = proposed
+            headroom -= max(0, delta * process_memory)
 
-    if changed:
-        subprocess.run(restart_command.split())
-        log("Zabbix Proxy restarted due to config update.", log_file)
+    # Caches with a change waiting to be applied, or changed within the cooldown, keep their size
+    cooldown = controller["cooldown_up_minutes"] * 60
+    tunable_memory_params = {
+        k: v for k, v in memory_params.items()
+        if k not in pending and now - (last_change_time(history, k) or 0) >= cooldown
+    }
+    changes.update(update_memory_parameters(config_path, tunable_memory_params, current_values, log_file, utilisation, headroom, args.dry_run))
+    sample["changes"] = changes
+    save_history(history_file, history, controller["history_max_samples"])
+
+    if args.dry_run:
+        return
+    if changes:
+        pending.update(changes)
+        state.setdefault("pending_since", now)
+    if should_apply(state, apply_cfg, now):
+        apply_pending(state, apply_cfg, config_path, restart_command, zabbix_host, zabbix_port, poll_timeout, log_file, now)
+    elif pending:
+        log(f"Pending until next apply window: {json.dumps(pending)}", log_file)
+    save_state(apply_cfg["state_file"], state)
 
 if __name__ == "__main__":
     main()
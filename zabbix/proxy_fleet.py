@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# Fleet mode for proxy_autotune: polls every proxy in an inventory concurrently, runs the
+# same controller centrally and writes one config delta file per proxy that needs changes.
+# A change stays in the delta until the proxy reports the new value, and cooldowns run from then.
+#
+# Inventory format:
+# {"proxies": [{"name": "proxy01", "host": "10.0.0.11", "port": 10050}, ...]}
+# Per-proxy "parameters" / "memory_parameters" entries override the fleet-wide ones.
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from proxy_autotune import (
+    CONTROLLER_DEFAULTS,
+    DEFAULT_CONFIG,
+    collect_busy,
+    collect_items,
+    last_change_time,
+    load_history,
+    load_state,
+    propose_cache_size,
+    propose_count,
+    save_history,
+    save_state,
+)
+
+FLEET_DEFAULTS = {
+    "history_dir": "/var/lib/zabbix/proxy_fleet/history",
+    "output_dir": "/var/lib/zabbix/proxy_fleet/deltas",
+    "max_workers": 32
+}
+
+def total_key(utilisation_key):
+    # zabbix[rcache,buffer,pused] -> zabbix[rcache,buffer,total] (bytes)
+    return utilisation_key.replace(",pused]", ",total]")
+
+def collect_proxy(proxy, parameters, memory_params, cfg):
+    host = proxy["host"]
+    port = proxy.get("port", 10050)
+    timeout = cfg.get("poll_timeout", 3)
+    # Process counts and cache sizes come from the proxy itself, so no local config file is needed
+    count_keys = {p["config_key"]: f"zabbix[process,{proc},count]" for proc, p in parameters.items()}
+    cache_keys = {k: [p["utilisation_key"], total_key(p["utilisation_key"])] for k, p in memory_params.items()}
+    keys = list(count_keys.values()) + [key for pair in cache_keys.values() for key in pair] + ["zabbix[queue]"]
+
+    busy = collect_busy(list(parameters), host, port, timeout, cfg.get("busy_samples", 3), cfg.get("busy_sample_interval", 10))
+    items = collect_items(keys, host, port, timeout)
+    if all(value is None for value in items.values()) and all(value is None for value in busy.values()):
+        raise ConnectionError(f"{host}:{port} is not answering agent requests")
+    counts = {config_key: int(items[key]) for config_key, key in count_keys.items() if items[key] is not None}
+    cache_sizes = {k: int(items[total] // (1024 * 1024)) for k, (_, total) in cache_keys.items() if items[total] is not None}
+    return {
+        "time": int(time.time()),
+        "busy": busy,
+        "counts": counts,
+        "cache_sizes": cache_sizes,
+        "cache_pused": {p["utilisation_key"]: items[p["utilisation_key"]] for p in memory_params.values()},
+        "queue": items["zabbix[queue]"],
+        "changes": {}
+    }
+
+def recommend(history, sample, parameters, memory_params, controller, threshold):
+    now = sample["time"]
+    changes = {}
+    for process_type, details in parameters.items():
+        config_key = details["config_key"]
+        current = sample["counts"].get(config_key)
+        if current is None:
+            continue
+        proposed, reason = propose_count(history, process_type, details, current, controller, threshold, now)
+        if proposed != current:
+            changes[config_key] = {"from": current, "to": proposed, "reason": f"{process_type} {reason}"}
+
+    cooldown = controller["cooldown_up_minutes"] * 60
+    for key, details in memory_params.items():
+        current = sample["cache_sizes"].get(key)
+        pused = sample["cache_pused"].get(details["utilisation_key"])
+        if current is None or pused is None or now - (last_change_time(history, key) or 0) < cooldown:
+            continue
+        proposed = propose_cache_size(details, current, pused)
+        if proposed != current:
+            changes[key] = {"from": f"{current}M", "to": f"{proposed}M", "reason": f"{pused:.1f}% used"}
+    return changes
+
+def tune_proxy(proxy, cfg, fleet):
+    controller = dict(CONTROLLER_DEFAULTS, **cfg.get("controller", {}))
+    parameters = proxy.get("parameters", cfg["parameters"])
+    memory_params = proxy.get("memory_parameters", cfg.get("memory_parameters", {}))
+    history_file = os.path.join(fleet["history_dir"], f"{proxy['name']}.jsonl")
+
+    sample = collect_proxy(proxy, parameters, memory_params, cfg)
+    delta_path = os.path.join(fleet["output_dir"], f"{proxy['name']}.json")
+    pending = load_state(delta_path).get("changes", {})
+
+    # A proposed change counts as applied once the proxy stops running the value it was proposed
+    # against. Only applied changes go into the history, so cooldowns start when the proxy changed.
+    running = dict(sample["counts"], **{key: f"{size}M" for key, size in sample["cache_sizes"].items()})
+    applied = {}
+    for key, change in list(pending.items()):
+        if key in running and running[key] != change["from"]:
+            applied[key] = running[key]
+            del pending[key]
+    sample["changes"] = applied
+
+    history = load_history(history_file)
+    history.append(sample)
+    changes = recommend(history, sample, parameters, memory_params, controller, cfg["threshold"])
+    save_history(history_file, history, controller["history_max_samples"])
+
+    # Unapplied changes stay in the delta until the proxy runs them or a newer proposal replaces them
+    for change in changes.values():
+        change["proposed"] = sample["time"]
+    pending.update(changes)
+    if pending:
+        delta = {"proxy": proxy["name"], "host": proxy["host"], "generated": sample["time"], "changes": pending}
+        save_state(delta_path, delta)
+    elif os.path.exists(delta_path):
+        os.remove(delta_path)
+    return pending, applied
+
+def main():
+    parser = argparse.ArgumentParser(description="Zabbix proxy fleet autotuner")
+    parser.add_argument("--config", default=DEFAULT_CONFIG, help="Autotuner configuration file")
+    parser.add_argument("--inventory", required=True, help="Proxy inventory JSON file")
+    parser.add_argument("--history-dir", help="Per-proxy history directory, overrides fleet.history_dir")
+    parser.add_argument("--output-dir", help="Config delta directory, overrides fleet.output_dir")
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        cfg = json.load(f)
+    with open(args.inventory) as f:
+        proxies = json.load(f)["proxies"]
+
+    fleet = dict(FLEET_DEFAULTS, **cfg.get("fleet", {}))
+    if args.history_dir:
+        fleet["history_dir"] = args.history_dir
+    if args.output_dir:
+        fleet["output_dir"] = args.output_dir
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, min(fleet["max_workers"], len(proxies)))) as executor:
+        futures = {proxy["name"]: executor.submit(tune_proxy, proxy, cfg, fleet) for proxy in proxies}
+
+    for name, future in futures.items():
+        try:
+            pending, applied = future.result()
+        except Exception as e:
+            print(f"{name}: error: {e}")
+            continue
+        if applied:
+            print(f"{name}: applied {', '.join(f'{key}={value}' for key, value in applied.items())}")
+        if pending:
+            summary = ", ".join(f"{key} {c['from']} -> {c['to']} ({c['reason']})" for key, c in pending.items())
+            print(f"{name}: {summary}")
+        elif not applied:
+            print(f"{name}: no changes")
+    print(f"{len(proxies)} proxies polled in {time.time() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
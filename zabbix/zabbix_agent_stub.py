@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# Minimal Zabbix agent protocol server for testing proxy_autotune / proxy_fleet without a proxy.
+# Usage: python zabbix_agent_stub.py --port 10050 --values values.json
+# values.json maps item keys to values, e.g. {"zabbix[process,poller,avg,busy]": 92.5}.
+# Keys that are missing answer ZBX_NOTSUPPORTED.
+
+import argparse
+import json
+import socketserver
+import struct
+import threading
+
+ZABBIX_HEADER = b"ZBXD\x01"
+
+
+class AgentHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        header = self.request.recv(13)
+        if not header.startswith(ZABBIX_HEADER):
+            return
+        length = struct.unpack("<Q", header[5:13])[0]
+        key = b""
+        while len(key) < length:
+            chunk = self.request.recv(length - len(key))
+            if not chunk:
+                break
+            key += chunk
+        value = self.server.values.get(key.decode())
+        payload = f"ZBX_NOTSUPPORTED\0Unsupported item key." if value is None else str(value)
+        payload = payload.encode()
+        self.request.sendall(ZABBIX_HEADER + struct.pack("<Q", len(payload)) + payload)
+
+
+class AgentStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, values, host="127.0.0.1", port=0):
+        super().__init__((host, port), AgentHandler)
+        self.values = values
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Zabbix agent protocol stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=10050)
+    parser.add_argument("--values", required=True, help="JSON file mapping item keys to values")
+    args = parser.parse_args()
+
+    with open(args.values) as f:
+        values = json.load(f)
+    server = AgentStub(values, args.host, args.port)
+    print(f"Serving {len(values)} items on {args.host}:{server.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()